@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module aggregates the services performance data on fixed time windows.
+
+For each service, only the current window is kept in memory: for each metric the minimum,
+maximum, sum, count and last values. When a check result falls in a later window, the
+current window is closed and one records row is built with:
+- `metric=avg;warn;crit;min;max` for each metric, min and max being the declared bounds
+- `metric_min=minimum`, `metric_max=maximum` and `metric_last=last` for each metric
+
+The output and the last values are the ones of the newest check result of the window, a check
+result received out of order in the current window only updates the minimum, maximum and
+average. A late check result, that belongs to a window older than the current window or to an
+already closed window, is dropped and counted, so it does not skew the current window.
+"""
+
+import datetime
+
+from alignak.misc.perfdata import PerfDatas
+
+
+class PerfdataWindow(object):
+    # pylint: disable=too-few-public-methods
+    """
+    The aggregated performance data of a service for the current time window
+    """
+    __slots__ = ('start', 'count', 'timestamp', 'output', 'metrics')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        # Check time of the newest check result
+        self.timestamp = None
+        self.output = ''
+        # metric name -> [min, max, sum, count, last, uom, warning, critical,
+        #                 declared min, declared max, last check time]
+        self.metrics = {}
+
+    def add(self, timestamp, perf_data, output):
+        """Fold the performance data of a check result in the window
+
+        The output and the last values are only replaced by a check result that is not older
+        than the one they come from"""
+        self.count += 1
+        if self.timestamp is None or timestamp >= self.timestamp:
+            self.timestamp = timestamp
+            self.output = output
+        for metric in PerfDatas(perf_data):
+            value = metric.value
+            if value is None:
+                continue
+            stats = self.metrics.get(metric.name)
+            if stats is None:
+                self.metrics[metric.name] = [value, value, value, 1, value,
+                                             metric.uom, metric.warning, metric.critical,
+                                             metric.min, metric.max, timestamp]
+                continue
+            if value < stats[0]:
+                stats[0] = value
+            if value > stats[1]:
+                stats[1] = value
+            stats[2] += value
+            stats[3] += 1
+            if timestamp >= stats[10]:
+                stats[4:] = [value, metric.uom, metric.warning, metric.critical,
+                             metric.min, metric.max, timestamp]
+
+    def perf_data(self):
+        """Get the aggregated performance data string of the window"""
+        metrics = []
+        for name, stats in sorted(self.metrics.items()):
+            (min_value, max_value, total, count, last, uom, warning, critical,
+             lower, upper, _) = stats
+            uom = uom or ''
+            metrics.append("'%s'=%s%s;%s;%s;%s;%s" % (
+                name, round(float(total) / count, 6), uom,
+                '' if warning is None else warning, '' if critical is None else critical,
+                '' if lower is None else lower, '' if upper is None else upper))
+            metrics.append("'%s_min'=%s%s" % (name, min_value, uom))
+            metrics.append("'%s_max'=%s%s" % (name, max_value, uom))
+            metrics.append("'%s_last'=%s%s" % (name, last, uom))
+        return ' '.join(metrics)
+
+
+class PerfdataAggregator(object):
+    """
+    Aggregate the services performance data on time windows of `window` seconds
+    """
+
+    def __init__(self, window, source='alignak'):
+        self.window = window
+        self.source = source
+        # (host_name, service_description) -> PerfdataWindow
+        self.windows = {}
+        # (host_name, service_description) -> start of the last closed window
+        self.closed = {}
+        # Dropped late check results
+        self.late = 0
+
+    def __len__(self):
+        return len(self.windows)
+
+    def window_start(self, timestamp):
+        """Get the start of the window that the timestamp belongs to"""
+        timestamp = int(timestamp)
+        return timestamp - timestamp % self.window
+
+    def add(self, host_name, service_description, timestamp, perf_data, output):
+        """Add a check result performance data
+
+        Returns the list of the records rows for the windows closed by this check result.
+        A late check result (older than the current window, or than the last closed window)
+        is dropped and counted.
+
+        :return: list of records rows
+        """
+        rows = []
+        key = (host_name, service_description)
+        start = self.window_start(timestamp)
+        window = self.windows.get(key)
+        if (window is not None and start < window.start) or (
+                key in self.closed and start <= self.closed[key]):
+            self.late += 1
+            return rows
+        if window is not None and start > window.start:
+            rows.append(self.build_row(key, window))
+            window = None
+        if window is None:
+            window = self.windows[key] = PerfdataWindow(start)
+        window.add(int(timestamp), perf_data, output)
+        return rows
+
+    def expire(self, now):
+        """Close the windows that ended more than one window ago
+
+        This allows to write the records of the services that are not checked anymore
+
+        :return: list of records rows
+        """
+        limit = int(now) - 2 * self.window
+        expired = [key for key, window in self.windows.items() if window.start <= limit]
+        return [self.build_row(key, self.windows.pop(key)) for key in expired]
+
+    def flush(self):
+        """Close all the pending windows
+
+        :return: list of records rows
+        """
+        rows = [self.build_row(key, window) for key, window in self.windows.items()]
+        self.windows = {}
+        return rows
+
+    def build_row(self, key, window):
+        """Build a records row for a service window"""
+        self.closed[key] = window.start
+        return {
+            'host_name': key[0],
+            'service_description': key[1],
+            'last_check': datetime.datetime.fromtimestamp(window.start).strftime(
+                '%Y-%m-%d %H:%M:%S'),
+            'source': self.source,
+            'output': window.output,
+            'perf_data': window.perf_data()
+        }
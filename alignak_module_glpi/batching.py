@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module cuts the rows batches by size as well as by rows count.
+
+A bulk insertion (executemany) of many rows is sent to the MySQL server as one multi-row
+INSERT statement, that must not be larger than the server max_allowed_packet: the rows with
+long outputs and performance data may make a batch too large, when small rows could be
+grouped in larger batches. The size of a row is estimated with its values encoded with the
+connection character set, and the SQL overhead of the values (quotes, separators).
+
+The batches size is limited to half of the server max_allowed_packet: the escaped characters
+of the values may double their size in the statement.
+"""
+
+from .compression import Compressed
+
+# Estimated SQL statement bytes for each value (quotes and separator) and each row
+VALUE_OVERHEAD = 3
+ROW_OVERHEAD = 3
+
+# Used when the server max_allowed_packet is not known (MySQL 5.7 default)
+DEFAULT_MAX_ALLOWED_PACKET = 4 * 1024 * 1024
+PACKET_RATIO = 0.5
+
+MAX_ALLOWED_PACKET_QUERY = u"SELECT @@max_allowed_packet"
+
+# MySQL character sets -> Python encodings
+ENCODINGS = {
+    'utf8': 'utf-8',
+    'utf8mb3': 'utf-8',
+    'utf8mb4': 'utf-8',
+    'latin1': 'cp1252',
+    'ascii': 'ascii'
+}
+
+
+def python_encoding(character_set):
+    """Get the Python encoding of a MySQL character set"""
+    return ENCODINGS.get(character_set.lower(), character_set)
+
+
+def batch_bytes(max_allowed_packet, max_bytes=0):
+    """Get the maximum size of a batch for the server max_allowed_packet, limited to
+    max_bytes if it is set"""
+    size = int((max_allowed_packet or DEFAULT_MAX_ALLOWED_PACKET) * PACKET_RATIO)
+    if max_bytes:
+        size = min(size, max_bytes)
+    return size
+
+
+def value_size(value, encoding='utf-8'):
+    """Get the estimated size of a value in a SQL statement"""
+    if isinstance(value, bytes):
+        return len(value) + VALUE_OVERHEAD
+    if isinstance(value, str):
+        return len(value.encode(encoding, 'replace')) + VALUE_OVERHEAD
+    if isinstance(value, Compressed):
+        return value.size + VALUE_OVERHEAD
+    if value is None:
+        return 4 + VALUE_OVERHEAD
+    return len(str(value)) + VALUE_OVERHEAD
+
+
+def row_size(values, encoding='utf-8'):
+    """Get the estimated size of a row in a SQL statement"""
+    return sum([value_size(value, encoding) for value in values]) + ROW_OVERHEAD
+
+
+def take_batch(cache, max_rows, max_bytes, encoding='utf-8'):
+    """Pop the rows of a batch from the head of the cache (deque of rows dictionaries)
+
+    The batch has at most max_rows rows and max_bytes bytes, but it has at least one row,
+    even if this row is larger than max_bytes.
+
+    :return: (list of rows, batch size, True if the batch was cut by its size)
+    """
+    rows = []
+    size = 0
+    while cache and len(rows) < max_rows:
+        row_bytes = row_size(cache[0].values(), encoding)
+        if rows and max_bytes and size + row_bytes > max_bytes:
+            return rows, size, True
+        rows.append(cache.popleft())
+        size += row_bytes
+    return rows, size, False
+
+
+def split_rows(rows, max_bytes, encoding='utf-8'):
+    """Split a list of rows (values tuples) in batches of at most max_bytes bytes
+
+    :return: list of batches
+    """
+    batches = []
+    batch = []
+    size = 0
+    for row in rows:
+        row_bytes = row_size(row, encoding)
+        if batch and max_bytes and size + row_bytes > max_bytes:
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(row)
+        size += row_bytes
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module captures the broks received by the module in a compressed file, and reads the
+captured broks back to replay them.
+
+The capture file is a gzip compressed JSON lines file, each line is a captured brok:
+{"t": reception timestamp, "type": brok type, "data": brok data}
+
+The capture file size is bounded: when the compressed file size reaches the maximum size, the
+file is rotated (renamed with a .1 suffix, replacing the former rotated file) and a new file
+is started.
+"""
+
+import os
+import json
+import gzip
+import time
+
+# Only the broks managed by the module are captured
+CAPTURED_BROKS = ('initial_host_status', 'initial_service_status',
+                  'host_check_result', 'service_check_result')
+
+
+class BrokCapture(object):
+    """
+    Capture the broks in a compressed JSON lines file with a bounded size
+    """
+
+    def __init__(self, path, max_size=100 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.file = None
+        self.count = 0
+        self.rotations = 0
+
+    def open(self):
+        """Open the capture file, appending to an existing file"""
+        self.file = gzip.open(self.path, 'ab')
+
+    def write(self, brok_type, data, timestamp=None):
+        """Capture a brok"""
+        if brok_type not in CAPTURED_BROKS:
+            return
+        if self.file is None:
+            self.open()
+        line = json.dumps({'t': timestamp or time.time(), 'type': brok_type, 'data': data},
+                          separators=(',', ':'), default=str)
+        self.file.write(line.encode('utf-8') + b'\n')
+        self.count += 1
+        # Compressed size, not including the compressor pending data
+        if self.file.fileobj.tell() >= self.max_size:
+            self.rotate()
+
+    def rotate(self):
+        """Rotate the capture file"""
+        self.close()
+        os.rename(self.path, self.path + '.1')
+        self.rotations += 1
+
+    def close(self):
+        """Close the capture file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_capture(path):
+    """Read a capture file
+
+    A truncated file (eg. the capture of a killed broker) is read until the truncation.
+
+    :return: generator of (timestamp, brok type, brok data)
+    """
+    with gzip.open(path, 'rb') as capture:
+        try:
+            for line in capture:
+                try:
+                    brok = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # Truncated last line
+                    break
+                yield brok['t'], brok['type'], brok['data']
+        except EOFError:
+            return
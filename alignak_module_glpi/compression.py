@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module compresses the long strings values of the queued rows.
+
+While the database is not available, the queued events and records rows hold the check
+results output and performance data, that are very similar for the successive check results
+of a service. The long values are compressed with a raw deflate stream and a preset
+dictionary shared per service and per column: the first compressed value of the service
+column. A value similar to the dictionary is compressed to a few bytes.
+
+The compressed values are decompressed when the rows are inserted. The short values are
+kept as they are: the compressed value object would be larger than the string.
+
+The preset dictionaries and the surrogatepass error handler need Python 3.3 or later.
+"""
+
+import sys
+import zlib
+
+from collections import OrderedDict
+
+# Raw deflate stream, without header and checksum
+WBITS = -15
+# Values shorter than MIN_LENGTH characters are not compressed
+MIN_LENGTH = 64
+# Compressed columns
+COLUMNS = ('output', 'perf_data')
+
+# zlib preset dictionaries are available with Python 3.3 or later
+AVAILABLE = sys.version_info >= (3, 3)
+
+
+class Compressed(object):
+    """
+    A compressed string value
+    """
+    __slots__ = ('zdict', 'data', 'size')
+
+    def __init__(self, zdict, data, size):
+        self.zdict = zdict
+        self.data = data
+        # Encoded value length
+        self.size = size
+
+    def __str__(self):
+        return self.text()
+
+    def text(self):
+        """Get the decompressed value"""
+        decompressor = zlib.decompressobj(WBITS, self.zdict)
+        return (decompressor.decompress(self.data) + decompressor.flush()).decode(
+            'utf-8', 'surrogatepass')
+
+
+def expand(value):
+    """Get a value, decompressed if it is compressed"""
+    return value.text() if isinstance(value, Compressed) else value
+
+
+def expand_row(row):
+    """Get the values tuple of a row (dictionary), decompressing the compressed values"""
+    return tuple([expand(value) for value in row.values()])
+
+
+class TextCompressor(object):
+    """
+    Compress the long strings values of the rows with a preset dictionary per service and
+    column, at most `dictionaries` dictionaries are kept (the oldest ones are forgotten, the
+    compressed values keep a reference to their dictionary)
+    """
+
+    def __init__(self, level=6, dictionaries=10000, columns=COLUMNS, min_length=MIN_LENGTH):
+        self.level = level
+        self.dictionaries = OrderedDict()
+        self.max_dictionaries = dictionaries
+        self.columns = columns
+        self.min_length = min_length
+        self.count = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    def ratio(self):
+        """Get the compression ratio of the compressed values: raw bytes / compressed bytes"""
+        if not self.compressed_bytes:
+            return 1.0
+        return round(float(self.raw_bytes) / self.compressed_bytes, 2)
+
+    def dictionary(self, key, encoded):
+        """Get the dictionary of a service column, the value is the dictionary of a new key"""
+        zdict = self.dictionaries.get(key)
+        if zdict is None:
+            if len(self.dictionaries) >= self.max_dictionaries:
+                self.dictionaries.popitem(last=False)
+            # The dictionary end is the most efficient part of the dictionary
+            zdict = self.dictionaries[key] = encoded[-32768:]
+        return zdict
+
+    def compress(self, key, value):
+        """Compress a string value with the dictionary of its key"""
+        if not isinstance(value, str) or len(value) < self.min_length:
+            return value
+        encoded = value.encode('utf-8', 'surrogatepass')
+        zdict = self.dictionary(key, encoded)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS, 9,
+                                      zlib.Z_DEFAULT_STRATEGY, zdict)
+        data = compressor.compress(encoded) + compressor.flush()
+        self.count += 1
+        self.raw_bytes += len(encoded)
+        self.compressed_bytes += len(data)
+        return Compressed(zdict, data, len(encoded))
+
+    def compress_row(self, row):
+        """Compress the long values of a row (dictionary), in place
+
+        :return: the row
+        """
+        for column in self.columns:
+            if column in row:
+                row[column] = self.compress(
+                    (row.get('host_name'), row.get('service_description'), column), row[column])
+        return row
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module detects the replayed services events.
+
+When the schedulers resend their broks or when the broker replays its queue after a
+reconnection, the module receives the same check results again. An event is identified with
+a deterministic key: the item, the check time and the state. The keys of the recent events
+are kept in a bounded window: an event with a key in the window is a duplicate.
+
+The window only covers the recent events of the running module: a unique key on the event
+columns of the services events table (created with the alignak-glpi-migrate command)
+also ignores the events replayed after a module restart. The key includes the events date,
+as required for a partitioned table.
+"""
+
+from collections import deque
+
+# Services events table unique key columns
+EVENT_KEY_COLUMNS = ['host_name', 'service_description', 'date', 'state_id', 'state_type_id']
+
+
+def event_key(host_name, service_description, last_chk, state_id, state_type_id):
+    """Get the key of a services event"""
+    return (host_name, service_description, int(last_chk), state_id, state_type_id)
+
+
+class RecentKeys(object):
+    """
+    A bounded window of the most recent keys, the oldest keys are forgotten first
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.keys = set()
+        self.order = deque()
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def seen(self, key):
+        """Add a key to the window
+
+        :return: True if the key is already in the window
+        """
+        if key in self.keys:
+            self.duplicates += 1
+            return True
+        self.keys.add(key)
+        self.order.append(key)
+        if len(self.order) > self.size:
+            self.keys.discard(self.order.popleft())
+        return False
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides the database drivers used by the module:
+- mysql-connector: MySQL connector/Python, with its C extension if it is available
+- mysql-connector-pure: MySQL connector/Python, pure Python implementation
+- mysql-connector-c: MySQL connector/Python, C extension
+- pymysql: PyMySQL
+- mysqlclient: mysqlclient (MySQLdb)
+- sqlite: the SQLite stand-in for the Glpi database
+
+The connections provide the subset of the mysql.connector API used by the module: the
+PyMySQL and mysqlclient connections and cursors are wrapped to provide it. The drivers
+libraries are only imported when connecting, so only the configured driver is required.
+"""
+
+import time
+import importlib
+
+import six
+
+from . import sqlite
+
+DRIVERS = ('mysql-connector', 'mysql-connector-pure', 'mysql-connector-c',
+           'pymysql', 'mysqlclient', 'sqlite')
+
+
+class DbapiCursor(object):
+    """
+    A DB-API cursor wrapper providing the executed statement as mysql.connector does
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.generation = None
+        self.cursor = None
+        self.statement = None
+
+    def get_cursor(self):
+        """Get a cursor on the current connection, a new one if the connection changed"""
+        if self.generation != self.connection.generation:
+            self.cursor = self.connection.raw.cursor()
+            self.generation = self.connection.generation
+        return self.cursor
+
+    @property
+    def rowcount(self):
+        """Number of rows affected by the last statement"""
+        return self.cursor.rowcount if self.cursor is not None else -1
+
+    def execute(self, query, params=None):
+        """Execute a statement"""
+        self.statement = query
+        if params is None:
+            return self.get_cursor().execute(query)
+        return self.get_cursor().execute(query, params)
+
+    def executemany(self, query, seq_params):
+        """Execute a statement for each parameters of the sequence"""
+        self.statement = query
+        return self.get_cursor().executemany(query, seq_params)
+
+    def fetchone(self):
+        """Get the next row"""
+        return self.get_cursor().fetchone()
+
+    def fetchall(self):
+        """Get all the remaining rows"""
+        return self.get_cursor().fetchall()
+
+    def close(self):
+        """Close the cursor"""
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+            self.generation = None
+
+
+class DbapiConnection(object):
+    """
+    A DB-API connection wrapper providing the mysql.connector connection API
+    """
+
+    def __init__(self, connect_function, **params):
+        self.connect_function = connect_function
+        self.params = params
+        self.raw = None
+        # Incremented on each new connection, for the cursors to follow the connection
+        self.generation = 0
+        self.reconnect(attempts=1, delay=0)
+
+    def reconnect(self, attempts=1, delay=0):
+        """Open a new connection to the database, closing the previous one"""
+        try:
+            self.close()
+        except Exception:  # pylint: disable=broad-except
+            # The previous connection is lost anyway
+            self.raw = None
+        for attempt in range(attempts):
+            try:
+                self.raw = self.connect_function(**self.params)
+                self.generation += 1
+                return
+            except Exception:  # pylint: disable=broad-except
+                if attempt + 1 == attempts:
+                    raise
+                time.sleep(delay)
+
+    def is_connected(self):
+        """Is the connection alive?"""
+        if self.raw is None:
+            return False
+        try:
+            self.raw.ping()
+        except Exception:  # pylint: disable=broad-except
+            return False
+        return True
+
+    def cursor(self, prepared=False):
+        # pylint: disable=unused-argument
+        """Get a new cursor, the statements are not prepared on the server side"""
+        return DbapiCursor(self)
+
+    def set_charset_collation(self, charset=None, collation=None):
+        """The character set is defined when connecting"""
+
+    def get_server_info(self):
+        """Get the database server information"""
+        return self.raw.get_server_info()
+
+    def get_server_version(self):
+        """Get the database server version"""
+        return tuple([int(part) for part in
+                      self.raw.get_server_info().split('-')[0].split('.') if part.isdigit()])
+
+    def commit(self):
+        """Commit the current transaction"""
+        self.raw.commit()
+
+    def rollback(self):
+        """Rollback the current transaction"""
+        self.raw.rollback()
+
+    def close(self):
+        """Close the connection"""
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+
+
+def import_driver(module_name, driver):
+    """Import a driver library"""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as exp:
+        cause = exp
+    error = ImportError("the %s database driver requires the %s library, "
+                        "which is not installed: %s" % (driver, module_name, cause))
+    six.raise_from(error, cause)
+    # Not reached, six.raise_from raises the error
+    raise error
+
+
+def connect(driver, host='127.0.0.1', port=3306, database='glpi', user='alignak',
+            password='alignak', character_set='utf8', sqlite_database=':memory:', tables=None):
+    # pylint: disable=too-many-arguments
+    """Connect to the database with the driver
+
+    :param tables: SQLite stand-in only, dictionary of the tables to create
+    :return: a mysql.connector like connection
+    """
+    if driver == 'sqlite':
+        return sqlite.connect(sqlite_database, tables)
+
+    if driver.startswith('mysql-connector'):
+        connector = import_driver('mysql.connector', driver)
+        params = {}
+        if driver == 'mysql-connector-pure':
+            params['use_pure'] = True
+        elif driver == 'mysql-connector-c':
+            if not getattr(connector, 'HAVE_CEXT', False):
+                raise ImportError("the mysql-connector-c database driver requires the "
+                                  "MySQL connector/Python C extension, which is not available")
+            params['use_pure'] = False
+        return connector.connect(host=host, port=port, database=database,
+                                 user=user, passwd=password, **params)
+
+    if driver == 'pymysql':
+        pymysql = import_driver('pymysql', driver)
+        return DbapiConnection(pymysql.connect, host=host, port=port, database=database,
+                               user=user, password=password, charset=character_set)
+
+    if driver == 'mysqlclient':
+        mysqldb = import_driver('MySQLdb', driver)
+        return DbapiConnection(mysqldb.connect, host=host, port=port, db=database,
+                               user=user, passwd=password, charset=character_set)
+
+    raise ValueError("unknown database driver: %s, available drivers: %s"
+                     % (driver, ', '.join(DRIVERS)))
@@ -36,17 +36,43 @@
 This Class is a plugin for the Shinken/Alignak Broker. It connects to a Glpi Mysql / MariaDB
 database to update hosts and services status when broks are received
 """
+import os
+import re
 import time
 import queue
+import signal
+import fnmatch
 import datetime
 import logging
 import traceback
 
 from collections import deque
 
-import mysql.connector
+import six
 
 from alignak.basemodule import BaseModule
+from alignak.stats import Stats
+
+from .aggregation import PerfdataAggregator
+from .rollups import AvailabilityRollups, CREATE_ROLLUPS_TABLE, UPSERT_ROLLUPS
+from .metrics import MetricsRegistry
+from .capture import BrokCapture
+from .profiling import SamplingProfiler, CProfileProfiler
+from .watchdog import Watchdog, thread_stacks
+from .logsampling import LogSampler
+from .partitions import PartitionManager, NotPartitionedError, PERIODS
+from .retention import RetentionPurge
+from .dedup import RecentKeys, event_key, EVENT_KEY_COLUMNS
+from .retry import bisect_insert, is_connection_lost, Backoff, DeadLetters, \
+    PartialInsertError
+from .normalize import RowNormalizer, MB3_CHARACTER_SETS
+from .compression import TextCompressor, expand_row, AVAILABLE as COMPRESSION_AVAILABLE
+from .interning import StringTable, MAX_LENGTH
+from .batching import python_encoding, batch_bytes, take_batch, split_rows, \
+    MAX_ALLOWED_PACKET_QUERY
+from . import drivers
+from . import schema
+from . import sqlite
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 for handler in logger.parent.handlers:
@@ -112,8 +138,20 @@ class Glpidb_broker(BaseModule):
         self.password = getattr(mod_conf, 'password', 'alignak')
         self.database = getattr(mod_conf, 'database', 'glpi')
         self.character_set = getattr(mod_conf, 'character_set', 'utf8')
-        logger.info("using '%s' database on %s:%d (user = %s)",
-                    self.database, self.host, self.port, self.user)
+        # Database driver: mysql-connector (-pure, -c), pymysql, mysqlclient or sqlite
+        # (local stand-in for the Glpi database)
+        self.db_driver = getattr(mod_conf, 'db_driver', 'mysql-connector')
+        if self.db_driver not in drivers.DRIVERS:
+            logger.error("unknown database driver: %s, using mysql-connector", self.db_driver)
+            self.db_driver = 'mysql-connector'
+        self.sqlite_database = getattr(mod_conf, 'sqlite_database', ':memory:')
+        if self.db_driver == 'sqlite':
+            logger.info("using a SQLite database: %s", self.sqlite_database)
+        else:
+            logger.info("using '%s' database on %s:%d (user = %s)",
+                        self.database, self.host, self.port, self.user)
+            if self.db_driver != 'mysql-connector':
+                logger.info("database driver: %s", self.db_driver)
 
         # Data update source information
         self.source = getattr(mod_conf, 'source', 'alignak')
@@ -152,19 +190,32 @@ class Glpidb_broker(BaseModule):
         self.update_records = bool(getattr(mod_conf, 'update_records', '0') == '1')
         self.records_table = getattr(mod_conf, 'records_table', 'glpi_plugin_monitoring_records')
         self.records_services = getattr(mod_conf, 'records_services', '')
-        self.records_services = self.records_services.split(',')
-        if self.records_services and not self.records_services[0]:
-            self.records_services = []
+        self.records_services = [s.strip() for s in self.records_services.split(',')
+                                 if s.strip()]
         logger.info("updating records (%s): %s, services: %s",
                     self.records_table, self.update_records, self.records_services)
+        # Exact service names are matched with a set, wildcard patterns with a compiled regex
+        self.records_names = set()
+        self.records_pattern = None
+        patterns = []
+        for service in self.records_services:
+            if any(c in service for c in '*?['):
+                patterns.append(fnmatch.translate(service))
+            else:
+                self.records_names.add(service)
+        if patterns:
+            self.records_pattern = re.compile('|'.join(patterns))
         self.insert_records_query = None
 
         self.db = None
         self.db_cursor = None
         self.db_cursor_many = None
         self.is_connected = False
+        # Tables columns and indexes, fetched once for the process lifetime
+        self.schema = None
 
         self.events_cache = deque()
+        self.records_cache = deque()
 
         self.commit_period = int(getattr(mod_conf, 'commit_period', '60'))
         self.commit_volume = int(getattr(mod_conf, 'commit_volume', '1000'))
@@ -173,6 +224,234 @@ class Glpidb_broker(BaseModule):
         logger.info('periodical commit volume: %d lines', self.commit_volume)
         logger.info('periodical DB connection test period: %ds', self.db_test_period)
 
+        self.records_commit_period = int(getattr(mod_conf, 'records_commit_period',
+                                                 self.commit_period))
+        self.records_commit_volume = int(getattr(mod_conf, 'records_commit_volume',
+                                                 self.commit_volume))
+        if self.update_records:
+            logger.info('records commit period: %ds, volume: %d lines',
+                        self.records_commit_period, self.records_commit_volume)
+
+        # Aggregate the records performance data on time windows (0 to store each check result)
+        self.records_window = int(getattr(mod_conf, 'records_window', '0'))
+        self.records_aggregator = None
+        if self.update_records and self.records_window:
+            self.records_aggregator = PerfdataAggregator(self.records_window, self.source)
+            logger.info('records aggregated on %ds windows', self.records_window)
+
+        # Only record the services events on a state / state type change
+        self.events_state_changes = bool(getattr(mod_conf, 'events_state_changes', '0') == '1')
+        # ... and record an event if none was recorded since events_heartbeat seconds
+        self.events_heartbeat = int(getattr(mod_conf, 'events_heartbeat', '0'))
+        if self.update_services_events and self.events_state_changes:
+            logger.info('recording services events on state changes only, heartbeat: %ds',
+                        self.events_heartbeat)
+        self.events_written = 0
+        self.events_suppressed = 0
+        # The check results older than the last recorded check result of an item are dropped
+        self.drop_stale_results = bool(getattr(mod_conf, 'drop_stale_results', '1') == '1')
+        # Replayed services events are dropped: keys of the most recent events
+        self.events_keys = None
+        events_dedup_window = int(getattr(mod_conf, 'events_dedup_window', '10000'))
+        if events_dedup_window:
+            self.events_keys = RecentKeys(events_dedup_window)
+        # The services events table has a unique event key: INSERT IGNORE the events
+        self.events_unique_key = bool(getattr(mod_conf, 'events_unique_key', '0') == '1')
+
+        # Set the services events unavailability flag when the events are recorded
+        self.update_availability = bool(getattr(mod_conf, 'update_availability', '0') == '1')
+        if self.update_services_events and self.update_availability:
+            logger.info('recording services events unavailability')
+
+        # Daily availability rollups
+        self.update_rollups = bool(getattr(mod_conf, 'update_rollups', '0') == '1')
+        self.rollups_table = getattr(mod_conf, 'rollups_table',
+                                     'glpi_plugin_monitoring_availabilities_daily')
+        self.rollups_commit_period = int(getattr(mod_conf, 'rollups_commit_period', '300'))
+        self.rollups = None
+        if self.update_rollups:
+            self.rollups = AvailabilityRollups()
+            logger.info('updating daily availability rollups (%s), commit period: %ds',
+                        self.rollups_table, self.rollups_commit_period)
+
+        # Module internal metrics
+        self.metrics = MetricsRegistry()
+        self.metrics_period = int(getattr(mod_conf, 'metrics_period', '60'))
+        self.metrics_textfile = getattr(mod_conf, 'metrics_textfile', '')
+        stats_host = getattr(mod_conf, 'statsd_host', 'localhost')
+        stats_port = int(getattr(mod_conf, 'statsd_port', '8125'))
+        stats_prefix = getattr(mod_conf, 'statsd_prefix', 'alignak')
+        statsd_enabled = bool(getattr(mod_conf, 'statsd_enabled', '0') == '1')
+        graphite_enabled = bool(getattr(mod_conf, 'graphite_enabled', '0') == '1')
+        logger.info("metrics period: %ds, Prometheus text file: %s",
+                    self.metrics_period, self.metrics_textfile or 'none')
+        self.statsmgr = None
+        if statsd_enabled or graphite_enabled:
+            logger.info("StatsD configuration: %s:%s, prefix: %s, enabled: %s, graphite: %s",
+                        stats_host, stats_port, stats_prefix, statsd_enabled, graphite_enabled)
+            self.statsmgr = Stats()
+            if not graphite_enabled:
+                self.statsmgr.register(self.alias, 'module',
+                                       statsd_host=stats_host, statsd_port=stats_port,
+                                       statsd_prefix=stats_prefix, statsd_enabled=True)
+            else:
+                self.statsmgr.connect(self.alias, 'module',
+                                      host=stats_host, port=stats_port,
+                                      prefix=stats_prefix, enabled=True)
+
+        # End-to-end freshness lag (from the check time to the database commit)
+        self.freshness_sla = int(getattr(mod_conf, 'freshness_sla', '0'))
+        logger.info("freshness lag SLA: %s",
+                    '%ds' % self.freshness_sla if self.freshness_sla else 'none')
+
+        # Capture the received broks, to replay them with alignak-glpi-replay
+        self.capture = None
+        capture_file = getattr(mod_conf, 'capture_file', '')
+        if capture_file:
+            capture_max_size = int(getattr(mod_conf, 'capture_max_size', '100'))
+            self.capture = BrokCapture(capture_file, capture_max_size * 1024 * 1024)
+            logger.info("capturing the received broks in %s (maximum size: %d MB)",
+                        capture_file, capture_max_size)
+
+        # Main loop profiling, started on startup or with a SIGUSR2 signal
+        self.profile_mode = getattr(mod_conf, 'profile_mode', 'sampling')
+        self.profile_start = bool(getattr(mod_conf, 'profile_start', '0') == '1')
+        self.profile_directory = getattr(mod_conf, 'profile_directory', '/tmp')
+        self.profile_duration = int(getattr(mod_conf, 'profile_duration', '60'))
+        self.profile_interval = int(getattr(mod_conf, 'profile_interval', '10'))
+        self.profile_turns = int(getattr(mod_conf, 'profile_turns', '100'))
+        self.profile_top = int(getattr(mod_conf, 'profile_top', '10'))
+        self.profiler = None
+        self.profiling_requested = False
+        logger.info("profiling: %s, %s, dumped in %s", self.profile_mode,
+                    'on start' if self.profile_start else 'on SIGUSR2', self.profile_directory)
+
+        # Main loop stall watchdog
+        self.watchdog = None
+        watchdog_threshold = int(getattr(mod_conf, 'watchdog_threshold', '300'))
+        if watchdog_threshold:
+            self.watchdog = Watchdog(watchdog_threshold, self.on_stall, self.on_stall_recovery)
+        logger.info("main loop stall watchdog threshold: %s",
+                    '%ds' % watchdog_threshold if watchdog_threshold else 'disabled')
+
+        # Per item logs: sampled initial status logs, rate limited warnings and errors and
+        # periodic summary lines
+        self.log_sampler = LogSampler(int(getattr(mod_conf, 'log_sample', '1000')),
+                                      int(getattr(mod_conf, 'log_rate', '10')))
+        self.log_summary_period = int(getattr(mod_conf, 'log_summary_period', '60'))
+        self.log_summary_broks = {}
+        # Refreshed on each main loop turn, avoids building the debug logs arguments
+        self.debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        logger.info("per item logs: 1 in %d initial status, %s warnings/errors per minute, "
+                    "summary every %ds", self.log_sampler.every,
+                    self.log_sampler.rate or 'all', self.log_summary_period)
+
+        # Services events retention, in days (0 to keep all the events)
+        self.events_retention = int(getattr(mod_conf, 'events_retention', '0'))
+        # Services events table partitions, managed in a background thread
+        self.partitions = None
+        events_partitioning = getattr(mod_conf, 'events_partitioning', '')
+        if events_partitioning in PERIODS:
+            self.partitions = PartitionManager(
+                self.connect_database, self.database, self.serviceevents_table,
+                events_partitioning,
+                ahead=int(getattr(mod_conf, 'events_partitions_ahead', '7')),
+                retention=self.events_retention,
+                interval=int(getattr(mod_conf, 'partitioning_period', '3600')),
+                on_change=self.on_partitions_change, on_error=self.on_partitions_error)
+        elif events_partitioning:
+            logger.error("unknown events partitioning: %s, available: %s",
+                         events_partitioning, ', '.join(sorted(PERIODS)))
+        logger.info("services events retention: %s, partitioning: %s",
+                    '%d days' % self.events_retention if self.events_retention else 'none',
+                    events_partitioning if self.partitions is not None else 'none')
+
+        # Records retention, in days (0 to keep all the records)
+        self.records_retention = int(getattr(mod_conf, 'records_retention', '0'))
+        # Chunked purge of the expired rows, in a background thread, started in the main loop
+        self.purge = None
+        self.purge_period = int(getattr(mod_conf, 'purge_period', '300'))
+        self.purge_chunk = int(getattr(mod_conf, 'purge_chunk', '1000'))
+        self.purge_pause = int(getattr(mod_conf, 'purge_pause', '100')) / 1000.0
+        self.purge_budget = int(getattr(mod_conf, 'purge_budget', '30'))
+        self.purge_latency = float(getattr(mod_conf, 'purge_latency', '1.0'))
+        # Latency of the last rows bulk insertion, the purge backs off when it is too high
+        self.insert_latency = 0.0
+        logger.info("records retention: %s, purge every %ds: chunks of %d rows, %dms pause, "
+                    "%ds budget, backoff above %.2fs insertion latency",
+                    '%d days' % self.records_retention if self.records_retention else 'none',
+                    self.purge_period, self.purge_chunk, self.purge_pause * 1000,
+                    self.purge_budget, self.purge_latency)
+        logger.info("replayed services events: %s, unique event key: %s",
+                    'window of %d events' % self.events_keys.size if self.events_keys else
+                    'not detected', 'yes' if self.events_unique_key else 'no')
+        logger.info("out of order check results: %s",
+                    'dropped' if self.drop_stale_results else 'recorded')
+
+        # Failed batches: requeued and retried with a backoff on transient errors, else
+        # bisected to isolate the poison rows, written to the dead letters file
+        self.retry_delay = int(getattr(mod_conf, 'retry_delay', '1'))
+        self.retry_max_delay = int(getattr(mod_conf, 'retry_max_delay', '60'))
+        # table name -> Backoff
+        self.retry_backoff = {}
+        self.dead_letters = None
+        dead_letters_file = getattr(mod_conf, 'dead_letters_file', '')
+        if dead_letters_file:
+            self.dead_letters = DeadLetters(dead_letters_file)
+        # The oldest queued rows are dropped when a queue holds more than max_queue_length
+        # rows (0 for no limit): the requeued rows must not exhaust the memory
+        self.max_queue_length = int(getattr(mod_conf, 'max_queue_length', '100000'))
+        # Tables without transactions (MyISAM): the rows are inserted one by one
+        self.non_transactional = set()
+        logger.info("failed insertions retried after %d to %ds, poison rows %s, "
+                    "queues of at most %d rows",
+                    self.retry_delay, self.retry_max_delay,
+                    'written to %s' % dead_letters_file if dead_letters_file else 'dropped',
+                    self.max_queue_length)
+
+        # Batches cut by size: half of the server max_allowed_packet, read when connecting,
+        # and at most commit_max_bytes bytes (0 for no other limit)
+        self.commit_max_bytes = int(getattr(mod_conf, 'commit_max_bytes', '0'))
+        self.encoding = python_encoding(self.character_set)
+        self.max_allowed_packet = None
+        self.batch_bytes = batch_bytes(self.max_allowed_packet, self.commit_max_bytes)
+        logger.info("batches of at most %d bytes (%s encoding)", self.batch_bytes, self.encoding)
+
+        # Rows strings values normalized to the columns lengths and character set:
+        # table name -> RowNormalizer, built with the tables schema
+        self.normalize_rows = bool(getattr(mod_conf, 'normalize_rows', '1') == '1')
+        self.normalizers = {}
+        logger.info("rows normalization: %s", 'yes' if self.normalize_rows else 'no')
+
+        # Queued events and records long output and performance data compressed in memory,
+        # with a dictionary per service and column (zlib) or not compressed (empty)
+        self.queue_compression = getattr(mod_conf, 'queue_compression', '')
+        self.compressor = None
+        if self.queue_compression == 'zlib' and not COMPRESSION_AVAILABLE:
+            logger.warning("queued rows compression needs Python 3.3 or later, the queued rows "
+                           "are not compressed")
+        elif self.queue_compression == 'zlib':
+            self.compressor = TextCompressor(
+                level=int(getattr(mod_conf, 'queue_compression_level', '1')),
+                dictionaries=int(getattr(mod_conf, 'queue_compression_dictionaries', '10000')))
+        elif self.queue_compression:
+            logger.warning("unknown queue compression: %s, the queued rows are not compressed",
+                           self.queue_compression)
+        logger.info("queued rows compression: %s",
+                    'zlib' if self.compressor is not None else 'no')
+
+        # Interned hosts names and services descriptions, and exact duplicate outputs of the
+        # queued rows: at most interned_names and interned_outputs strings (0 to disable)
+        interned_names = int(getattr(mod_conf, 'interned_names', '100000'))
+        self.names = StringTable(interned_names) if interned_names else None
+        interned_outputs = int(getattr(mod_conf, 'interned_outputs', '10000'))
+        self.outputs = None
+        if interned_outputs:
+            # The compressed outputs are not interned, the table would keep them uncompressed
+            self.outputs = StringTable(interned_outputs, MAX_LENGTH if self.compressor is None
+                                       else self.compressor.min_length - 1)
+        logger.info("interned strings: %d names, %d outputs", interned_names, interned_outputs)
+
     def init(self):
         """Module initialization
         Open database connection and check tables structure"""
@@ -181,6 +460,168 @@ class Glpidb_broker(BaseModule):
         logger.info("initialized")
         return True
 
+    def do_stop(self):
+        """Module is stopping
+
+        Flush the pending records windows and try to insert the queued records, then
+        account the time until now in the daily rollups and flush them"""
+        if self.records_aggregator is not None:
+            self.records_cache.extend([self.queue_row(self.records_table, row)
+                                       for row in self.records_aggregator.flush()])
+
+        while self.records_cache and self.is_connected:
+            count = len(self.records_cache)
+            self.bulk_insert_records()
+            if len(self.records_cache) >= count:
+                break
+        if self.records_cache:
+            logger.warning("%d records not inserted in database", len(self.records_cache))
+
+        self.flush_rollups(time.time())
+
+        if self.profiler is not None:
+            self.stop_profiling()
+
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+        if self.partitions is not None:
+            self.partitions.stop()
+
+        if self.purge is not None:
+            self.purge.stop()
+
+        if self.capture is not None:
+            self.capture.close()
+            logger.info("captured %d broks", self.capture.count)
+
+        self.close()
+        logger.info("stopped")
+
+    def on_stall(self, name, elapsed):
+        """Called by the watchdog thread when a heartbeat is stalled
+
+        Dump the threads stacks, the statements in flight and the queues depths
+        """
+        self.metrics.counter('stalls', labels=(('heartbeat', name),))
+        logger.error("stall of the %s: no heartbeat since %ds", name, elapsed)
+        for cursor in [self.db_cursor, self.db_cursor_many]:
+            if cursor is not None and getattr(cursor, 'statement', None):
+                logger.error("statement in flight: %s", cursor.statement)
+        try:
+            queue_size = self.to_q.qsize()
+        except (AttributeError, NotImplementedError):
+            queue_size = 'unknown'
+        logger.error("queues: broks: %s, events: %d, records: %d",
+                     queue_size, len(self.events_cache), len(self.records_cache))
+        logger.error("threads stacks:\n%s", thread_stacks())
+
+    @staticmethod
+    def on_stall_recovery(name, elapsed):
+        """Called when a stalled heartbeat is recorded again"""
+        logger.warning("the %s resumed after a %ds stall", name, elapsed)
+
+    def on_partitions_change(self, statements):
+        """Called by the partition manager thread when the events partitions changed"""
+        for statement in statements:
+            self.metrics.counter('partitions_changes')
+            logger.info("services events partitions: %s", statement)
+
+    def on_partitions_error(self, exp):
+        """Called by the partition manager thread when the partitions management failed"""
+        if isinstance(exp, NotPartitionedError):
+            logger.warning("services events partitions are not managed: %s", exp)
+            return
+        self.metrics.counter('partitions_errors')
+        logger.error("services events partitions management error: %s", exp)
+
+    def start_partitions(self):
+        """Start the services events partition manager, if the database supports it"""
+        if self.partitions is None:
+            return
+        if self.fake_db or self.db_driver == 'sqlite':
+            logger.warning("services events partitioning is not available with %s",
+                           'a fake database' if self.fake_db else 'the SQLite database')
+            self.partitions = None
+            return
+        logger.info("starting the services events partition manager")
+        self.partitions.start()
+
+    def on_purge(self, purged):
+        """Called by the retention purge thread after some expired rows were deleted"""
+        for table, deleted in purged:
+            self.metrics.counter('purged_rows', deleted, (('table', table),))
+            logger.info("retention purge: %d rows deleted from %s (backoff x%d)",
+                        deleted, table, self.purge.backoff)
+
+    def on_purge_error(self, exp):
+        """Called by the retention purge thread when the purge failed"""
+        self.metrics.counter('purge_errors')
+        logger.error("retention purge error: %s", exp)
+
+    def start_purge(self):
+        """Start the retention purge of the services events and records tables
+
+        The services events are purged only if the table is not partitioned by the module
+        """
+        tables = []
+        if self.events_retention and self.partitions is None:
+            tables.append((self.serviceevents_table, 'date', self.events_retention))
+        if self.records_retention:
+            tables.append((self.records_table, 'last_check', self.records_retention))
+        if not tables:
+            return
+        if self.fake_db or (self.db_driver == 'sqlite' and self.sqlite_database == ':memory:'):
+            logger.warning("retention purge is not available with %s",
+                           'a fake database' if self.fake_db else 'a SQLite memory database')
+            return
+        self.purge = RetentionPurge(
+            self.connect_database, tables, chunk=self.purge_chunk, pause=self.purge_pause,
+            budget=self.purge_budget, latency=lambda: self.insert_latency,
+            latency_threshold=self.purge_latency, interval=self.purge_period,
+            on_change=self.on_purge, on_error=self.on_purge_error)
+        logger.info("starting the retention purge of %s",
+                    ', '.join([table for table, _, _ in tables]))
+        self.purge.start()
+
+    def manage_signal(self, sig, frame):
+        """SIGUSR2 starts / stops the main loop profiling, the other signals stop the module"""
+        if sig == signal.SIGUSR2:
+            self.profiling_requested = True
+            return
+        super(Glpidb_broker, self).manage_signal(sig, frame)
+
+    def start_profiling(self):
+        """Start profiling the main loop"""
+        if self.profile_mode == 'cprofile':
+            self.profiler = CProfileProfiler(self.profile_turns)
+            logger.info("profiling the next %d main loop turns", self.profile_turns)
+        else:
+            self.profiler = SamplingProfiler(self.profile_duration,
+                                             self.profile_interval / 1000.0)
+            logger.info("sampling the main loop during %ds", self.profile_duration)
+        self.profiler.start()
+
+    def stop_profiling(self):
+        """Stop profiling, dump the profile and log the top functions
+
+        :return: the profile file name
+        """
+        self.profiler.stop()
+        path = os.path.join(self.profile_directory, 'glpi-%s-%s.%s' % (
+            self.alias, time.strftime('%Y%m%d-%H%M%S'),
+            'pstats' if self.profile_mode == 'cprofile' else 'collapsed'))
+        try:
+            self.profiler.dump(path)
+            logger.info("profile dumped in %s", path)
+        except (IOError, OSError) as exp:
+            logger.warning("profile dump error: %s", exp)
+            path = None
+        for line in self.profiler.summary(self.profile_top):
+            logger.info("profile: %s", line)
+        self.profiler = None
+        return path
+
     def do_loop_turn(self):
         """This function is called/used when you need a module with
         a loop function (and use the parameter 'external': True)
@@ -190,7 +631,7 @@ class Glpidb_broker(BaseModule):
 
     def open(self, force=False):
         """
-        Connect to the MySQL DB.
+        Connect to the MySQL DB, or to the SQLite stand-in database, with the configured driver
         """
         if self.is_connected and not force:
             logger.info("request to open but connection is still established")
@@ -199,15 +640,13 @@ class Glpidb_broker(BaseModule):
         try:
             logger.info("connecting to database %s on %s...", self.database, self.host)
             if not self.fake_db:
-                self.db = mysql.connector.connect(host=self.host, port=self.port,
-                                                  database=self.database,
-                                                  user=self.user, passwd=self.password)
-
-                self.db.set_charset_collation(self.character_set)
+                self.db = self.connect_database()
                 self.db_cursor = self.db.cursor()
                 self.db_cursor_many = self.db.cursor(prepared=True)
                 logger.info('server information: %s, version: %s',
                             self.db.get_server_info(), self.db.get_server_version())
+                if self.db_driver != 'sqlite':
+                    self.read_max_allowed_packet()
 
             logger.info("connected")
             self.is_connected = True
@@ -217,13 +656,45 @@ class Glpidb_broker(BaseModule):
 
         return self.is_connected
 
+    def read_max_allowed_packet(self):
+        """Get the server max_allowed_packet and set the batches maximum size"""
+        try:
+            self.db_cursor.execute(MAX_ALLOWED_PACKET_QUERY)
+            self.max_allowed_packet = int(self.db_cursor.fetchone()[0])
+        except Exception as exp:  # pylint: disable=broad-except
+            logger.warning("max_allowed_packet is not available: %s", exp)
+            return
+        self.batch_bytes = batch_bytes(self.max_allowed_packet, self.commit_max_bytes)
+        logger.info("server max_allowed_packet: %d bytes, batches of at most %d bytes",
+                    self.max_allowed_packet, self.batch_bytes)
+
+    def connect_database(self):
+        """Get a new connection to the database, with the configured driver"""
+        db = drivers.connect(
+            self.db_driver, host=self.host, port=self.port, database=self.database,
+            user=self.user, password=self.password, character_set=self.character_set,
+            sqlite_database=self.sqlite_database, tables={
+                self.hosts_table: sqlite.CREATE_HOSTS_TABLE,
+                self.services_table: sqlite.CREATE_SERVICES_TABLE,
+                self.serviceevents_table: sqlite.CREATE_SERVICEEVENTS_TABLE,
+                self.records_table: sqlite.CREATE_RECORDS_TABLE
+            })
+        db.set_charset_collation(self.character_set)
+        return db
+
     def close(self):
         """Close the DB connection and release the default cursor"""
         if self.is_connected:
             self.is_connected = False
-            self.db_cursor.close()
-            self.db_cursor_many.close()
-            self.db.close()
+            if self.db is None:
+                return
+            try:
+                self.db_cursor.close()
+                self.db_cursor_many.close()
+                self.db.close()
+            except Exception as exp:  # pylint: disable=broad-except
+                # The connection may already be lost
+                logger.warning("database connection close error: %s", exp)
             self.db = None
             logger.info('database connection closed')
 
@@ -236,75 +707,148 @@ class Glpidb_broker(BaseModule):
                 logger.info("updating services states is enabled")
             if self.update_services_events:
                 logger.info("updating services events is enabled")
+            if self.update_rollups:
+                logger.info("updating daily availability rollups is enabled")
             return
 
         try:
-            count = 0
-            self.db_cursor.execute("SHOW COLUMNS FROM %s" % self.hosts_table)
-            columns = self.db_cursor.fetchall()
-            logger.debug("Hosts table, got: ")
-            for column in columns:
-                if column[0] in ['entities_id', 'itemtype', 'items_id', 'state', 'state_type',
-                                 'last_check', 'output', 'perf_data', 'latency', 'execution_time',
-                                 'is_acknowledged']:
-                    count += 1
-                logger.debug('-: %s', column)
-            logger.debug("-> %d columns", count)
-            if self.update_hosts and count < 11:
-                self.update_hosts = False
-                logger.warning("updating hosts state is not possible because of DB structure")
+            tables = self.load_schema()
         except Exception as exp:
-            logger.warning("Hosts table columns request, error: %s", exp)
+            logger.warning("Tables columns and indexes request, error: %s", exp)
+            tables = {}
+
+        self.non_transactional = set([name for name, table in tables.items()
+                                      if not table.is_transactional()])
+        if self.non_transactional:
+            logger.info("tables without transactions, the failed batches rows are inserted "
+                        "one by one: %s", ', '.join(sorted(self.non_transactional)))
+
+        if self.normalize_rows:
+            mb3 = self.character_set.lower() in MB3_CHARACTER_SETS
+            self.normalizers = dict([(name, RowNormalizer(table.lengths, self.encoding, mb3))
+                                     for name, table in tables.items() if table.lengths])
+
+        columns = self.table_columns(tables, self.hosts_table)
+        count = len([column for column in columns
+                     if column in ['entities_id', 'itemtype', 'items_id', 'state', 'state_type',
+                                   'last_check', 'output', 'perf_data', 'latency',
+                                   'execution_time', 'is_acknowledged']])
+        logger.debug("Hosts table, got %d columns: %s", count, columns)
+        if self.update_hosts and count < 11:
             self.update_hosts = False
             logger.warning("updating hosts state is not possible because of DB structure")
 
         if self.update_hosts:
             logger.info("updating hosts states is enabled")
-
-        try:
-            count = 0
-            self.db_cursor.execute('SHOW COLUMNS FROM %s' % self.services_table)
-            columns = self.db_cursor.fetchall()
-            logger.debug("Services table, got: ")
-            for column in columns:
-                if column[0] in ['id', 'entities_id', 'state', 'state_type', 'last_check', 'output',
-                                 'perf_data', 'latency', 'execution_time', 'is_acknowledged']:
-                    count += 1
-                logger.debug('-: %s', column)
-            logger.debug("-> %d columns", count)
-            if self.update_services and count < 7:
-                self.update_services = False
-                logger.warning("updating services state is not possible because of DB structure")
-        except Exception as exp:
-            logger.warning("Services table columns request, error: %s", exp)
-            self.update_hosts = False
+            self.check_indexes(tables[self.hosts_table], schema.HOSTS_INDEXES)
+
+        columns = self.table_columns(tables, self.services_table)
+        count = len([column for column in columns
+                     if column in ['id', 'entities_id', 'state', 'state_type', 'last_check',
+                                   'output', 'perf_data', 'latency', 'execution_time',
+                                   'is_acknowledged']])
+        logger.debug("Services table, got %d columns: %s", count, columns)
+        if self.update_services and count < 7:
+            self.update_services = False
             logger.warning("updating services state is not possible because of DB structure")
 
         if self.update_services:
             logger.info("updating services states is enabled")
-
-        try:
-            count = 0
-            self.db_cursor.execute('SHOW COLUMNS FROM %s' % self.serviceevents_table)
-            columns = self.db_cursor.fetchall()
-            logger.debug("Services events table, got: ")
-            for column in columns:
-                if column[0] in ['plugin_monitoring_services_id', 'date',
-                                 'state_id', 'state_type_id', 'last_state_id', 'last_hard_state_id',
-                                 'state', 'state_type', 'output', 'perf_data']:
-                    count += 1
-                logger.debug('-: %s', column)
-            logger.debug("-> %d columns", count)
-            if self.update_services_events and count < 10:
-                self.update_services_events = False
-                logger.warning("updating services events is not possible because of DB structure")
-        except Exception as exp:
-            logger.warning("Services events table columns request, error: %s", exp)
-            self.update_hosts = False
+            self.check_indexes(tables[self.services_table], schema.SERVICES_INDEXES)
+
+        columns = self.table_columns(tables, self.serviceevents_table)
+        count = len([column for column in columns
+                     if column in ['plugin_monitoring_services_id', 'date',
+                                   'state_id', 'state_type_id', 'last_state_id',
+                                   'last_hard_state_id', 'state', 'state_type', 'output',
+                                   'perf_data']])
+        logger.debug("Services events table, got %d columns: %s", count, columns)
+        if self.update_services_events and count < 10:
+            self.update_services_events = False
             logger.warning("updating services events is not possible because of DB structure")
+        if self.update_availability and 'unavailability' not in columns:
+            self.update_availability = False
+            logger.warning("updating services events unavailability is not possible "
+                           "because of DB structure")
 
         if self.update_services_events:
             logger.info("updating services events is enabled")
+            if self.events_unique_key and self.serviceevents_table in tables and \
+                    not tables[self.serviceevents_table].find_unique_key(EVENT_KEY_COLUMNS):
+                logger.warning("table %s has no unique key on (%s), the replayed events are "
+                               "only detected in memory. Create the unique key with the "
+                               "alignak-glpi-migrate command", self.serviceevents_table,
+                               ', '.join(EVENT_KEY_COLUMNS))
+
+        if self.update_rollups:
+            try:
+                self.db_cursor.execute(CREATE_ROLLUPS_TABLE % self.rollups_table)
+                self.db.commit()
+            except Exception as exp:
+                logger.warning("Rollups table creation request, error: %s", exp)
+                self.update_rollups = False
+                self.rollups = None
+                logger.warning("updating daily availability rollups is not possible "
+                               "because of DB structure")
+
+        if self.update_rollups:
+            logger.info("updating daily availability rollups is enabled")
+
+    def load_schema(self, refresh=False):
+        """Get the columns and indexes of the module tables, with one information_schema
+        query. The result is cached for the process lifetime.
+
+        :return: dictionary of the existing tables: table name -> schema.Table
+        """
+        if self.schema is None or refresh:
+            tables = [self.hosts_table, self.services_table, self.serviceevents_table,
+                      self.records_table]
+            self.schema = schema.introspect(self.db_cursor, self.database, tables)
+            logger.debug("tables schema: %s",
+                         dict([(name, table.indexes) for name, table in self.schema.items()]))
+        return self.schema
+
+    @staticmethod
+    def table_columns(tables, table):
+        """Get the columns names of a table, an empty list if the table does not exist"""
+        if table not in tables:
+            return []
+        return tables[table].column_names()
+
+    @staticmethod
+    def check_indexes(table, required):
+        """Warn about the missing indexes that the rows updates depend on
+
+        :return: list of the missing indexes DDL
+        """
+        missing = schema.missing_indexes(table, required)
+        for _, columns, ddl in missing:
+            logger.warning("table %s has no index on (%s), the rows updates are full table "
+                           "scans. Create the index with: %s", table.name, ', '.join(columns), ddl)
+        return [ddl for _, _, ddl in missing]
+
+    def normalize(self, table, row):
+        """Normalize the row strings values to the table columns lengths and character set
+
+        :return: the row
+        """
+        normalizer = self.normalizers.get(table)
+        if normalizer is not None:
+            normalizer.normalize(row)
+        return row
+
+    def queue_row(self, table, row):
+        """Normalize a row to be queued for a bulk insert, intern its output and compress its
+        long values
+
+        :return: the row
+        """
+        self.normalize(table, row)
+        if self.outputs is not None and 'output' in row:
+            row['output'] = self.outputs.intern(row['output'])
+        if self.compressor is not None:
+            self.compressor.compress_row(row)
+        return row
 
     def create_select_query(self, table, data, where_data):
         """Create a select query for a table with provided data, and use where data for
@@ -356,6 +900,7 @@ class Glpidb_broker(BaseModule):
         else:
             logger.debug("Running query : %s", query)
 
+        start = time.time()
         try:
             if data:
                 self.db_cursor.execute(query, data)
@@ -366,6 +911,7 @@ class Glpidb_broker(BaseModule):
                 logger.debug("Ran: %s", self.db_cursor.statement)
                 rows = self.db_cursor.fetchall()
                 logger.debug("Got %d rows", len(rows))
+                self.metrics.observe('statement', time.time() - start, (('kind', 'select'),))
                 return len(rows)
 
             self.db.commit()
@@ -373,14 +919,18 @@ class Glpidb_broker(BaseModule):
 
             if 'INSERT' in self.db_cursor.statement:
                 logger.debug("Inserted %d rows", self.db_cursor.rowcount)
+                self.metrics.observe('statement', time.time() - start, (('kind', 'insert'),))
                 return self.db_cursor.rowcount
             if 'UPDATE' in self.db_cursor.statement:
                 logger.debug("Updated %d rows", self.db_cursor.rowcount)
+                self.metrics.observe('statement', time.time() - start, (('kind', 'update'),))
                 return self.db_cursor.rowcount
 
+            self.metrics.observe('statement', time.time() - start, (('kind', 'other'),))
             return 0
         except Exception as exp:
             logger.warning("A query raised an error: %s, error: %s, data: %s", query, exp, data)
+            self.metrics.counter('rollbacks')
             self.db.rollback()
             return -1
 
@@ -392,65 +942,365 @@ class Glpidb_broker(BaseModule):
         """Get all entry"""
         return self.db_cursor.fetchall()
 
+    def create_bulk_insert_query(self, table, data, ignore=False):
+        """Create an INSERT query for the table with the provided data, using positional
+        parameters as expected by the prepared cursor executemany
+
+        With ignore, the rows that duplicate a unique key are ignored (INSERT IGNORE)
+        """
+        fields = [u"`%s`" % (prop) for prop in data]
+        values = [u"%s" for prop in data]
+        query = u"INSERT %sINTO `%s` (%s) VALUES (%s)" % ('IGNORE ' if ignore else '', table,
+                                                          ', '.join(fields), ', '.join(values))
+        logger.info("Created a bulk insert query: %s", query)
+        return query
+
     def bulk_insert(self):
         """
         Periodically called (commit_period), this method prepares a bunch of queued
         insertions (max. commit_volume) to insert them in the DB.
         """
-        logger.debug("bulk insertion ... %d events in cache (max insertion is %d lines)",
-                     len(self.events_cache), self.commit_volume)
+        if self.events_state_changes:
+            logger.debug("services events: %d written, %d suppressed",
+                         self.events_written, self.events_suppressed)
+
+        if self.events_cache and not self.insert_services_events_query:
+            self.insert_services_events_query = self.create_bulk_insert_query(
+                self.serviceevents_table, self.events_cache[0], ignore=self.events_unique_key)
+
+        self.flush_cache(self.events_cache, self.insert_services_events_query,
+                         self.commit_volume, 'events', 'date',
+                         self.serviceevents_table not in self.non_transactional)
+
+    def bulk_insert_records(self):
+        """
+        Periodically called (records_commit_period), this method prepares a bunch of queued
+        records (max. records_commit_volume) to insert them in the DB.
+        """
+        if self.records_cache and not self.insert_records_query:
+            self.insert_records_query = self.create_bulk_insert_query(
+                self.records_table, self.records_cache[0])
+
+        self.flush_cache(self.records_cache, self.insert_records_query,
+                         self.records_commit_volume, 'records', 'last_check',
+                         self.records_table not in self.non_transactional)
+
+    def flush_rollups(self, now=None):
+        """
+        Periodically called (rollups_commit_period), this method adds the daily availability
+        counters changed since the last flush to the rollups table rows.
+
+        If now is provided, the time until now is accounted for all the items before flushing.
+        """
+        if self.rollups is None:
+            return
+
+        if now is not None:
+            self.rollups.close(now)
+
+        rows = self.rollups.pop_rows()
+        if not rows:
+            logger.debug("rollups ... nothing to update.")
+            return
+
+        if self.fake_db:
+            logger.debug("rollups, %d rows dropped (fake database)", len(rows))
+            return
 
-        if not self.events_cache:
+        if not self.is_connected:
+            if not self.open():
+                logger.warning("database is not connected and connection failed")
+                logger.warning("%d rollups rows to update in database", len(rows))
+                self.rollups.merge(rows)
+                return
+
+        now = time.time()
+        batches = split_rows(rows, self.batch_bytes, self.encoding)
+        try:
+            while batches:
+                if self.watchdog is not None:
+                    self.watchdog.beat('writer')
+                self.db_cursor_many.executemany(UPSERT_ROLLUPS % self.rollups_table, batches[0])
+                self.db.commit()
+                self.metrics.counter('rows', len(batches.pop(0)), (('table', 'rollups'),))
+            logger.info("Updated %d rollups rows (%2.4f seconds)", len(rows), time.time() - now)
+            self.metrics.observe('statement', time.time() - now, (('kind', 'upsert'),))
+        except Exception as exp:
+            rows = [row for batch in batches for row in batch]
+            logger.error("error '%s' when updating the rollups, %d rows kept for the next time",
+                         exp, len(rows))
+            self.rollups.merge(rows)
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.idle('writer')
+
+    def flush_cache(self, cache, query, volume, name, date_column=None, transactional=True):
+        # pylint: disable=too-many-arguments
+        """
+        Pop up to volume rows from the cache and insert them in the DB with the query
+
+        A failed batch is requeued at the head of the cache on a transient error, and the
+        next insertion is delayed (exponential backoff). On other errors, the batch is
+        bisected to insert the other rows and to isolate the poison rows, that are written
+        to the dead letters file. For a non transactional table, the rows are inserted one
+        by one and a failed batch insertion resumes after the failed row.
+
+        The date_column of the inserted rows is used to track the freshness lag
+        """
+        logger.debug("bulk insertion ... %d %s in cache (max insertion is %d lines)",
+                     len(cache), name, volume)
+
+        if not cache:
             logger.debug("bulk insertion ... nothing to insert.")
             return
 
+        self.limit_queue(cache, name)
+
+        backoff = self.retry_backoff.get(name)
+        if backoff is None:
+            backoff = self.retry_backoff[name] = Backoff(self.retry_delay, self.retry_max_delay)
+        if not backoff.ready():
+            logger.debug("%s insertion delayed after a failure", name)
+            return
+
         if not self.is_connected:
             if not self.open():
                 logger.warning("database is not connected and connection failed")
-                logger.warning("%d events to insert in database", len(self.events_cache))
+                logger.warning("%d %s to insert in database", len(cache), name)
                 return
 
-        logger.info("%d lines to insert in database (maximum is %d)",
-                    len(self.events_cache), self.commit_volume)
+        logger.info("%d %s lines to insert in database (maximum is %d)",
+                    len(cache), name, volume)
 
         now = time.time()
 
-        if not self.insert_services_events_query:
-            an_event = self.events_cache[0]
-            fields = [u"`%s`" % (prop) for prop in an_event]
-            values = [u"%s" for prop in an_event]
-            self.insert_services_events_query = u"INSERT INTO `%s` (%s) VALUES (%s)" % (
-                self.serviceevents_table, ', '.join(fields), ', '.join(values))
-            logger.info("Created an insert query: %s", self.insert_services_events_query)
-
-        # Flush all the stored log lines
-        some_events = []
+        # Flush the stored lines, up to volume rows and batch_bytes bytes
+        some_rows = []
 
         try:
-            while True:
-                try:
-                    event = self.events_cache.popleft()
-                    some_events.append(event.values())
-                    if len(some_events) >= self.commit_volume:
-                        break
-                except IndexError:
-                    logger.debug("prepared all available events for commit")
-                    break
-
-            if some_events:
-                logger.debug("Events, %d rows to insert", len(some_events))
-
-                self.db_cursor_many.executemany(self.insert_services_events_query, some_events)
-                self.db.commit()
-                logger.info("Inserted %d rows (%2.4f seconds)",
-                            self.db_cursor_many.rowcount, time.time() - now)
+            some_rows, size, cut = take_batch(cache, volume, self.batch_bytes, self.encoding)
+            if cut:
+                self.metrics.counter('size_limited_batches', labels=(('table', name),))
+
+            if some_rows and self.fake_db:
+                logger.debug("%s, %d rows dropped (fake database)", name, len(some_rows))
+                return
+
+            if some_rows:
+                logger.debug("%s, %d rows to insert", name, len(some_rows))
+
+                result = bisect_insert(
+                    lambda batch: self.insert_batch(query, batch, transactional), some_rows)
+                self.insert_latency = time.time() - now
+                logger.info("Inserted %d %s rows (%2.4f seconds)",
+                            result.inserted, name, self.insert_latency)
+                self.metrics.observe('statement', self.insert_latency,
+                                     (('kind', 'executemany'),))
+                self.metrics.counter('rows', result.inserted, (('table', name),))
+                self.metrics.counter('bytes', size, (('table', name),))
+                if result.batches > 1:
+                    self.metrics.counter('bisected_batches', result.batches - 1,
+                                         (('table', name),))
+
+                failed = set([id(row) for row, _ in result.poison] +
+                             [id(row) for row in result.requeue])
+                if date_column:
+                    self.observe_batch_freshness(name, [
+                        (row['host_name'], row[date_column]) for row in some_rows
+                        if id(row) not in failed])
+
+                if result.poison:
+                    self.metrics.counter('errors', len(result.poison), (('table', name),))
+                    logger.error("%d %s rows can not be inserted, first error: %s",
+                                 len(result.poison), name, result.poison[0][1])
+                    if self.dead_letters is not None:
+                        self.dead_letters.write(name, result.poison)
+                        self.metrics.counter('dead_letters', len(result.poison),
+                                             (('table', name),))
+
+                if result.requeue:
+                    cache.extendleft(reversed(result.requeue))
+                    self.metrics.counter('retries', len(result.requeue), (('table', name),))
+                    logger.warning("error '%s' when inserting %s rows, %d rows requeued, "
+                                   "next try in %ds", result.error, name, len(result.requeue),
+                                   backoff.failed())
+                    if is_connection_lost(result.error):
+                        # The connection is opened again for the next try
+                        self.close()
+                else:
+                    backoff.succeeded()
         except Exception as exp:
             logger.warning("Exception: %s / %s / %s", type(exp), str(exp), traceback.print_exc())
-            logger.error("error '%s' when executing query: %s", exp, some_events)
+            logger.error("error '%s' when executing query: %s", exp, some_rows)
+            self.metrics.counter('errors', len(some_rows), (('table', name),))
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.idle('writer')
+
+    def limit_queue(self, cache, name):
+        """Drop the oldest rows of a queue holding more than max_queue_length rows"""
+        excess = len(cache) - self.max_queue_length
+        if not self.max_queue_length or excess <= 0:
+            return
+        for _ in range(excess):
+            cache.popleft()
+        self.metrics.counter('dropped_rows', excess, (('table', name),))
+        logger.error("%s queue is full (%d rows), the %d oldest rows are dropped",
+                     name, self.max_queue_length, excess)
+
+    def insert_batch(self, query, rows, transactional=True):
+        """Insert and commit a batch of rows, the batch is rolled back if it failed
+
+        For a non transactional table, the inserted rows of a failed batch are not rolled
+        back: the rows are inserted one by one and a PartialInsertError is raised with the
+        count of the inserted rows"""
+        if self.watchdog is not None:
+            self.watchdog.beat('writer')
+        inserted = 0
+        try:
+            if self.compressor is not None:
+                values = [expand_row(row) for row in rows]
+            else:
+                values = [tuple(row.values()) for row in rows]
+            if transactional:
+                self.db_cursor_many.executemany(query, values)
+            else:
+                for row in values:
+                    self.db_cursor_many.execute(query, row)
+                    inserted += 1
+            self.db.commit()
+        except Exception as error:
+            if not transactional:
+                six.raise_from(PartialInsertError(error, inserted), error)
+            try:
+                self.db.rollback()
+            except Exception as exp:  # pylint: disable=broad-except
+                logger.debug("rollback error: %s", exp)
+            raise
+
+    def observe_freshness(self, table, host_name, last_chk, now=None):
+        """Track the freshness lag of a committed row: elapsed time since its check"""
+        if now is None:
+            now = time.time()
+        realm = self.hosts_cache.get(host_name, {}).get('realm_name', 'All')
+        self.metrics.summarize('freshness', now - last_chk, (('table', table), ('realm', realm)))
+
+    def observe_batch_freshness(self, table, dates):
+        """Track the freshness lag of a committed batch of rows
+
+        :param dates: list of (host_name, date string) of the committed rows
+        """
+        now = time.time()
+        # Many rows of a batch share the same date
+        timestamps = {}
+        for host_name, date in dates:
+            timestamp = timestamps.get(date)
+            if timestamp is None:
+                timestamp = timestamps[date] = time.mktime(
+                    time.strptime(date, '%Y-%m-%d %H:%M:%S'))
+            self.observe_freshness(table, host_name, timestamp, now)
+
+    def check_freshness(self):
+        """Warn if the freshness lag 95th percentile is greater than the freshness SLA
+
+        :return: list of (table, realm, p95) above the SLA
+        """
+        late = []
+        if not self.freshness_sla:
+            return late
+        for labels, p95 in self.metrics.percentiles_of('freshness', 0.95):
+            if p95 > self.freshness_sla:
+                table, realm = labels[0][1], labels[1][1]
+                logger.warning("freshness lag of the %s in the realm %s is %.1fs (p95), "
+                               "greater than the SLA (%ds)", table, realm, p95, self.freshness_sla)
+                late.append((table, realm, p95))
+        return late
+
+    def is_recorded_service(self, service_description):
+        """Is the service one of the services for which records are stored?"""
+        if service_description in self.records_names:
+            return True
+        if self.records_pattern is not None:
+            return self.records_pattern.match(service_description) is not None
+        return False
+
+    def is_event_to_record(self, item_cache, b):
+        """Is the check result an event to record in the services events table?
+
+        In state changes mode, an event is recorded only if the state or the state type of
+        the item changed since the last recorded event, or if no event was recorded since
+        more than events_heartbeat seconds.
+
+        A replayed event (same item, check time and state as a recent event) is dropped.
+
+        The last recorded state is stored in the item cache"""
+        if self.events_keys is not None and self.events_keys.seen(event_key(
+                b.data['host_name'], b.data.get('service_description'), b.data['last_chk'],
+                b.data.get('state_id', 4), b.data.get('state_type_id', 4))):
+            self.metrics.counter('events_duplicates')
+            return False
+
+        if not self.events_state_changes:
+            self.events_written += 1
+            return True
+
+        state = (b.data.get('state_id', 4), b.data.get('state_type_id', 4))
+        last_chk = int(b.data['last_chk'])
+        if item_cache.get('event_state') != state or (
+                self.events_heartbeat and
+                last_chk - item_cache.get('event_time', 0) >= self.events_heartbeat):
+            item_cache['event_state'] = state
+            item_cache['event_time'] = last_chk
+            self.events_written += 1
+            return True
+
+        self.events_suppressed += 1
+        return False
+
+    def is_stale(self, item_cache, b):
+        """Is the check result older than the last recorded check result of the item?
+
+        The broks of several schedulers, or delayed in the broker queue, may be received out
+        of order: an older check result would overwrite a newer state.
+
+        The newest recorded check time is stored in the item cache"""
+        last_chk = int(b.data['last_chk'])
+        if last_chk < item_cache.get('last_chk', 0):
+            self.metrics.counter('stale_results', labels=(('type', b.type),))
+            return True
+        item_cache['last_chk'] = last_chk
+        return False
+
+    def is_unavailable(self, item_cache, b):
+        """Update the item unavailability with the check result and return the new value
+
+        An unavailability starts with a HARD non-OK state and ends with a HARD OK state,
+        the SOFT states do not change the current unavailability.
+
+        The current unavailability is stored in the item cache"""
+        if b.data.get('state_type_id', 4) == 1:
+            item_cache['unavailable'] = b.data.get('state_id', 4) != 0
+        return item_cache.get('unavailable', False)
 
     def manage_brok(self, brok):
         """Got a brok, manage only the interesting broks"""
-        logger.debug("Got a brok: %s", brok)
+        debug = self.debug_enabled
+        if debug:
+            logger.debug("Got a brok: %s", brok)
+
+        if self.capture is not None:
+            try:
+                self.capture.write(brok.type, brok.data)
+            except (IOError, OSError) as exp:
+                logger.error("brok capture error: %s, capture is disabled", exp)
+                self.capture.close()
+                self.capture = None
+
+        # The brok names are shared with the caches and the queued rows
+        if self.names is not None and isinstance(brok.data, dict):
+            for key in ('host_name', 'service_description'):
+                if key in brok.data:
+                    brok.data[key] = self.names.intern(brok.data[key])
 
         # Not used currently - may be used to update Alignak status in the DB!
         # if b.type == 'program_status':
@@ -466,7 +1316,8 @@ class Glpidb_broker(BaseModule):
         if brok.type == 'initial_host_status':
             # Prepare the known hosts cache
             host_name = brok.data['host_name']
-            logger.debug("got initial host status: %s", host_name)
+            if debug:
+                logger.debug("got initial host status: %s", host_name)
 
             self.hosts_cache[host_name] = {
                 'realm_name': brok.data.get('realm_name', brok.data.get('realm', 'All'))
@@ -474,7 +1325,8 @@ class Glpidb_broker(BaseModule):
 
             try:
                 # Data used for DB updates
-                logger.debug("initial host status: %s : %s", host_name, brok.data['customs'])
+                if debug:
+                    logger.debug("initial host status: %s : %s", host_name, brok.data['customs'])
                 cached_item = True
                 self.hosts_cache[host_name].update({
                     'hostsid': brok.data['customs']['_HOSTSID'],
@@ -484,17 +1336,22 @@ class Glpidb_broker(BaseModule):
             except Exception:
                 cached_item = False
                 self.hosts_cache[host_name].update({'items_id': None})
-                logger.debug("no custom _HOSTID and/or _ITEMTYPE and/or _ITEMSID for %s",
-                             host_name)
+                if debug:
+                    logger.debug("no custom _HOSTID and/or _ITEMTYPE and/or _ITEMSID for %s",
+                                 host_name)
 
-            if self.update_hosts or self.update_services_events:
+            if self.update_hosts or self.update_services_events or self.update_rollups:
                 start = time.time()
                 self.record_host_check_result(brok, cached_item, True)
-                logger.debug("host check result: %s, (%2.4f seconds)",
-                             host_name, time.time() - start)
+                self.metrics.observe('row_building', time.time() - start,
+                                     (('item', 'host'),))
+                if debug:
+                    logger.debug("host check result: %s, (%2.4f seconds)",
+                                 host_name, time.time() - start)
 
-            logger.info("initial host status: %s, items_id=%s", host_name,
-                        self.hosts_cache[host_name]['items_id'])
+            if self.log_sampler.sample('initial host status'):
+                logger.info("initial host status: %s, items_id=%s (1 in %d logged)", host_name,
+                            self.hosts_cache[host_name]['items_id'], self.log_sampler.every)
 
         # Build initial service state cache
         if brok.type == 'initial_service_status':
@@ -502,14 +1359,18 @@ class Glpidb_broker(BaseModule):
             host_name = brok.data['host_name']
             service_description = brok.data['service_description']
             service_id = host_name + "/" + service_description
-            logger.debug("got initial service status: %s", service_id)
+            if debug:
+                logger.debug("got initial service status: %s", service_id)
 
             if host_name not in self.hosts_cache:
-                logger.error("initial service status, host is unknown: %s.", service_id)
+                if self.log_sampler.allow('unknown host'):
+                    logger.error("initial service status, host is unknown: %s.", service_id)
                 return
 
             try:
-                logger.debug("initial service status: %s : %s", service_id, brok.data['customs'])
+                if debug:
+                    logger.debug("initial service status: %s : %s", service_id,
+                                 brok.data['customs'])
                 cached_item = True
                 self.services_cache[service_id] = {
                     'items_id': brok.data['customs']['_ITEMSID']
@@ -517,71 +1378,113 @@ class Glpidb_broker(BaseModule):
             except Exception:
                 cached_item = False
                 self.services_cache[service_id] = {'items_id': None}
-                logger.debug("no custom _ITEMTYPE and/or _ITEMSID for %s", service_id)
+                if debug:
+                    logger.debug("no custom _ITEMTYPE and/or _ITEMSID for %s", service_id)
 
-            if self.update_services or self.update_services_events:
+            if self.update_services or self.update_services_events or self.update_records or \
+                    self.update_rollups:
                 start = time.time()
                 self.record_service_check_result(brok, cached_item, True)
-                logger.debug("service check result: %s, (%2.4f seconds)",
-                             service_id, time.time() - start)
+                self.metrics.observe('row_building', time.time() - start,
+                                     (('item', 'service'),))
+                if debug:
+                    logger.debug("service check result: %s, (%2.4f seconds)",
+                                 service_id, time.time() - start)
 
-            logger.info("initial service status: %s, items_id=%s",
-                        service_id, self.services_cache[service_id]['items_id'])
+            if self.log_sampler.sample('initial service status'):
+                logger.info("initial service status: %s, items_id=%s (1 in %d logged)",
+                            service_id, self.services_cache[service_id]['items_id'],
+                            self.log_sampler.every)
 
         # Manage host check result if host is defined in Glpi DB
         if brok.type == 'host_check_result' and \
-                (self.update_hosts or self.update_services_events):
+                (self.update_hosts or self.update_services_events or self.update_rollups):
             host_name = brok.data['host_name']
-            logger.debug("host check result: %s", host_name)
+            if debug:
+                logger.debug("host check result: %s", host_name)
 
             if host_name not in self.hosts_cache:
-                logger.debug("got a host check result for an unknown host: %s", host_name)
+                if debug:
+                    logger.debug("got a host check result for an unknown host: %s", host_name)
                 return
 
             cached_item = True
             if self.hosts_cache[host_name]['items_id'] is None:
-                logger.debug("unknown DB information for the host: %s", host_name)
+                if debug:
+                    logger.debug("unknown DB information for the host: %s", host_name)
                 cached_item = False
 
             start = time.time()
             self.record_host_check_result(brok, cached_item)
-            logger.debug("host check result: %s, (%2.4f seconds)",
-                         host_name, time.time() - start)
+            self.metrics.observe('row_building', time.time() - start, (('item', 'host'),))
+            if debug:
+                logger.debug("host check result: %s, (%2.4f seconds)",
+                             host_name, time.time() - start)
 
         # Manage service check result if service is defined in Glpi DB
         if brok.type == 'service_check_result' and \
-                (self.update_services or self.update_services_events):
+                (self.update_services or self.update_services_events or self.update_records or
+                 self.update_rollups):
             host_name = brok.data['host_name']
             service_description = brok.data['service_description']
             service_id = host_name + "/" + service_description
-            logger.debug("service check result: %s", service_id)
+            if debug:
+                logger.debug("service check result: %s", service_id)
 
             if host_name not in self.hosts_cache:
-                logger.debug("service check result for an unknown host: %s", service_id)
+                if debug:
+                    logger.debug("service check result for an unknown host: %s", service_id)
                 return
 
             cached_item = True
             if self.hosts_cache[host_name]['items_id'] is None:
-                logger.debug("unknown DB information for the host: %s", host_name)
+                if debug:
+                    logger.debug("unknown DB information for the host: %s", host_name)
                 cached_item = False
 
             if self.services_cache[service_id]['items_id'] is None:
-                logger.debug("unknown DB information for the service: %s", service_id)
+                if debug:
+                    logger.debug("unknown DB information for the service: %s", service_id)
                 cached_item = False
 
             start = time.time()
             self.record_service_check_result(brok, cached_item)
-            logger.debug("service check result: %s, (%2.4f seconds)",
-                         service_id, time.time() - start)
+            self.metrics.observe('row_building', time.time() - start, (('item', 'service'),))
+            if debug:
+                logger.debug("service check result: %s, (%2.4f seconds)",
+                             service_id, time.time() - start)
 
     def record_host_check_result(self, b, cached_item, initial_status=False):
         """Record an host check result"""
         host_name = b.data['host_name']
         host_cache = self.hosts_cache[host_name]
-        logger.debug("record host check result: %s: %s", host_name, b.data)
+        if self.debug_enabled:
+            logger.debug("record host check result: %s: %s", host_name, b.data)
+
+        if self.drop_stale_results and self.is_stale(host_cache, b):
+            if self.debug_enabled:
+                logger.debug("dropped an out of order host check result: %s", host_name)
+            return
+
+        if initial_status and self.events_state_changes:
+            # The initial state is the reference for the next state changes
+            host_cache['event_state'] = (b.data.get('state_id', 4),
+                                         b.data.get('state_type_id', 4))
+            host_cache['event_time'] = int(b.data['last_chk'])
+
+        unavailable = False
+        if self.update_availability:
+            unavailable = self.is_unavailable(host_cache, b)
+
+        if self.rollups is not None:
+            self.rollups.update((host_name, self.hostcheck), b.data['last_chk'],
+                                b.data.get('state_id', 4), b.data.get('state_type_id', 4),
+                                b.data.get('problem_has_been_acknowledged', False),
+                                b.data.get('last_hard_state_id', 0))
 
         # Insert into serviceevents log table
-        if self.update_services_events and not initial_status:
+        if self.update_services_events and not initial_status and \
+                self.is_event_to_record(host_cache, b):
             # SQL table is: CREATE TABLE IF NOT EXISTS `glpi_plugin_monitoring_serviceevents` (
             #   `id` bigint(30) NOT NULL AUTO_INCREMENT,
             #   `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
@@ -605,13 +1508,14 @@ class Glpidb_broker(BaseModule):
             #   KEY `service` (`host_name`(50),`service_description`(50)),
             #   KEY `unavailability` (`unavailability`,`state_type`,`plugin_monitoring_services_id`)
             # ) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
-            logger.debug("append data to events_cache for host check: %s", host_name)
+            if self.debug_enabled:
+                logger.debug("append data to events_cache for host check: %s", host_name)
             data = {
                 'host_name': b.data['host_name'],
                 'service_description': self.hostcheck,
                 'date': datetime.datetime.fromtimestamp(int(b.data['last_chk'])).strftime(
                     '%Y-%m-%d %H:%M:%S'),
-                'output': ("%s\n%s", b.data['output'], b.data['long_output']) if (
+                'output': "%s\n%s" % (b.data['output'], b.data['long_output']) if (
                     b.data['long_output']) else b.data['output'],
                 'perf_data': b.data['perf_data'],
                 # Use 4 (unknown usual code) if value does not exist in the brok
@@ -620,11 +1524,17 @@ class Glpidb_broker(BaseModule):
                 'last_state_id': b.data.get('last_state_id', 4),
                 'last_hard_state_id': b.data.get('last_hard_state_id', 4),
             }
+            if self.update_availability:
+                data.update({
+                    'state': b.data['state'],
+                    'state_type': b.data['state_type'],
+                    'unavailability': 1 if unavailable else 0
+                })
             # if cached_item:
             #     data['plugin_monitoring_services_id'] = host_cache['items_id']
 
             # Append to bulk insert queue ...
-            self.events_cache.append(data)
+            self.events_cache.append(self.queue_row(self.serviceevents_table, data))
 
         # Update hosts state table
         if not self.update_hosts:
@@ -668,6 +1578,7 @@ class Glpidb_broker(BaseModule):
             'is_acknowledged': '1' if b.data['problem_has_been_acknowledged'] else '0'
         }
 
+        self.normalize(self.hosts_table, data)
         if not self.update_hosts_query:
             where_clause = {
                 'host_name': b.data['host_name']
@@ -680,8 +1591,12 @@ class Glpidb_broker(BaseModule):
             rows_affected = self.execute_query(self.update_hosts_query, data)
             if rows_affected:
                 updated = True
+                self.metrics.counter('rows', labels=(('table', 'hosts'),))
+                self.observe_freshness('hosts', host_name, b.data['last_chk'])
         except Exception as exp:
-            logger.error("error '%s', query: %s, data: %s", exp, self.update_hosts_query, data)
+            if self.log_sampler.allow('host update error'):
+                logger.error("error '%s', query: %s, data: %s", exp, self.update_hosts_query,
+                             data)
 
         if not updated and self.create_data and initial_status:
             try:
@@ -695,13 +1610,15 @@ class Glpidb_broker(BaseModule):
                 if not self.execute_query(self.select_hosts_query, data):
                     self.execute_query(self.insert_hosts_query, data)
                     updated = True
-                    logger.warning("Created a new host status row for %s with data: %s",
-                                   host_name, data)
+                    if self.log_sampler.allow('host row created'):
+                        logger.warning("Created a new host status row for %s with data: %s",
+                                       host_name, data)
             except Exception as exp:
-                logger.error("error '%s' when executing a query: %s with data: %s",
-                             exp, self.update_hosts_query, data)
+                if self.log_sampler.allow('host insert error'):
+                    logger.error("error '%s' when executing a query: %s with data: %s",
+                                 exp, self.update_hosts_query, data)
 
-        if not updated:
+        if not updated and self.log_sampler.allow('host update failed'):
             logger.warning("DB host status update failed for %s with data: %s",
                            host_name, data)
 
@@ -711,10 +1628,33 @@ class Glpidb_broker(BaseModule):
         service_description = b.data['service_description']
         service_id = host_name + "/" + service_description
         service_cache = self.services_cache[service_id]
-        logger.debug("service check result: %s: %s", service_id, b.data)
+        if self.debug_enabled:
+            logger.debug("service check result: %s: %s", service_id, b.data)
+
+        if self.drop_stale_results and self.is_stale(service_cache, b):
+            if self.debug_enabled:
+                logger.debug("dropped an out of order service check result: %s", service_id)
+            return
+
+        if initial_status and self.events_state_changes:
+            # The initial state is the reference for the next state changes
+            service_cache['event_state'] = (b.data.get('state_id', 4),
+                                            b.data.get('state_type_id', 4))
+            service_cache['event_time'] = int(b.data['last_chk'])
+
+        unavailable = False
+        if self.update_availability:
+            unavailable = self.is_unavailable(service_cache, b)
+
+        if self.rollups is not None:
+            self.rollups.update((host_name, service_description), b.data['last_chk'],
+                                b.data.get('state_id', 4), b.data.get('state_type_id', 4),
+                                b.data.get('problem_has_been_acknowledged', False),
+                                b.data.get('last_hard_state_id', 0))
 
         # Insert into serviceevents log table
-        if self.update_services_events and not initial_status:
+        if self.update_services_events and not initial_status and \
+                self.is_event_to_record(service_cache, b):
             # SQL table is: CREATE TABLE IF NOT EXISTS `glpi_plugin_monitoring_serviceevents` (
             #   `id` bigint(30) NOT NULL AUTO_INCREMENT,
             #   `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
@@ -738,13 +1678,14 @@ class Glpidb_broker(BaseModule):
             #   KEY `service` (`host_name`(50),`service_description`(50)),
             #   KEY `unavailability` (`unavailability`,`state_type`,`plugin_monitoring_services_id`)
             # ) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
-            logger.debug("append data to events_cache for service: %s", service_id)
+            if self.debug_enabled:
+                logger.debug("append data to events_cache for service: %s", service_id)
             data = {
                 'host_name': b.data['host_name'],
                 'service_description': b.data['service_description'],
                 'date': datetime.datetime.fromtimestamp(int(b.data['last_chk'])).strftime(
                     '%Y-%m-%d %H:%M:%S'),
-                'output': ("%s\n%s", b.data['output'], b.data['long_output']) if (
+                'output': "%s\n%s" % (b.data['output'], b.data['long_output']) if (
                     b.data['long_output']) else b.data['output'],
                 'perf_data': b.data['perf_data'],
                 # Use 4 (unknown usual code) if value does not exist in the brok
@@ -753,35 +1694,44 @@ class Glpidb_broker(BaseModule):
                 'last_state_id': b.data.get('last_state_id', 4),
                 'last_hard_state_id': b.data.get('last_hard_state_id', 4),
             }
+            if self.update_availability:
+                data.update({
+                    'state': b.data['state'],
+                    'state_type': b.data['state_type'],
+                    'unavailability': 1 if unavailable else 0
+                })
             # if cached_item:
             #     data['plugin_monitoring_services_id'] = service_cache['items_id']
 
             # Append to bulk insert queue ...
-            self.events_cache.append(data)
+            self.events_cache.append(self.queue_row(self.serviceevents_table, data))
 
         # Record performance data for specific services
-        if self.update_records and service_description in self.records_services:
-            data = {
-                'host_name': b.data['host_name'],
-                'service_description': b.data['service_description'],
-
-                'last_check': datetime.datetime.fromtimestamp(int(b.data['last_chk'])).strftime(
-                    '%Y-%m-%d %H:%M:%S'),
-                'source': self.source,
-                'output': "%s\n%s" % (b.data['output'], b.data['long_output']) if (
-                    b.data['long_output']) else b.data['output'],
-                'perf_data': b.data['perf_data']
-            }
-            if not self.insert_records_query:
-                self.insert_records_query = self.create_insert_query(self.records_table, data)
+        if self.update_records and self.is_recorded_service(service_description):
+            if self.debug_enabled:
+                logger.debug("append data to records_cache for service: %s", service_id)
+            if self.records_aggregator is not None:
+                # Only closed windows are appended to the bulk insert queue
+                self.records_cache.extend([
+                    self.queue_row(self.records_table, row)
+                    for row in self.records_aggregator.add(
+                        host_name, service_description, b.data['last_chk'],
+                        b.data['perf_data'], b.data['output'])])
+            else:
+                data = {
+                    'host_name': b.data['host_name'],
+                    'service_description': b.data['service_description'],
+
+                    'last_check': datetime.datetime.fromtimestamp(
+                        int(b.data['last_chk'])).strftime('%Y-%m-%d %H:%M:%S'),
+                    'source': self.source,
+                    'output': "%s\n%s" % (b.data['output'], b.data['long_output']) if (
+                        b.data['long_output']) else b.data['output'],
+                    'perf_data': b.data['perf_data']
+                }
 
-            try:
-                rows_affected = self.execute_query(self.insert_records_query, data)
-                if rows_affected:
-                    logger.info("Created a new record for %s with data: %s", service_id, data)
-            except Exception as exp:
-                logger.error("error '%s', query: %s, data: %s", exp, self.update_services_query,
-                             data)
+                # Append to bulk insert queue ...
+                self.records_cache.append(self.queue_row(self.records_table, data))
 
         # Update service state table
         if not self.update_services:
@@ -831,6 +1781,7 @@ class Glpidb_broker(BaseModule):
             'is_acknowledged': '1' if b.data['problem_has_been_acknowledged'] else '0'
         }
 
+        self.normalize(self.services_table, data)
         if not self.update_services_query:
             where_clause = {
                 'host_name': b.data['host_name'],
@@ -844,8 +1795,12 @@ class Glpidb_broker(BaseModule):
             rows_affected = self.execute_query(self.update_services_query, data)
             if rows_affected:
                 updated = True
+                self.metrics.counter('rows', labels=(('table', 'services'),))
+                self.observe_freshness('services', host_name, b.data['last_chk'])
         except Exception as exp:
-            logger.error("error '%s', query: %s, data: %s", exp, self.update_services_query, data)
+            if self.log_sampler.allow('service update error'):
+                logger.error("error '%s', query: %s, data: %s", exp, self.update_services_query,
+                             data)
 
         if not updated and self.create_data and initial_status:
             try:
@@ -859,13 +1814,15 @@ class Glpidb_broker(BaseModule):
                 updated = True
                 if not self.execute_query(self.select_services_query, data):
                     self.execute_query(self.insert_services_query, data)
-                    logger.warning("Created a new service status row for %s with data: %s",
-                                   service_id, data)
+                    if self.log_sampler.allow('service row created'):
+                        logger.warning("Created a new service status row for %s with data: %s",
+                                       service_id, data)
             except Exception as exp:
-                logger.error("error '%s' when executing a query: %s with data: %s",
-                             exp, self.update_services_query, data)
+                if self.log_sampler.allow('service insert error'):
+                    logger.error("error '%s' when executing a query: %s with data: %s",
+                                 exp, self.update_services_query, data)
 
-        if not updated:
+        if not updated and self.log_sampler.allow('service update failed'):
             logger.warning("DB service status update failed for %s with data: %s",
                            service_id, data)
 
@@ -1028,6 +1985,76 @@ class Glpidb_broker(BaseModule):
         data['_timestamp'] = time.time()
         self.schedulers[c_id].update(data)
 
+    def collect_metrics(self):
+        """Update the queues and caches gauges and get the module internal metrics
+
+        Called by export_metrics in the main loop, and by the replay and benchmarks reports
+
+        :return: dictionary of the metrics
+        """
+        self.metrics.gauge('events_cache', len(self.events_cache))
+        age = 0
+        if self.events_cache:
+            age = time.time() - time.mktime(time.strptime(self.events_cache[0]['date'],
+                                                          '%Y-%m-%d %H:%M:%S'))
+        self.metrics.gauge('events_cache_age', age)
+        self.metrics.gauge('records_cache', len(self.records_cache))
+        if self.records_aggregator is not None:
+            self.metrics.gauge('late_records', self.records_aggregator.late)
+        for table, normalizer in self.normalizers.items():
+            self.metrics.gauge('truncated_values', normalizer.truncated, (('table', table),))
+            self.metrics.gauge('cleaned_values', normalizer.cleaned, (('table', table),))
+        for name, table in [('names', self.names), ('outputs', self.outputs)]:
+            if table is not None:
+                self.metrics.gauge('interned_strings', len(table), (('table', name),))
+                self.metrics.gauge('interned_hits', table.hits, (('table', name),))
+                self.metrics.gauge('interned_evictions', table.evictions, (('table', name),))
+        if self.compressor is not None:
+            self.metrics.gauge('compressed_values', self.compressor.count)
+            self.metrics.gauge('compression_ratio', self.compressor.ratio())
+        try:
+            self.metrics.gauge('queue', self.to_q.qsize())
+        except (AttributeError, NotImplementedError):
+            # No queue (not yet started) or qsize not implemented on this platform
+            pass
+        return self.metrics.get_stats()
+
+    def export_metrics(self):
+        """Periodically called (metrics_period), export the module internal metrics
+        with the Alignak stats manager and/or to a Prometheus text file"""
+        stats = self.collect_metrics()
+        logger.debug("metrics: %s", stats)
+        self.check_freshness()
+
+        if self.statsmgr is not None:
+            self.metrics.send_stats(self.statsmgr)
+
+        if self.metrics_textfile:
+            try:
+                self.metrics.write_textfile(self.metrics_textfile)
+            except (IOError, OSError) as exp:
+                logger.warning("metrics text file %s writing error: %s",
+                               self.metrics_textfile, exp)
+
+    def log_summary(self):
+        """Periodically called (log_summary_period), log the number of broks managed and
+        the number of log messages not logged since the last summary"""
+        broks = {}
+        for labels, value in self.metrics.counters_of('broks'):
+            brok_type = labels[0][1]
+            broks[brok_type] = value - self.log_summary_broks.get(brok_type, 0)
+            self.log_summary_broks[brok_type] = value
+        counts, suppressed = self.log_sampler.summary()
+        if any(broks.values()):
+            logger.info("managed broks: %s", ', '.join(
+                ['%s=%d' % (brok_type, count) for brok_type, count in sorted(broks.items())
+                 if count]))
+        if suppressed:
+            logger.info("not logged messages: %s", ', '.join(
+                ['%s=%d/%d' % (kind, count, counts[kind])
+                 for kind, count in sorted(suppressed.items())]))
+        return broks, suppressed
+
     def main(self):
         self.set_proctitle(self.name)
         self.set_exit_handler()
@@ -1035,12 +2062,43 @@ class Glpidb_broker(BaseModule):
         # Open database connection
         self.open()
 
+        if self.watchdog is not None:
+            self.watchdog.beat('main loop')
+            self.watchdog.start()
+
+        if self.profile_start:
+            self.start_profiling()
+
+        self.start_partitions()
+        self.start_purge()
+
         db_commit_next_time = time.time()
+        db_records_next_time = time.time()
+        db_rollups_next_time = time.time() + self.rollups_commit_period
         db_test_connection = time.time()
+        metrics_next_time = time.time() + self.metrics_period
+        log_summary_next_time = time.time() + self.log_summary_period
 
         while not self.interrupted:
-            logger.debug("queue length: %s", self.to_q.qsize())
+            # The log level may be changed while running
+            self.debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            if self.debug_enabled:
+                logger.debug("queue length: %s", self.to_q.qsize())
             start = time.time()
+            if self.watchdog is not None:
+                self.watchdog.beat('main loop')
+
+            # Main loop profiling
+            if self.profiling_requested:
+                self.profiling_requested = False
+                if self.profiler is None:
+                    self.start_profiling()
+                else:
+                    self.stop_profiling()
+            if self.profiler is not None:
+                self.profiler.turn()
+                if self.profiler.finished():
+                    self.stop_profiling()
 
             # DB connection test ?
             if self.db_test_period and db_test_connection < start:
@@ -1052,6 +2110,7 @@ class Glpidb_broker(BaseModule):
                     if not self.is_connected:
                         try:
                             logger.info("Trying to reconnect database ...")
+                            self.metrics.counter('reconnects')
                             self.db.reconnect(attempts=3, delay=10)
                             logger.info("Succesfull database reconnection...")
                         except Exception:
@@ -1065,14 +2124,46 @@ class Glpidb_broker(BaseModule):
                 db_commit_next_time = start + self.commit_period
                 self.bulk_insert()
 
+            # Records bulk insert
+            if self.update_records and db_records_next_time < start:
+                logger.debug("Records commit time ...")
+                db_records_next_time = start + self.records_commit_period
+                if self.records_aggregator is not None:
+                    # Close the windows of the services that are not checked anymore
+                    self.records_cache.extend([
+                        self.queue_row(self.records_table, row)
+                        for row in self.records_aggregator.expire(start)])
+                self.bulk_insert_records()
+
+            # Daily availability rollups
+            if self.rollups is not None and db_rollups_next_time < start:
+                logger.debug("Rollups commit time ...")
+                db_rollups_next_time = start + self.rollups_commit_period
+                self.flush_rollups()
+
+            # Internal metrics
+            if self.metrics_period and metrics_next_time < start:
+                metrics_next_time = start + self.metrics_period
+                self.export_metrics()
+
+            # Per item logs summary
+            if self.log_summary_period and log_summary_next_time < start:
+                log_summary_next_time = start + self.log_summary_period
+                self.log_summary()
+
             try:
                 message = self.to_q.get_nowait()
                 for brok in message:
+                    brok_start = time.time()
                     brok.prepare()
                     self.manage_brok(brok)
+                    labels = (('type', brok.type),)
+                    self.metrics.counter('broks', labels=labels)
+                    self.metrics.observe('manage_brok', time.time() - brok_start, labels)
 
-                logger.debug("time to manage %d broks (%2.4f seconds)",
-                             len(message), time.time() - start)
+                if self.debug_enabled:
+                    logger.debug("time to manage %d broks (%2.4f seconds)",
+                                 len(message), time.time() - start)
             except queue.Full:
                 logger.warning("Worker control queue is full")
             except queue.Empty:
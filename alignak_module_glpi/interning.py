@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides bounded interning tables for the repeated strings of the broks.
+
+Each received brok holds its own copy of the host name, the service description and the
+check output, that are kept in the queued rows until they are inserted. An interning table
+maps a string to its first seen copy, so that the equal strings of the queued rows and of the
+caches share the same object. The table size is bounded: the least recently used strings are
+evicted, they stay shared by the rows that already use them.
+"""
+
+from collections import OrderedDict
+
+import six
+
+# Longer strings are not interned: the exact duplicates are the short status lines
+MAX_LENGTH = 256
+
+
+class StringTable(object):
+    """
+    A bounded table of interned strings, with the least recently used strings evicted
+    """
+
+    def __init__(self, size=10000, max_length=MAX_LENGTH):
+        self.size = size
+        self.max_length = max_length
+        self.strings = OrderedDict()
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, value):
+        """Get the interned copy of a string, other values are returned as they are"""
+        if not isinstance(value, six.string_types) or len(value) > self.max_length:
+            return value
+        interned = self.strings.get(value)
+        if interned is not None:
+            # Most recently used (OrderedDict.move_to_end is not available with Python 2)
+            self.strings[value] = self.strings.pop(value)
+            self.hits += 1
+            return interned
+        if len(self.strings) >= self.size:
+            self.strings.popitem(last=False)
+            self.evictions += 1
+        self.strings[value] = value
+        return value
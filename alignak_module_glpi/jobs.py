@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides the base of the database maintenance jobs run in a background thread,
+with a dedicated database connection (the module connection is used by the main loop).
+"""
+
+import threading
+
+
+class DatabaseJob(object):
+    """
+    Run a maintenance job every interval seconds in a background thread
+
+    The subclasses implement run_once(), that returns a list of the executed operations.
+    on_change(operations) is called after a run with some operations and on_error(exp) when
+    a run failed. The database connection is opened when needed and closed on errors.
+    """
+    name = 'glpi-job'
+
+    def __init__(self, connect, interval=3600, on_change=None, on_error=None):
+        self.connect = connect
+        self.interval = interval
+        self.on_change = on_change
+        self.on_error = on_error
+        self.db = None
+        self.runs = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def connection(self):
+        """Get the job database connection"""
+        if self.db is None:
+            self.db = self.connect()
+        return self.db
+
+    def run_once(self):
+        """Run the job once
+
+        :return: list of the executed operations
+        """
+        raise NotImplementedError()
+
+    def run(self):
+        """Job thread"""
+        while not self.stopped.is_set():
+            try:
+                operations = self.run_once()
+                if operations and self.on_change is not None:
+                    self.on_change(operations)
+            except Exception as exp:  # pylint: disable=broad-except
+                self.close()
+                if self.on_error is not None:
+                    self.on_error(exp)
+            self.stopped.wait(self.interval)
+        self.close()
+
+    def close(self):
+        """Close the database connection"""
+        if self.db is not None:
+            try:
+                self.db.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            self.db = None
+
+    def start(self):
+        """Start the job thread"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the job thread"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module limits the per item logs of the module hot paths:
+- sampling: only one message in `every` is logged for a message kind (eg. a brok type)
+- rate limiting: at most `rate` messages are logged per `period` seconds for a message kind
+
+The sampler counts the messages, so that the module logs periodic summary lines instead
+of one line per item.
+"""
+
+import time
+
+from collections import Counter
+
+
+class LogSampler(object):
+    """
+    Sample and rate limit the log messages, per message kind
+    """
+
+    def __init__(self, every=1000, rate=10, period=60):
+        # every=1 logs all the messages, rate=0 does not limit the messages rate
+        self.every = max(1, every)
+        self.rate = rate
+        self.period = period
+        self.window_start = time.time()
+        # message kind -> messages count since the last summary
+        self.counts = Counter()
+        # message kind -> logged messages count in the current rate window
+        self.logged = Counter()
+        # message kind -> messages not logged since the last summary
+        self.suppressed = Counter()
+
+    def sample(self, kind):
+        """Count a message, and get if it is to be logged: the first one of each `every`"""
+        self.counts[kind] += 1
+        if (self.counts[kind] - 1) % self.every == 0:
+            return True
+        self.suppressed[kind] += 1
+        return False
+
+    def allow(self, kind, now=None):
+        """Count a message, and get if it is to be logged: at most `rate` per period"""
+        self.counts[kind] += 1
+        if not self.rate:
+            return True
+        if now is None:
+            now = time.time()
+        if now - self.window_start >= self.period:
+            self.window_start = now
+            self.logged.clear()
+        if self.logged[kind] < self.rate:
+            self.logged[kind] += 1
+            return True
+        self.suppressed[kind] += 1
+        return False
+
+    def summary(self):
+        """Get the messages counts and the suppressed messages counts since the last summary
+
+        :return: (counts, suppressed) dictionaries
+        """
+        counts, suppressed = dict(self.counts), dict(self.suppressed)
+        self.counts.clear()
+        self.suppressed.clear()
+        return counts, suppressed
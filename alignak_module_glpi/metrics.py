@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides a small metrics registry for the module internal metrics:
+- counters, always increasing
+- gauges, set to the current value
+- latency histograms, with fixed buckets
+- summaries, with percentiles computed on a sliding window of the most recent values
+
+A metric is identified with its name and a tuple of labels, eg. (('type', 'host_check_result'),)
+
+The registry content is exported as a dictionary, as StatsD/Graphite metrics (with the
+Alignak Stats manager) or as a Prometheus text file.
+
+The metrics are updated by the main loop and by the background jobs threads, the registry
+updates and exports are protected with a lock.
+"""
+
+import os
+import bisect
+import threading
+
+from collections import deque
+
+# Latency buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Summaries percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram(object):
+    """
+    A latency histogram: count of observations per bucket, count and sum
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One more bucket for the values greater than the last bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add a value in the histogram"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Get the (upper bound, cumulative count) list, as expected by Prometheus"""
+        result = []
+        total = 0
+        for idx, count in enumerate(self.counts):
+            total += count
+            result.append((self.buckets[idx] if idx < len(self.buckets) else '+Inf', total))
+        return result
+
+
+class Summary(object):
+    """
+    A summary of the most recent values, to compute percentiles
+    """
+    __slots__ = ('values', 'count', 'sum')
+
+    def __init__(self, size=1000):
+        self.values = deque(maxlen=size)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add a value in the summary"""
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, quantile, ordered=None):
+        """Get a percentile of the most recent values"""
+        if ordered is None:
+            ordered = sorted(self.values)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def percentiles(self):
+        """Get the (quantile, value) list"""
+        ordered = sorted(self.values)
+        return [(quantile, self.percentile(quantile, ordered)) for quantile in QUANTILES]
+
+
+def labels_string(labels, separator='.'):
+    """Get the labels values joined with the separator"""
+    return separator.join([str(value) for _, value in labels])
+
+
+class MetricsRegistry(object):
+    """
+    The module metrics registry
+    """
+
+    def __init__(self, prefix='glpi'):
+        self.prefix = prefix
+        # (name, labels) -> value
+        self.counters = {}
+        self.gauges = {}
+        # (name, labels) -> Histogram
+        self.histograms = {}
+        # (name, labels) -> Summary
+        self.summaries = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name, value=1, labels=()):
+        """Increment a counter"""
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, labels=()):
+        """Set a gauge value"""
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, value, labels=()):
+        """Add a value to a latency histogram"""
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def summarize(self, name, value, labels=()):
+        """Add a value to a summary"""
+        key = (name, labels)
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.observe(value)
+
+    def counters_of(self, name):
+        """Get the (labels, value) list of the counters named name"""
+        with self.lock:
+            return [(labels, value) for (key, labels), value in self.counters.items()
+                    if key == name]
+
+    def percentiles_of(self, name, quantile):
+        """Get the (labels, percentile) list of the summaries named name"""
+        with self.lock:
+            return [(labels, summary.percentile(quantile))
+                    for (key, labels), summary in self.summaries.items() if key == name]
+
+    def get_stats(self):
+        """Get the registry content as a dictionary
+
+        Metrics names are built with the metric name and the labels values, eg.
+        broks.host_check_result. The histograms provide their count, sum and average, the
+        summaries provide their count and percentiles.
+        """
+        with self.lock:
+            stats = {}
+            for (name, labels), value in self.counters.items():
+                stats[self.metric_name(name, labels)] = value
+            for (name, labels), value in self.gauges.items():
+                stats[self.metric_name(name, labels)] = value
+            for (name, labels), histogram in self.histograms.items():
+                stats[self.metric_name(name, labels)] = {
+                    'count': histogram.count, 'sum': histogram.sum,
+                    'avg': histogram.sum / histogram.count if histogram.count else 0.0
+                }
+            for (name, labels), summary in self.summaries.items():
+                values = {'count': summary.count}
+                for quantile, value in summary.percentiles():
+                    values['p%d' % (quantile * 100)] = value
+                stats[self.metric_name(name, labels)] = values
+        return stats
+
+    @staticmethod
+    def metric_name(name, labels):
+        """Get a dotted metric name"""
+        if not labels:
+            return name
+        return "%s.%s" % (name, labels_string(labels))
+
+    def send_stats(self, statsmgr):
+        """Send the metrics with an Alignak Stats manager
+
+        The counters and gauges are sent as gauges (the counters are cumulative values),
+        the histograms average is sent as a timer and the summaries percentiles as gauges.
+        """
+        gauges = []
+        timers = []
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                gauges.append((self.metric_name(name, labels), value))
+            for (name, labels), value in self.gauges.items():
+                gauges.append((self.metric_name(name, labels), value))
+            for (name, labels), histogram in self.histograms.items():
+                if histogram.count:
+                    timers.append((self.metric_name(name, labels),
+                                   histogram.sum / histogram.count))
+            for (name, labels), summary in self.summaries.items():
+                for quantile, value in summary.percentiles():
+                    gauges.append(('%s.p%d' % (self.metric_name(name, labels), quantile * 100),
+                                   value))
+
+        # The stats manager is called out of the lock, it may block on the network
+        for name, value in gauges:
+            statsmgr.gauge(name, value)
+        for name, value in timers:
+            statsmgr.timer(name, value)
+
+    def prometheus(self):
+        """Get the registry content in the Prometheus text exposition format"""
+        with self.lock:
+            return self._prometheus()
+
+    def _prometheus(self):
+        """Build the Prometheus text, the registry lock must be held"""
+        lines = []
+        types = {}
+
+        def prom_labels(labels, extra=None):
+            """Build a Prometheus labels string"""
+            labels = list(labels)
+            if extra:
+                labels.append(extra)
+            if not labels:
+                return ''
+            return '{%s}' % ','.join(['%s="%s"' % (key, str(value).replace('"', '\\"'))
+                                      for key, value in labels])
+
+        for metrics, metric_type in [(self.counters, 'counter'), (self.gauges, 'gauge')]:
+            for (name, labels), value in sorted(metrics.items()):
+                full_name = '%s_%s' % (self.prefix, name)
+                if full_name not in types:
+                    types[full_name] = metric_type
+                    lines.append('# TYPE %s %s' % (full_name, metric_type))
+                lines.append('%s%s %s' % (full_name, prom_labels(labels), value))
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            full_name = '%s_%s_seconds' % (self.prefix, name)
+            if full_name not in types:
+                types[full_name] = 'histogram'
+                lines.append('# TYPE %s histogram' % full_name)
+            for upper_bound, count in histogram.cumulative():
+                lines.append('%s_bucket%s %d' % (full_name,
+                                                 prom_labels(labels, ('le', upper_bound)), count))
+            lines.append('%s_sum%s %f' % (full_name, prom_labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (full_name, prom_labels(labels), histogram.count))
+
+        for (name, labels), summary in sorted(self.summaries.items()):
+            full_name = '%s_%s_seconds' % (self.prefix, name)
+            if full_name not in types:
+                types[full_name] = 'summary'
+                lines.append('# TYPE %s summary' % full_name)
+            for quantile, value in summary.percentiles():
+                lines.append('%s%s %f' % (full_name, prom_labels(labels, ('quantile', quantile)),
+                                          value))
+            lines.append('%s_sum%s %f' % (full_name, prom_labels(labels), summary.sum))
+            lines.append('%s_count%s %d' % (full_name, prom_labels(labels), summary.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Write the Prometheus text file, as expected by the node exporter textfile collector
+
+        The file is written in a temporary file and then renamed to be atomically replaced.
+        """
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'w') as textfile:
+            textfile.write(self.prometheus())
+        os.rename(temporary, path)
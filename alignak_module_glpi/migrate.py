@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module migrates the Glpi monitoring plugin tables to an upsert friendly schema.
+
+The Glpi monitoring plugin tables are MyISAM tables (table locks: the writes are serialized)
+with only prefix indexes on the host and service names. For each of the module tables, the
+migration proposes:
+- to switch the MyISAM (or Aria) engine to InnoDB (row locks and transactions)
+- to add a unique key on the item columns (hosts: host_name, services: host_name and
+  service_description, records: host_name, service_description and last_check) that allows
+  `INSERT ... ON DUPLICATE KEY UPDATE` statements. The services events unique key (item,
+  date and state) allows to ignore the replayed events (`events_unique_key` parameter).
+- to partition the services events table on the events date, when the `events_partitioning`
+  parameter is set (MySQL only). The table is partitioned after the InnoDB engine switch, the
+  module then manages the partitions.
+
+A unique key is only proposed when the table has no duplicated items and when the key columns
+exist. The unique keys are added after the engine switch: a unique key on several full length
+strings is longer than the MyISAM key length limit.
+
+The migration statements are only printed (dry run), unless the --apply option is used. Run
+with::
+
+    alignak-glpi-migrate --ini alignak-module-glpi.ini
+    alignak-glpi-migrate --ini alignak-module-glpi.ini --apply --output migration.json
+
+Note that ALTER TABLE statements on big tables may take a long time and lock the table.
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import datetime
+import logging
+import argparse
+
+from alignak.objects.module import Module
+
+from .glpi import get_instance
+from .dedup import EVENT_KEY_COLUMNS
+from .partitions import convert
+from .replay import read_configuration
+
+# Engines switched to InnoDB
+MIGRATED_ENGINES = ('MyISAM', 'Aria')
+TARGET_ENGINE = 'InnoDB'
+
+# Unique keys of the module tables: table parameter -> (unique key name, columns)
+UNIQUE_KEYS = {
+    'hosts_table': ('item', ['host_name']),
+    'services_table': ('item', ['host_name', 'service_description']),
+    'serviceevents_table': ('event', EVENT_KEY_COLUMNS),
+    'records_table': ('item_check', ['host_name', 'service_description', 'last_check'])
+}
+
+DUPLICATES_QUERY = u"""SELECT COUNT(*) FROM (SELECT 1 FROM `%s` GROUP BY %s
+ HAVING COUNT(*) > 1) AS duplicates"""
+
+
+class Step(object):
+    # pylint: disable=too-few-public-methods
+    """
+    A migration statement
+    """
+
+    def __init__(self, table, statement, reason):
+        self.table = table
+        self.statement = statement
+        self.reason = reason
+        self.applied = False
+        self.elapsed = None
+        self.error = None
+
+    def report(self):
+        """Get the step as a dictionary"""
+        return {'table': self.table, 'statement': self.statement, 'reason': self.reason,
+                'applied': self.applied, 'elapsed': self.elapsed, 'error': self.error}
+
+
+def duplicates(cursor, table, columns):
+    """Get the number of duplicated items of a table"""
+    cursor.execute(DUPLICATES_QUERY % (table, ', '.join(['`%s`' % column
+                                                         for column in columns])))
+    return cursor.fetchone()[0]
+
+
+def plan_table(cursor, table, unique_key):
+    """Get the migration steps of a table
+
+    :param table: schema.Table
+    :param unique_key: (unique key name, columns) or None
+    :return: (list of Step, list of the notes about the not proposed changes)
+    """
+    steps = []
+    notes = []
+    if table.engine in MIGRATED_ENGINES:
+        steps.append(Step(table.name, u"ALTER TABLE `%s` ENGINE=%s" % (table.name, TARGET_ENGINE),
+                          "%s table: table locks serialize the writes" % table.engine))
+    elif table.engine != TARGET_ENGINE:
+        notes.append("%s engine is not migrated" % table.engine)
+
+    if unique_key is None:
+        return steps, notes
+    name, columns = unique_key
+    if table.find_unique_key(columns):
+        notes.append("unique key on (%s) exists" % ', '.join(columns))
+        return steps, notes
+    missing = [column for column in columns if column not in table.columns]
+    if missing:
+        notes.append("no unique key, missing columns: %s" % ', '.join(missing))
+        return steps, notes
+    count = duplicates(cursor, table.name, columns)
+    if count:
+        notes.append("no unique key, %d duplicated items must be removed first" % count)
+        return steps, notes
+    steps.append(Step(table.name, u"ALTER TABLE `%s` ADD UNIQUE KEY `%s` (%s)" % (
+        table.name, name, ','.join(['`%s`' % column for column in columns])),
+        "unique key for INSERT ... ON DUPLICATE KEY UPDATE"))
+    return steps, notes
+
+
+def plan_partitions(cursor, manager, table, today=None):
+    """Get the migration steps that partition the services events table
+
+    :param manager: partitions.PartitionManager of the module
+    :param table: schema.Table
+    :return: (list of Step, list of the notes about the not proposed changes)
+    """
+    if table.engine not in MIGRATED_ENGINES and table.engine != TARGET_ENGINE:
+        return [], ["%s engine can not be partitioned" % table.engine]
+    if manager.partitions(cursor):
+        return [], ["table is partitioned"]
+    if today is None:
+        today = datetime.date.today()
+    return [Step(table.name, statement, "%s partitions on the events date" % manager.period)
+            for statement in convert(table.name, today, manager.period, manager.ahead)], []
+
+
+def plan(instance):
+    """Get the migration steps of the module tables
+
+    :param instance: connected module instance
+    :return: (list of Step, dictionary: table name -> notes)
+    """
+    tables = instance.load_schema(refresh=True)
+    steps = []
+    notes = {}
+    for parameter in ['hosts_table', 'services_table', 'serviceevents_table', 'records_table']:
+        name = getattr(instance, parameter)
+        if name not in tables:
+            notes[name] = ["table does not exist"]
+            continue
+        table_steps, notes[name] = plan_table(instance.db_cursor, tables[name],
+                                              UNIQUE_KEYS[parameter])
+        if parameter == 'serviceevents_table' and instance.partitions is not None and \
+                instance.db_driver != 'sqlite':
+            # After the engine switch: MySQL 8 does not partition the MyISAM tables
+            partition_steps, partition_notes = plan_partitions(
+                instance.db_cursor, instance.partitions, tables[name])
+            position = 1 if tables[name].engine in MIGRATED_ENGINES else 0
+            table_steps[position:position] = partition_steps
+            notes[name].extend(partition_notes)
+        steps.extend(table_steps)
+    return steps, notes
+
+
+def apply_steps(instance, steps):
+    """Execute the migration steps, stop on the first error
+
+    :return: True if all the steps are applied
+    """
+    for step in steps:
+        start = time.time()
+        try:
+            instance.db_cursor.execute(step.statement)
+            instance.db.commit()
+            step.applied = True
+        except Exception as exp:  # pylint: disable=broad-except
+            step.error = str(exp)
+            return False
+        finally:
+            step.elapsed = time.time() - start
+    return True
+
+
+def script(steps, notes):
+    """Get the migration steps as a SQL script"""
+    lines = []
+    for table, table_notes in sorted(notes.items()):
+        for note in table_notes:
+            lines.append(u"-- %s: %s" % (table, note))
+    for step in steps:
+        lines.append(u"-- %s" % step.reason)
+        lines.append(u"%s;" % step.statement)
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    """Migration command line
+
+    :return: the migration report
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ini', help='module configuration file')
+    parser.add_argument('--config', action='append', metavar='KEY=VALUE',
+                        help='module configuration parameter, may be repeated')
+    parser.add_argument('--apply', action='store_true',
+                        help='execute the migration statements (default: dry run)')
+    parser.add_argument('--output', help='JSON report file')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    configuration = read_configuration(options.ini, options.config)
+    configuration['fake_db'] = '0'
+    instance = get_instance(Module(configuration))
+    if not instance.open():
+        raise RuntimeError("database connection failed")
+
+    try:
+        steps, notes = plan(instance)
+        print(script(steps, notes))
+        applied = None
+        if steps and not options.apply:
+            print(u"-- dry run, use --apply to execute the statements")
+        if options.apply:
+            applied = apply_steps(instance, steps)
+            for step in steps:
+                if step.error:
+                    print(u"-- failed: %s: %s" % (step.statement, step.error))
+        report = {
+            'database': instance.database,
+            'driver': instance.db_driver,
+            'dry_run': not options.apply,
+            'applied': applied,
+            'steps': [step.report() for step in steps],
+            'notes': notes
+        }
+    finally:
+        instance.close()
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return report
+
+
+def console_main():
+    """Migration console script entry point"""
+    report = main()
+    return 1 if report['applied'] is False else 0
+
+
+if __name__ == '__main__':
+    sys.exit(console_main())
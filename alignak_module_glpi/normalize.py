@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module normalizes the rows strings values before they are queued or written, so that
+the database never rejects (strict mode) or silently truncates a row:
+- the characters that can not be encoded with the connection character set are dropped, as
+  well as the 4 bytes UTF-8 characters for the MySQL utf8 (3 bytes) character set
+- the values are truncated to the column maximum length, in characters and in bytes, as
+  discovered by the schema introspection
+
+The values are kept as unicode strings: the database drivers encode them once when sending
+the statements, and the SQLite stand-in database stores the bytes values as blobs.
+
+With a UTF-8 character set, a value whose length is within the column lengths (4 bytes per
+character at most) is not encoded again to be measured. Such a value is not cleaned either:
+UTF-8 encodes all the characters except the lone surrogates.
+"""
+
+import re
+import codecs
+
+# The MySQL utf8 (utf8mb3) character set only stores the Basic Multilingual Plane characters
+ASTRAL_CHARACTERS = re.compile(u'[\U00010000-\U0010FFFF]')
+MB3_CHARACTER_SETS = ('utf8', 'utf8mb3')
+
+# Maximum length of an UTF-8 encoded character
+UTF8_CHARACTER_OCTETS = 4
+
+
+class RowNormalizer(object):
+    """
+    Normalize the strings values of the rows of a table
+
+    lengths is a dictionary: column name -> (maximum length in characters, in bytes)
+    """
+
+    def __init__(self, lengths, encoding='utf-8', mb3=False):
+        self.lengths = lengths
+        self.encoding = encoding
+        self.mb3 = mb3
+        self.utf8 = codecs.lookup(encoding).name == 'utf-8'
+        self.truncated = 0
+        self.cleaned = 0
+
+    def clean(self, value):
+        """Drop the characters that can not be encoded
+
+        :return: (value, encoded value)
+        """
+        try:
+            encoded = value.encode(self.encoding)
+        except UnicodeEncodeError:
+            self.cleaned += 1
+            encoded = value.encode(self.encoding, 'ignore')
+            value = encoded.decode(self.encoding)
+        # Only the not ASCII values may have some 4 bytes characters
+        if self.mb3 and len(encoded) != len(value) and ASTRAL_CHARACTERS.search(value):
+            self.cleaned += 1
+            value = ASTRAL_CHARACTERS.sub(u'', value)
+            encoded = value.encode(self.encoding)
+        return value, encoded
+
+    def value(self, value, length, octets):
+        """Get a normalized string value"""
+        if self.utf8 and not self.mb3 and (length is None or len(value) <= length) and (
+                octets is None or len(value) * UTF8_CHARACTER_OCTETS <= octets):
+            # Short enough whatever the characters
+            return value
+        value, encoded = self.clean(value)
+        if length is not None and len(value) > length:
+            self.truncated += 1
+            value = value[:length]
+            if octets is not None:
+                encoded = value.encode(self.encoding)
+        if octets is not None and len(encoded) > octets:
+            self.truncated += 1
+            # A character cut by the truncation is dropped
+            value = encoded[:octets].decode(self.encoding, 'ignore')
+        return value
+
+    def normalize(self, row):
+        """Normalize the strings values of a row (dictionary), in place
+
+        :return: the row
+        """
+        for column, (length, octets) in self.lengths.items():
+            value = row.get(column)
+            if isinstance(value, str):
+                row[column] = self.value(value, length, octets)
+        return row
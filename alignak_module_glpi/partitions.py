@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module manages the RANGE partitions of the services events table, on the events date.
+
+The table is partitioned by day or by week: a partition `pYYYYMMDD` holds the events before
+the YYYY-MM-DD day (and after the previous partition bound), and a last `pfuture` partition
+holds the events after the last bound.
+
+A not partitioned table is converted once with the `alignak-glpi-migrate` command, after the
+InnoDB engine switch: the date column is declared NOT NULL and added to the primary key (the
+partitioning column must be part of all the unique keys), and the table is partitioned with
+one partition for the existing events and the upcoming partitions. This conversion rebuilds
+the table.
+
+The partition manager only manages an already partitioned table:
+- creates the upcoming partitions ahead of time, by splitting the (empty) `pfuture` partition
+- drops the expired partitions, a metadata only operation instead of a long DELETE
+
+The partitions are managed with a dedicated database connection, in a background thread.
+"""
+
+import datetime
+
+from .jobs import DatabaseJob
+
+PERIODS = {'daily': 1, 'weekly': 7}
+
+# MySQL TO_DAYS() of a date is the Python ordinal plus 365
+TO_DAYS_OFFSET = 365
+
+FUTURE_PARTITION = 'pfuture'
+
+PARTITIONS_QUERY = u"""SELECT `PARTITION_NAME`, `PARTITION_DESCRIPTION`
+ FROM `information_schema`.`PARTITIONS`
+ WHERE `TABLE_SCHEMA`=%s AND `TABLE_NAME`=%s ORDER BY `PARTITION_ORDINAL_POSITION`"""
+
+
+def period_start(day, period):
+    """Get the first day of the period (daily, or weekly starting on monday) of a day"""
+    if period == 'weekly':
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def partition_name(bound):
+    """Get the name of the partition of the events before the bound day"""
+    return 'p%s' % bound.strftime('%Y%m%d')
+
+
+def partition_definition(bound):
+    """Get the definition of the partition of the events before the bound day"""
+    return u"PARTITION `%s` VALUES LESS THAN (%d)" % (
+        partition_name(bound), bound.toordinal() + TO_DAYS_OFFSET)
+
+
+class NotPartitionedError(Exception):
+    """The table is not partitioned, it must be converted with the migration command"""
+
+
+def read_partitions(rows):
+    """Get the partitions from the information_schema rows
+
+    :return: list of (partition name, bound day or None for MAXVALUE), an empty list if the
+    table is not partitioned
+    """
+    partitions = []
+    for name, description in rows:
+        if name is None:
+            # Not partitioned
+            return []
+        if description is None or str(description).upper() == 'MAXVALUE':
+            partitions.append((name, None))
+        else:
+            bound = datetime.date.fromordinal(int(description) - TO_DAYS_OFFSET)
+            partitions.append((name, bound))
+    return partitions
+
+
+def convert(table, today, period='daily', ahead=7):
+    """Get the statements that partition a not partitioned table, with the partition of the
+    current period and the upcoming partitions
+
+    :param today: current day
+    :param ahead: number of upcoming partitions to create ahead of time
+    :return: list of statements
+    """
+    step = datetime.timedelta(days=PERIODS[period])
+    current = period_start(today, period)
+    last_bound = current + step * (ahead + 1)
+    bounds = [current]
+    while bounds[-1] < last_bound:
+        bounds.append(bounds[-1] + step)
+    return [
+        u"ALTER TABLE `%s` MODIFY `date` datetime NOT NULL "
+        u"DEFAULT '1970-01-01 00:00:00'" % table,
+        u"ALTER TABLE `%s` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `date`)" % table,
+        u"ALTER TABLE `%s` PARTITION BY RANGE (TO_DAYS(`date`)) (%s, "
+        u"PARTITION `%s` VALUES LESS THAN MAXVALUE)" % (
+            table, ', '.join([partition_definition(bound) for bound in bounds]),
+            FUTURE_PARTITION)
+    ]
+
+
+def plan(table, partitions, today, period='daily', ahead=7, retention=0):
+    # pylint: disable=too-many-arguments
+    """Get the statements that create the upcoming partitions and drop the expired
+    partitions of a partitioned table
+
+    :param partitions: current partitions, as returned by read_partitions
+    :param today: current day
+    :param ahead: number of upcoming partitions to create ahead of time
+    :param retention: days of events to keep, 0 to keep all the events
+    :return: list of statements, an empty list if the table is not partitioned
+    """
+    if not partitions:
+        return []
+
+    step = datetime.timedelta(days=PERIODS[period])
+    current = period_start(today, period)
+    # The partition of the current period and the upcoming partitions
+    last_bound = current + step * (ahead + 1)
+
+    statements = []
+    bounds = [bound for _, bound in partitions if bound is not None]
+    new_bounds = []
+    # After a long stop, no empty partitions for the past periods
+    bound = max(bounds + [current])
+    while bound < last_bound:
+        bound = bound + step
+        new_bounds.append(bound)
+    if new_bounds:
+        definitions = ', '.join([partition_definition(bound) for bound in new_bounds])
+        if FUTURE_PARTITION in [name for name, _ in partitions]:
+            statements.append(
+                u"ALTER TABLE `%s` REORGANIZE PARTITION `%s` INTO (%s, "
+                u"PARTITION `%s` VALUES LESS THAN MAXVALUE)" % (table, FUTURE_PARTITION,
+                                                                definitions, FUTURE_PARTITION))
+        else:
+            statements.append(u"ALTER TABLE `%s` ADD PARTITION (%s)" % (table, definitions))
+
+    if retention:
+        cutoff = today - datetime.timedelta(days=retention)
+        expired = [name for name, bound in partitions if bound is not None and bound <= cutoff]
+        if expired:
+            statements.append(u"ALTER TABLE `%s` DROP PARTITION %s" % (
+                table, ', '.join(['`%s`' % name for name in expired])))
+    return statements
+
+
+class PartitionManager(DatabaseJob):
+    """
+    Manage the services events table partitions in a background thread, every interval
+    seconds. on_change(statements) is called after the partitions changed and on_error(exp)
+    when the partitions management failed, with a NotPartitionedError if the table is not
+    partitioned.
+    """
+    name = 'glpi-partitions'
+
+    def __init__(self, connect, database, table, period='daily', ahead=7, retention=0,
+                 interval=3600, on_change=None, on_error=None):
+        # pylint: disable=too-many-arguments
+        if period not in PERIODS:
+            raise ValueError("unknown partitioning period: %s, available periods: %s"
+                             % (period, ', '.join(sorted(PERIODS))))
+        super(PartitionManager, self).__init__(connect, interval, on_change, on_error)
+        self.database = database
+        self.table = table
+        self.period = period
+        self.ahead = ahead
+        self.retention = retention
+
+    def partitions(self, cursor):
+        """Get the current partitions of the table"""
+        cursor.execute(PARTITIONS_QUERY, (self.database, self.table))
+        return read_partitions(cursor.fetchall())
+
+    def run_once(self, today=None):
+        """Create the upcoming partitions and drop the expired partitions
+
+        :return: list of the executed statements
+        """
+        if today is None:
+            today = datetime.date.today()
+        cursor = self.connection().cursor()
+        try:
+            partitions = self.partitions(cursor)
+            if not partitions:
+                raise NotPartitionedError("table %s is not partitioned, partition it with the "
+                                          "alignak-glpi-migrate command" % self.table)
+            statements = plan(self.table, partitions, today, self.period, self.ahead,
+                              self.retention)
+            for statement in statements:
+                cursor.execute(statement)
+            self.runs += 1
+            return statements
+        finally:
+            cursor.close()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides the profilers used to profile the module main loop:
+- a sampling profiler: a thread samples the main thread stack at a fixed interval during a
+  bounded time window. The samples are dumped as collapsed stacks (one `frame;frame;... count`
+  line per stack), as expected by the flame graphs tools.
+- a cProfile profiler: the main thread is profiled during a number of main loop turns. The
+  profile is dumped as a pstats file.
+
+Both profilers provide a short top functions summary.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import threading
+
+from collections import Counter
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def frame_label(frame):
+    """Get a collapsed stack label for a frame"""
+    code = frame.f_code
+    return "%s:%s" % (os.path.basename(code.co_filename), code.co_name)
+
+
+class SamplingProfiler(object):
+    """
+    Sample the stack of a thread during `duration` seconds, every `interval` seconds
+    """
+
+    def __init__(self, duration=60, interval=0.01, thread_id=None):
+        self.duration = duration
+        self.interval = interval
+        self.thread_id = thread_id or threading.current_thread().ident
+        # collapsed stack -> samples count
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start sampling"""
+        self.started = time.time()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, name='glpi-profiler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sample(self):
+        """Sampling thread"""
+        while self.running and not self.finished():
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def turn(self):
+        """A main loop turn, nothing to do for the sampling profiler"""
+
+    def finished(self):
+        """Is the sampling window elapsed?"""
+        return time.time() - self.started >= self.duration
+
+    def stop(self):
+        """Stop sampling"""
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def dump(self, path):
+        """Dump the collapsed stacks"""
+        with open(path, 'w') as dump:
+            for stack, count in self.stacks.most_common():
+                dump.write("%s %d\n" % (stack, count))
+
+    def summary(self, top=10):
+        """Get the top functions, by their own samples count"""
+        if not self.samples:
+            return []
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return ["%5.1f%% %s" % (100.0 * count / self.samples, label)
+                for label, count in leaves.most_common(top)]
+
+
+class CProfileProfiler(object):
+    """
+    Profile the main thread with cProfile during `turns` main loop turns
+    """
+
+    def __init__(self, turns=100):
+        self.turns = turns
+        self.count = 0
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        """Start profiling the current thread"""
+        self.profile.enable()
+
+    def turn(self):
+        """A main loop turn"""
+        self.count += 1
+
+    def finished(self):
+        """Are all the turns profiled?"""
+        return self.count >= self.turns
+
+    def stop(self):
+        """Stop profiling"""
+        self.profile.disable()
+
+    def dump(self, path):
+        """Dump the profile statistics"""
+        self.profile.dump_stats(path)
+
+    def summary(self, top=10):
+        """Get the top functions, by their cumulative time"""
+        output = StringIO()
+        try:
+            stats = pstats.Stats(self.profile, stream=output)
+        except TypeError:
+            # Nothing profiled
+            return []
+        stats.sort_stats('cumulative').print_stats(top)
+        return [line for line in output.getvalue().split('\n')
+                if line.strip() and not line.startswith('   Ordered by')]
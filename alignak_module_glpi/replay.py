@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module replays the broks of a capture file through the module, to reproduce a
+production load offline.
+
+The broks are replayed at the capture speed (--speed 1), N times faster (--speed N) or as
+fast as possible (--speed 0), against the configured database backend. The queued rows are
+bulk inserted as the module does (commit period and commit volume) and flushed at the end of
+the replay. Without a module configuration file nor a db_driver parameter, the broks are
+replayed against a fake database that discards the rows.
+
+The replay report is a JSON document with the replay throughput, the replay lag (elapsed
+time between the scheduled time of a brok and the time it is managed) percentiles and the
+module internal metrics. Run with::
+
+    alignak-glpi-replay --speed 10 --config db_driver=sqlite capture.jsonl.gz
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+try:
+    import configparser
+except ImportError:  # pragma: no cover, Python 2
+    import ConfigParser as configparser
+
+from alignak.brok import Brok
+from alignak.objects.module import Module
+
+from .glpi import get_instance
+from .capture import read_capture
+from .metrics import Summary
+
+BASE_CONFIGURATION = {
+    'module_alias': 'glpi',
+    'module_types': 'DB',
+    'python_name': 'alignak_module_glpi',
+    'log_level': 'WARNING'
+}
+
+
+def read_configuration(ini_file=None, items=None):
+    """Build the module configuration from a module ini file and key=value items"""
+    configuration = dict(BASE_CONFIGURATION)
+    if ini_file:
+        parser = configparser.RawConfigParser()
+        parser.read(ini_file)
+        for section in parser.sections():
+            if section.startswith('module.'):
+                configuration.update(dict(parser.items(section)))
+                configuration['module_alias'] = parser.get(section, 'name') \
+                    if parser.has_option(section, 'name') else section[len('module.'):]
+                break
+    for item in items or []:
+        key, _, value = item.partition('=')
+        configuration[key.strip()] = value.strip()
+    if 'fake_db' not in configuration:
+        # The fake database only when no database backend is configured
+        configuration['fake_db'] = '0' if ini_file or 'db_driver' in configuration else '1'
+    # Do not capture the replayed broks
+    configuration['capture_file'] = ''
+    return configuration
+
+
+class Replayer(object):
+    """
+    Replay the captured broks through a module instance
+    """
+
+    def __init__(self, instance, speed=1.0):
+        self.instance = instance
+        self.speed = speed
+        self.broks = 0
+        self.lag = Summary(100000)
+        self.next_commit = 0
+        self.next_records = 0
+        self.next_rollups = 0
+
+    def flush(self, now, final=False):
+        """Bulk insert the queued rows as the module main loop does"""
+        instance = self.instance
+        if final or now >= self.next_commit or \
+                len(instance.events_cache) >= instance.commit_volume:
+            self.next_commit = now + instance.commit_period
+            instance.bulk_insert()
+        if instance.update_records and (
+                final or now >= self.next_records or
+                len(instance.records_cache) >= instance.records_commit_volume):
+            self.next_records = now + instance.records_commit_period
+            instance.bulk_insert_records()
+        if instance.rollups is not None and now >= self.next_rollups:
+            self.next_rollups = now + instance.rollups_commit_period
+            instance.flush_rollups(now)
+
+    def replay(self, captures):
+        """Replay the captured broks
+
+        :param captures: iterable of (timestamp, brok type, brok data)
+        :return: (replay elapsed time, captured time range)
+        """
+        start = time.time()
+        first = last = None
+        for timestamp, brok_type, data in captures:
+            if first is None:
+                first = timestamp
+            last = timestamp
+            if self.speed > 0:
+                scheduled = start + (timestamp - first) / self.speed
+                now = time.time()
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                self.lag.observe(max(0.0, time.time() - scheduled))
+
+            brok = Brok({'type': brok_type, 'data': data}, False)
+            brok.prepare()
+            self.instance.manage_brok(brok)
+            self.broks += 1
+            self.flush(time.time())
+
+        # Insert all the queued rows
+        while self.instance.events_cache or self.instance.records_cache:
+            queued = len(self.instance.events_cache) + len(self.instance.records_cache)
+            self.flush(time.time(), final=True)
+            if len(self.instance.events_cache) + len(self.instance.records_cache) >= queued:
+                break
+        return time.time() - start, (last - first) if first is not None else 0
+
+    def report(self, elapsed, captured):
+        """Get the replay report"""
+        report = {
+            'backend': 'fake' if self.instance.fake_db else self.instance.db_driver,
+            'broks': self.broks,
+            'elapsed': elapsed,
+            'broks_per_second': self.broks / elapsed if elapsed else 0.0,
+            'captured_time_range': captured,
+            'speed': self.speed,
+            'speedup': captured / elapsed if elapsed else 0.0,
+            'events_not_inserted': len(self.instance.events_cache),
+            'records_not_inserted': len(self.instance.records_cache),
+            'metrics': self.instance.collect_metrics()
+        }
+        if self.lag.count:
+            report['lag'] = dict([('p%d' % (quantile * 100), value)
+                                  for quantile, value in self.lag.percentiles()])
+            report['lag']['max'] = max(self.lag.values)
+        return report
+
+
+def main(args=None):
+    """Replay command line
+
+    :return: the replay report
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('captures', nargs='+',
+                        help='capture files, in chronological order (eg. capture.1 capture)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed factor, 0 for the maximum speed (default: 1)')
+    parser.add_argument('--ini', help='module configuration file')
+    parser.add_argument('--config', action='append', metavar='KEY=VALUE',
+                        help='module configuration parameter, may be repeated')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    instance = get_instance(Module(read_configuration(options.ini, options.config)))
+    instance.init()
+
+    def captures():
+        """Read all the capture files"""
+        for path in options.captures:
+            for brok in read_capture(path):
+                yield brok
+
+    replayer = Replayer(instance, options.speed)
+    elapsed, captured = replayer.replay(captures())
+    instance.do_stop()
+    report = replayer.report(elapsed, captured)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+def console_main():
+    """Replay console script entry point"""
+    main()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(console_main())
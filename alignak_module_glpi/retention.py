@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module purges the rows older than a retention period from the services events and
+records tables, for the installations that cannot partition the tables.
+
+The rows are deleted in small chunks, in the primary key order, so that each DELETE statement
+only locks a few rows during a short time:
+- a chunk of ids is read after the last purged id, with a flag telling if the row is expired
+- the expired rows of the chunk are deleted with a primary key range and committed
+- the purge of a table stops on the first not expired row: the rows are inserted in the
+  events order, the most recent rows are not scanned
+
+The purge sleeps between the chunks and stops when its time budget for a run is exhausted
+(each table is purged with at least one chunk per run), the next run continues the purge.
+When the module rows insertion latency is greater than a threshold, the pause between the
+chunks is doubled (up to MAX_BACKOFF times), and it is halved again when the latency is back
+under the threshold.
+"""
+
+import time
+import datetime
+
+from .jobs import DatabaseJob
+
+# Maximum pause multiplier when the insertion latency is too high
+MAX_BACKOFF = 32
+
+CHUNK_QUERY = u"""SELECT `id`, `%s` < %%s FROM `%s` WHERE `id` > %%s ORDER BY `id` LIMIT %d"""
+
+DELETE_QUERY = u"""DELETE FROM `%s` WHERE `id` >= %%s AND `id` <= %%s AND `%s` < %%s"""
+
+
+class RetentionPurge(DatabaseJob):
+    """
+    Purge the expired rows of some tables every interval seconds, in a background thread
+
+    tables is a list of (table, date column, retention days). latency is a function returning
+    the current rows insertion latency, in seconds. on_change(purged) is called with the
+    list of (table, deleted rows) after a run that deleted some rows.
+    """
+    name = 'glpi-retention'
+
+    def __init__(self, connect, tables, chunk=1000, pause=0.1, budget=30, latency=None,
+                 latency_threshold=1.0, interval=300, on_change=None, on_error=None):
+        # pylint: disable=too-many-arguments
+        super(RetentionPurge, self).__init__(connect, interval, on_change, on_error)
+        self.tables = tables
+        self.chunk = chunk
+        self.pause = pause
+        self.budget = budget
+        self.latency = latency
+        self.latency_threshold = latency_threshold
+        self.backoff = 1
+        self.chunks = 0
+
+    def throttle(self):
+        """Get the pause before the next chunk, adjusted with the insertion latency"""
+        if self.latency is not None and self.latency() > self.latency_threshold:
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        else:
+            self.backoff = max(self.backoff // 2, 1)
+        return self.pause * self.backoff
+
+    def purge_table(self, cursor, table, date_column, cutoff, deadline):
+        """Delete the rows of the table older than cutoff, chunk by chunk, until deadline
+
+        :return: number of deleted rows
+        """
+        deleted = 0
+        last_id = 0
+        while True:
+            cursor.execute(CHUNK_QUERY % (date_column, table, self.chunk), (cutoff, last_id))
+            rows = cursor.fetchall()
+            expired = []
+            for row_id, is_expired in rows:
+                if not is_expired:
+                    break
+                expired.append(row_id)
+            if expired:
+                cursor.execute(DELETE_QUERY % (table, date_column),
+                               (expired[0], expired[-1], cutoff))
+                self.connection().commit()
+                deleted += cursor.rowcount
+                self.chunks += 1
+                last_id = expired[-1]
+            if len(expired) < self.chunk:
+                # The table has no more expired rows
+                return deleted
+            pause = self.throttle()
+            if time.time() + pause >= deadline or self.stopped.wait(pause):
+                return deleted
+
+    def run_once(self, now=None):
+        """Purge the expired rows of the tables, within the time budget
+
+        :return: list of (table, deleted rows) for the tables with some deleted rows
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        deadline = time.time() + self.budget
+        purged = []
+        cursor = self.connection().cursor()
+        try:
+            for table, date_column, days in self.tables:
+                cutoff = (now - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+                deleted = self.purge_table(cursor, table, date_column, cutoff, deadline)
+                if deleted:
+                    purged.append((table, deleted))
+            self.runs += 1
+            return purged
+        finally:
+            cursor.close()
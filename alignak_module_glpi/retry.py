@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module retries the failed rows bulk insertions instead of dropping the whole batch.
+
+A failed batch is classified with its error:
+- a transient error (lost connection, lock wait timeout, deadlock, locked database) is not
+  related to the rows: the batch is requeued at the head of the queue and retried later, with
+  an exponential backoff
+- another error (a bad row, a too big packet) is related to some rows of the batch: the batch
+  is split in two halves, recursively, to isolate the poison rows. The other rows are
+  inserted and the poison rows are written to a dead letters file.
+
+Each batch insertion is committed, the failed batches are rolled back: the bisection only
+inserts each row once with transactional (InnoDB) tables. With non transactional (MyISAM)
+tables, the rows that were inserted before the error can not be rolled back: the rows are
+inserted one by one and the insertion resumes after the failed row (PartialInsertError).
+
+A lost connection is a transient error, but the connection must be opened again before the
+next try.
+"""
+
+import json
+import time
+
+# MySQL errors not related to the inserted rows
+TRANSIENT_ERRORS = (
+    1040,  # Too many connections
+    1205,  # Lock wait timeout exceeded
+    1213,  # Deadlock found when trying to get lock
+    2002,  # Can't connect to local MySQL server
+    2003,  # Can't connect to MySQL server
+    2006,  # MySQL server has gone away
+    2013,  # Lost connection to MySQL server during query
+    2055,  # Lost connection to MySQL server (system error)
+)
+
+# Errors messages of the drivers without error codes (SQLite)
+TRANSIENT_MESSAGES = ('database is locked', 'not connected', 'disk i/o error')
+
+# Transient errors for which the connection is lost
+CONNECTION_ERRORS = (2002, 2003, 2006, 2013, 2055)
+CONNECTION_MESSAGES = ('not connected',)
+
+
+def error_code(exp):
+    """Get the MySQL error code of a driver exception, None if it has no error code"""
+    code = getattr(exp, 'errno', None)
+    if code is None and exp.args and isinstance(exp.args[0], int):
+        # PyMySQL and mysqlclient errors
+        code = exp.args[0]
+    return code
+
+
+def is_transient(exp):
+    """Is the error not related to the inserted rows?"""
+    code = error_code(exp)
+    if code is not None and code in TRANSIENT_ERRORS:
+        return True
+    message = str(exp).lower()
+    return any([transient in message for transient in TRANSIENT_MESSAGES])
+
+
+def is_connection_lost(exp):
+    """Is the error a lost (or not established) connection?"""
+    code = error_code(exp)
+    if code is not None and code in CONNECTION_ERRORS:
+        return True
+    message = str(exp).lower()
+    return any([lost in message for lost in CONNECTION_MESSAGES])
+
+
+class PartialInsertError(Exception):
+    """
+    A rows insertion failed after some rows were inserted, and they can not be rolled back
+    (non transactional table): the rows are inserted in order, the failed row is the row
+    following the inserted rows
+    """
+
+    def __init__(self, error, inserted):
+        Exception.__init__(self, str(error))
+        self.error = error
+        self.inserted = inserted
+
+
+class Bisection(object):
+    # pylint: disable=too-few-public-methods
+    """
+    The result of a bisecting insertion
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.batches = 0
+        # (row, error message) of the rows that can not be inserted
+        self.poison = []
+        # Rows not inserted because of a transient error, and the error
+        self.requeue = []
+        self.error = None
+
+
+def bisect_insert(execute, rows, transient=is_transient):
+    """Insert the rows with execute(batch), splitting the failed batches to isolate the
+    poison rows
+
+    The bisection stops on a transient error, the rows that are not yet inserted are
+    returned to be requeued, in their initial order.
+
+    When execute raises a PartialInsertError, the inserted rows are not inserted again: the
+    failed row is a poison row (or is requeued on a transient error) and the insertion
+    resumes with the next rows, without bisecting.
+
+    :param execute: function inserting and committing a batch, raising an exception when
+        the batch insertion failed (and was rolled back), or a PartialInsertError
+    :return: Bisection
+    """
+    result = Bisection()
+    # Stack of the batches to insert, the next batch is the last one
+    pending = [rows]
+    while pending:
+        batch = pending.pop()
+        result.batches += 1
+        try:
+            execute(batch)
+            result.inserted += len(batch)
+        except Exception as exp:  # pylint: disable=broad-except
+            partial = isinstance(exp, PartialInsertError)
+            if partial:
+                result.inserted += exp.inserted
+                batch = batch[exp.inserted:]
+                exp = exp.error
+            if transient(exp):
+                result.error = exp
+                result.requeue = list(batch)
+                for remaining in reversed(pending):
+                    result.requeue.extend(remaining)
+                return result
+            if partial:
+                result.poison.append((batch[0], str(exp)))
+                if len(batch) > 1:
+                    pending.append(batch[1:])
+                continue
+            if len(batch) == 1:
+                result.poison.append((batch[0], str(exp)))
+                continue
+            middle = len(batch) // 2
+            pending.append(batch[middle:])
+            pending.append(batch[:middle])
+    return result
+
+
+class DeadLetters(object):
+    """
+    Append the poison rows to a JSON lines file
+
+    Each line is a poison row: {"t": timestamp, "table": table, "error": error, "row": row}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def write(self, table, poison, timestamp=None):
+        """Write the poison rows of a table"""
+        if timestamp is None:
+            timestamp = time.time()
+        with open(self.path, 'a') as dead_letters:
+            for row, error in poison:
+                dead_letters.write(json.dumps({'t': timestamp, 'table': table, 'error': error,
+                                               'row': row}, default=str) + '\n')
+                self.count += 1
+
+
+def read_dead_letters(path):
+    """Read the poison rows of a dead letters file"""
+    with open(path) as dead_letters:
+        for line in dead_letters:
+            yield json.loads(line)
+
+
+class Backoff(object):
+    """
+    Exponential retry delay: doubled after each failure, from delay up to max_delay seconds,
+    and reset after a success
+    """
+
+    def __init__(self, delay=1, max_delay=60):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.current = 0
+        self.next_time = 0
+        self.failures = 0
+
+    def ready(self, now=None):
+        """Is a new try allowed?"""
+        return (time.time() if now is None else now) >= self.next_time
+
+    def failed(self, now=None):
+        """Delay the next try after a failure
+
+        :return: the retry delay
+        """
+        self.failures += 1
+        self.current = min(self.current * 2, self.max_delay) if self.current else self.delay
+        self.next_time = (time.time() if now is None else now) + self.current
+        return self.current
+
+    def succeeded(self):
+        """Reset the delay after a success"""
+        self.current = 0
+        self.next_time = 0
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module maintains daily availability counters for the hosts and services.
+
+For each item and each day, the counters are:
+- the seconds spent in each HARD state (0: UP/OK, 1: DOWN/WARNING, 2: UNREACHABLE/CRITICAL,
+  3 and more: UNKNOWN)
+- the number of HARD state transitions
+- the seconds spent with an acknowledged problem
+
+The elapsed time between two check results of an item is accounted to the previous state.
+A check time of 0 (item not yet checked) is not a known state: the accounting of an item
+starts with its first check result.
+The counters are only kept in memory until they are flushed: the flushed rows are
+added to the rollups table rows (upsert), so the in-memory structures only hold the items
+last state and the day rows changed since the last flush.
+"""
+
+import time
+import datetime
+
+from array import array
+
+# Counters indexes in a day row
+OK_SECONDS = 0
+WARNING_SECONDS = 1
+CRITICAL_SECONDS = 2
+UNKNOWN_SECONDS = 3
+TRANSITIONS = 4
+ACKNOWLEDGED_SECONDS = 5
+COUNTERS = 6
+
+# SQL table is created by the module if needed
+CREATE_ROLLUPS_TABLE = u"""CREATE TABLE IF NOT EXISTS `%s` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `service_description` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `day` date NOT NULL,
+  `ok_seconds` int(11) NOT NULL DEFAULT '0',
+  `warning_seconds` int(11) NOT NULL DEFAULT '0',
+  `critical_seconds` int(11) NOT NULL DEFAULT '0',
+  `unknown_seconds` int(11) NOT NULL DEFAULT '0',
+  `transitions` int(11) NOT NULL DEFAULT '0',
+  `acknowledged_seconds` int(11) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `item_day` (`host_name`(100),`service_description`(100),`day`),
+  KEY `day` (`day`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci"""
+
+# Flushed rows are added to the existing rows
+UPSERT_ROLLUPS = u"""INSERT INTO `%s` (`host_name`, `service_description`, `day`,
+ `ok_seconds`, `warning_seconds`, `critical_seconds`, `unknown_seconds`,
+ `transitions`, `acknowledged_seconds`) VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)
+ ON DUPLICATE KEY UPDATE
+ `ok_seconds`=`ok_seconds`+VALUES(`ok_seconds`),
+ `warning_seconds`=`warning_seconds`+VALUES(`warning_seconds`),
+ `critical_seconds`=`critical_seconds`+VALUES(`critical_seconds`),
+ `unknown_seconds`=`unknown_seconds`+VALUES(`unknown_seconds`),
+ `transitions`=`transitions`+VALUES(`transitions`),
+ `acknowledged_seconds`=`acknowledged_seconds`+VALUES(`acknowledged_seconds`)"""
+
+
+class AvailabilityRollups(object):
+    """
+    Daily availability counters of the hosts and services
+    """
+
+    def __init__(self):
+        # (host_name, service_description) -> item index
+        self.items = {}
+        self.keys = []
+        # Items last known state, stored in compact arrays
+        self.states = array('b')
+        self.times = array('l')
+        self.acknowledged = bytearray()
+        # (item index, day ordinal) -> counters, only the rows changed since the last flush
+        self.days = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, key, timestamp, state_id, state_type_id, acknowledged, hard_state_id=0):
+        """Update the item counters with a check result
+
+        Only the HARD states are considered, a SOFT state keeps the previous HARD state. For
+        a new item in a SOFT state, hard_state_id is used as the initial HARD state.
+
+        A timestamp of 0 or less (item not yet checked) is not a known state.
+        """
+        timestamp = int(timestamp)
+        index = self.items.get(key)
+        if index is None:
+            index = self.items[key] = len(self.keys)
+            self.keys.append(key)
+            self.states.append(0)
+            self.times.append(0)
+            self.acknowledged.append(0)
+        if self.times[index] <= 0:
+            if timestamp > 0:
+                # First known state of the item
+                self.states[index] = state_id if state_type_id == 1 else hard_state_id
+                self.times[index] = timestamp
+                self.acknowledged[index] = 1 if acknowledged else 0
+            return
+
+        if timestamp > self.times[index]:
+            self.account(index, self.times[index], timestamp)
+            self.times[index] = timestamp
+
+        if state_type_id == 1 and state_id != self.states[index]:
+            self.states[index] = state_id
+            self.counters(index, timestamp)[TRANSITIONS] += 1
+        self.acknowledged[index] = 1 if acknowledged else 0
+
+    def account(self, index, start, end):
+        """Account the time between start and end to the item current state,
+        splitting on the days boundaries"""
+        state = min(self.states[index], UNKNOWN_SECONDS)
+        acknowledged = self.acknowledged[index]
+        while start < end:
+            day = datetime.date.fromtimestamp(start)
+            day_end = int(time.mktime((day + datetime.timedelta(days=1)).timetuple()))
+            chunk_end = min(end, day_end)
+            counters = self.counters(index, start)
+            counters[state] += chunk_end - start
+            if acknowledged:
+                counters[ACKNOWLEDGED_SECONDS] += chunk_end - start
+            start = chunk_end
+
+    def counters(self, index, timestamp):
+        """Get the item counters for the day of the timestamp"""
+        day_key = (index, datetime.date.fromtimestamp(timestamp).toordinal())
+        counters = self.days.get(day_key)
+        if counters is None:
+            counters = self.days[day_key] = array('l', [0] * COUNTERS)
+        return counters
+
+    def close(self, now):
+        """Account the time until now for all the items"""
+        now = int(now)
+        for index in range(len(self.keys)):
+            if self.times[index] > 0 and now > self.times[index]:
+                self.account(index, self.times[index], now)
+                self.times[index] = now
+
+    def pop_rows(self):
+        """Get the day rows changed since the last flush and forget about them
+
+        :return: list of (host_name, service_description, day, ok, warning, critical, unknown,
+        transitions, acknowledged) tuples
+        """
+        rows = []
+        for (index, day), counters in self.days.items():
+            host_name, service_description = self.keys[index]
+            rows.append((host_name, service_description,
+                         datetime.date.fromordinal(day).strftime('%Y-%m-%d')) +
+                        tuple(counters))
+        self.days = {}
+        return rows
+
+    def merge(self, rows):
+        """Merge back some rows that could not be flushed"""
+        for row in rows:
+            key = (row[0], row[1])
+            if key not in self.items:
+                continue
+            day = datetime.datetime.strptime(row[2], '%Y-%m-%d').toordinal()
+            day_key = (self.items[key], day)
+            counters = self.days.get(day_key)
+            if counters is None:
+                counters = self.days[day_key] = array('l', [0] * COUNTERS)
+            for idx, value in enumerate(row[3:]):
+                counters[idx] += value
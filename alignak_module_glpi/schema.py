@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module introspects the database schema of the module tables.
+
+The columns (with the strings maximum length) and the indexes of all the tables are fetched
+with one information_schema query, and the indexes the module write paths depend on are
+verified: without them, the state rows UPDATE statements are full table scans. For a missing
+index, the DDL to create it is provided.
+"""
+
+# Engine, columns and indexes of the tables, in one query. Rows are:
+# ('table', table, None, 0, engine, None, None)
+# ('column', table, column, position, data type, maximum length, maximum bytes length)
+# ('index', table, column, position in the index, index name, prefix length, non unique)
+SCHEMA_QUERY = u"""SELECT 'table', `TABLE_NAME`, NULL, 0, `ENGINE`, NULL, NULL
+ FROM `information_schema`.`TABLES`
+ WHERE `TABLE_SCHEMA`=%%s AND `TABLE_NAME` IN (%s)
+ UNION ALL
+ SELECT 'column', `TABLE_NAME`, `COLUMN_NAME`, `ORDINAL_POSITION`, `DATA_TYPE`,
+ `CHARACTER_MAXIMUM_LENGTH`, `CHARACTER_OCTET_LENGTH` FROM `information_schema`.`COLUMNS`
+ WHERE `TABLE_SCHEMA`=%%s AND `TABLE_NAME` IN (%s)
+ UNION ALL
+ SELECT 'index', `TABLE_NAME`, `COLUMN_NAME`, `SEQ_IN_INDEX`, `INDEX_NAME`, `SUB_PART`,
+ `NON_UNIQUE` FROM `information_schema`.`STATISTICS`
+ WHERE `TABLE_SCHEMA`=%%s AND `TABLE_NAME` IN (%s)"""
+
+# Indexes used by the state rows updates (WHERE host_name=... AND service_description=...)
+# and by the Glpi items lookups: list of (index name, columns)
+HOSTS_INDEXES = [('host_name', ['host_name']), ('itemtype', ['itemtype', 'items_id'])]
+SERVICES_INDEXES = [('service', ['host_name', 'service_description'])]
+
+# Indexed string columns prefix length, as in the Glpi monitoring plugin tables
+PREFIX_LENGTH = 50
+STRING_TYPES = ('char', 'varchar', 'text', 'tinytext', 'mediumtext', 'longtext')
+
+# Engines without transactions: the inserted rows of a failed statement are not rolled back
+NON_TRANSACTIONAL_ENGINES = ('MyISAM', 'Aria', 'MEMORY', 'ARCHIVE', 'CSV')
+
+
+class Table(object):
+    """
+    The columns and indexes of a table
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.engine = None
+        # column name -> data type, in the table order
+        self.columns = {}
+        self.positions = {}
+        # string column name -> (maximum length in characters, maximum length in bytes)
+        self.lengths = {}
+        # index name -> list of (column, prefix length), in the index order
+        self.indexes = {}
+        self.unique = set()
+
+    def is_transactional(self):
+        """Are the rows insertions rolled back on error? True if the engine is not known"""
+        return self.engine not in NON_TRANSACTIONAL_ENGINES
+
+    def column_names(self):
+        """Get the table columns names, in the table order"""
+        return sorted(self.columns, key=lambda column: self.positions[column])
+
+    def find_index(self, columns):
+        """Get the name of an index usable for a lookup on the columns
+
+        The columns must be the leading columns of the index, in the same order
+
+        :return: the index name, or None
+        """
+        for name, index_columns in sorted(self.indexes.items()):
+            if [column for column, _ in index_columns[:len(columns)]] == list(columns):
+                return name
+        return None
+
+    def find_unique_key(self, columns):
+        """Get the name of a unique key on exactly the columns, without prefix lengths
+
+        :return: the unique key name, or None
+        """
+        for name in sorted(self.unique):
+            if self.indexes[name] == [(column, None) for column in columns]:
+                return name
+        return None
+
+    def index_ddl(self, name, columns):
+        """Get the statement that creates an index on the columns"""
+        definitions = []
+        for column in columns:
+            if self.columns.get(column, 'varchar') in STRING_TYPES:
+                definitions.append('`%s`(%d)' % (column, PREFIX_LENGTH))
+            else:
+                definitions.append('`%s`' % column)
+        return u"ALTER TABLE `%s` ADD INDEX `%s` (%s)" % (self.name, name, ','.join(definitions))
+
+
+def introspect(cursor, database, tables):
+    """Get the columns and indexes of the tables
+
+    :param cursor: database cursor
+    :param database: database name
+    :param tables: tables names
+    :return: dictionary of the existing tables: table name -> Table
+    """
+    tables = list(tables)
+    placeholders = ', '.join(['%s'] * len(tables))
+    cursor.execute(SCHEMA_QUERY % (placeholders, placeholders, placeholders),
+                   [database] + tables + [database] + tables + [database] + tables)
+    result = {}
+    for kind, table, column, position, extra, sub_part, non_unique in cursor.fetchall():
+        if table not in result:
+            result[table] = Table(table)
+        if kind == 'table':
+            result[table].engine = extra
+        elif kind == 'column':
+            result[table].columns[column] = (extra or '').lower()
+            result[table].positions[column] = int(position)
+            if sub_part is not None and non_unique is not None:
+                result[table].lengths[column] = (int(sub_part), int(non_unique))
+        else:
+            result[table].indexes.setdefault(extra, []).append((int(position), column, sub_part))
+            if not int(non_unique):
+                result[table].unique.add(extra)
+    for table in result.values():
+        for name, index_columns in table.indexes.items():
+            table.indexes[name] = [(column, sub_part)
+                                   for _, column, sub_part in sorted(index_columns)]
+    return result
+
+
+def missing_indexes(table, required):
+    """Get the required indexes that are missing in a table
+
+    :param table: Table
+    :param required: list of (index name, columns) tuples
+    :return: list of (index name, columns, DDL) tuples
+    """
+    missing = []
+    for name, columns in required:
+        if table.find_index(columns) is None:
+            missing.append((name, columns, table.index_ddl(name, columns)))
+    return missing
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides a local stand-in for the Glpi monitoring plugin database, on the
+Python standard sqlite3 library, in memory or in a file.
+
+The connection and cursors objects provide the subset of the mysql.connector API used by
+the module. The MySQL statements are translated for SQLite:
+- `%s` and `%(name)s` parameters are replaced with `?` and `:name` parameters
+- `SHOW COLUMNS FROM table` is replaced with a table_info pragma
+- the module information_schema columns and indexes query is replaced with the table_info,
+  index_list and index_info pragmas (with the MySQL strings maximum lengths)
+- `INSERT ... ON DUPLICATE KEY UPDATE col=col+VALUES(col)` is replaced with an
+  `ON CONFLICT (unique key) DO UPDATE SET col=col+excluded.col` upsert
+- `INSERT IGNORE` is replaced with `INSERT OR IGNORE`
+- `CREATE TABLE` statements are translated (auto increment, keys, collations and engine)
+- `ALTER TABLE ... ADD [UNIQUE] KEY` statements are replaced with `CREATE INDEX` statements
+  and `ALTER TABLE ... ENGINE=` statements are ignored
+
+The monitoring plugin tables are created when connecting, with the configured tables names.
+"""
+
+import re
+import sqlite3
+
+# Monitoring plugin tables, as created by the Glpi monitoring plugin
+CREATE_HOSTS_TABLE = u"""CREATE TABLE IF NOT EXISTS `%s` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `entities_id` int(11) NOT NULL DEFAULT '0',
+  `itemtype` varchar(100) DEFAULT NULL,
+  `items_id` int(11) NOT NULL DEFAULT '0',
+  `name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `source` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `state` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `state_type` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `last_check` datetime DEFAULT NULL,
+  `output` text COLLATE utf8_unicode_ci DEFAULT NULL,
+  `perf_data` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `latency` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `execution_time` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `dependencies` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `is_acknowledged` tinyint(1) NOT NULL DEFAULT '0',
+  `is_acknowledgeconfirmed` tinyint(1) NOT NULL DEFAULT '0',
+  `acknowledge_comment` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `acknowledge_users_id` int(11) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  KEY `itemtype` (`itemtype`,`items_id`)
+) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci"""
+
+CREATE_SERVICES_TABLE = u"""CREATE TABLE IF NOT EXISTS `%s` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `entities_id` int(11) NOT NULL DEFAULT '0',
+  `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `service_description` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `plugin_monitoring_components_id` int(11) NOT NULL DEFAULT '0',
+  `plugin_monitoring_componentscatalogs_hosts_id` int(11) NOT NULL DEFAULT '0',
+  `source` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `state` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `state_type` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `last_check` datetime DEFAULT NULL,
+  `latency` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `execution_time` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `output` text COLLATE utf8_unicode_ci DEFAULT NULL,
+  `perf_data` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `arguments` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `networkports_id` int(11) NOT NULL DEFAULT '0',
+  `is_acknowledged` tinyint(1) NOT NULL DEFAULT '0',
+  `is_acknowledgeconfirmed` tinyint(1) NOT NULL DEFAULT '0',
+  `acknowledge_comment` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `acknowledge_users_id` int(11) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  KEY `service` (`host_name`(50),`service_description`(50)),
+  KEY `state` (`state`(50),`state_type`(50)),
+  KEY `plugin_monitoring_componentscatalogs_hosts_id`
+    (`plugin_monitoring_componentscatalogs_hosts_id`),
+  KEY `last_check` (`last_check`)
+) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci"""
+
+CREATE_SERVICEEVENTS_TABLE = u"""CREATE TABLE IF NOT EXISTS `%s` (
+  `id` bigint(30) NOT NULL AUTO_INCREMENT,
+  `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `service_description` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `plugin_monitoring_services_id` int(11) NOT NULL DEFAULT '-1',
+  `date` datetime DEFAULT NULL,
+  `state` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT '0',
+  `state_type` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT '0',
+  `state_id` tinyint(1) NOT NULL DEFAULT '0',
+  `state_type_id` tinyint(1) NOT NULL DEFAULT '0',
+  `last_state_id` tinyint(1) NOT NULL DEFAULT '0',
+  `last_hard_state_id` tinyint(1) NOT NULL DEFAULT '0',
+  `output` text COLLATE utf8_unicode_ci DEFAULT NULL,
+  `perf_data` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  `unavailability` tinyint(1) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`id`),
+  KEY `plugin_monitoring_services_id` (`plugin_monitoring_services_id`),
+  KEY `plugin_monitoring_services_id_2` (`plugin_monitoring_services_id`,`date`),
+  KEY `plugin_monitoring_services_id_3` (`plugin_monitoring_services_id`,`id`),
+  KEY `service` (`host_name`(50),`service_description`(50)),
+  KEY `unavailability` (`unavailability`,`state_type`,`plugin_monitoring_services_id`)
+) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci"""
+
+CREATE_RECORDS_TABLE = u"""CREATE TABLE IF NOT EXISTS `%s` (
+  `id` bigint(30) NOT NULL AUTO_INCREMENT,
+  `host_name` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `service_description` varchar(255) COLLATE utf8_unicode_ci NOT NULL DEFAULT 'not_set',
+  `last_check` datetime DEFAULT NULL,
+  `source` varchar(255) COLLATE utf8_unicode_ci DEFAULT NULL,
+  `output` text COLLATE utf8_unicode_ci DEFAULT NULL,
+  `perf_data` text DEFAULT NULL COLLATE utf8_unicode_ci,
+  PRIMARY KEY (`id`),
+  KEY `service` (`host_name`(50),`service_description`(50),`last_check`)
+) ENGINE=MyISAM  DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci"""
+
+SHOW_COLUMNS = re.compile(r"^\s*SHOW\s+COLUMNS\s+FROM\s+`?(\w+)`?\s*$", re.IGNORECASE)
+INFORMATION_SCHEMA = re.compile(r"\s+FROM\s+`?information_schema`?\.", re.IGNORECASE)
+COLUMN_TYPE = re.compile(r"^\s*(\w+)")
+STRING_COLUMN_TYPE = re.compile(r"^\s*((?:var)?char|(?:tiny|medium|long)?text)\s*(?:\((\d+)\))?",
+                                re.IGNORECASE)
+TEXT_LENGTHS = {'tinytext': 255, 'text': 65535, 'mediumtext': 16777215, 'longtext': 4294967295}
+CREATE_TABLE = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)`?\s*\(",
+                          re.IGNORECASE)
+ALTER_TABLE = re.compile(r"^\s*ALTER\s+TABLE\s+`?(\w+)`?\s+(.*?)\s*$", re.IGNORECASE | re.DOTALL)
+ALTER_ENGINE = re.compile(r"^ENGINE\s*=\s*\w+$", re.IGNORECASE)
+ALTER_ADD = re.compile(r"^ADD\s+", re.IGNORECASE)
+INSERT_INTO = re.compile(r"^\s*INSERT\s+INTO\s+`?(\w+)`?", re.IGNORECASE)
+INSERT_IGNORE = re.compile(r"^\s*INSERT\s+IGNORE\s+", re.IGNORECASE)
+ON_DUPLICATE_KEY = re.compile(r"\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+", re.IGNORECASE)
+PARAMETERS = re.compile(r"%\((\w+)\)s|%s|%%")
+KEY_DEFINITION = re.compile(r"^(UNIQUE\s+(?:KEY|INDEX)|UNIQUE|KEY|INDEX)\s+`?(\w+)`?\s*\((.*)\)$",
+                            re.IGNORECASE)
+KEY_COLUMN = re.compile(r"`?(\w+)`?(?:\(\d+\))?")
+
+
+def translate_parameters(query):
+    """Replace the MySQL format parameters with the SQLite parameters"""
+    def replace(match):
+        """Replace a parameter"""
+        if match.group(1):
+            return ':%s' % match.group(1)
+        return '?' if match.group(0) == '%s' else '%'
+    return PARAMETERS.sub(replace, query)
+
+
+def column_lengths(column_type):
+    """Get the maximum length in characters and in bytes of a MySQL string column type,
+    (None, None) for the other types
+
+    The bytes length of the char and varchar columns is for the utf8 (3 bytes) character set
+    """
+    match = STRING_COLUMN_TYPE.match(column_type)
+    if match is None:
+        return (None, None)
+    if match.group(2):
+        return (int(match.group(2)), int(match.group(2)) * 3)
+    length = TEXT_LENGTHS.get(match.group(1).lower())
+    return (length, length) if length else (None, None)
+
+
+def key_statement(table, definition):
+    """Translate a key definition for a table
+
+    :return: (SQLite CREATE INDEX statement, unique key columns or None), or None if the
+    definition is not a key definition
+    """
+    key = KEY_DEFINITION.match(re.sub(r"\s+", ' ', definition))
+    if not key:
+        return None
+    key_columns = KEY_COLUMN.findall(key.group(3))
+    unique = key.group(1).upper().startswith('UNIQUE')
+    statement = "CREATE %sINDEX IF NOT EXISTS `%s_%s` ON `%s` (%s)" % (
+        'UNIQUE ' if unique else '', table, key.group(2), table,
+        ', '.join(['`%s`' % column for column in key_columns]))
+    return statement, key_columns if unique else None
+
+
+def split_definitions(body):
+    """Split a CREATE TABLE body on the top level commas"""
+    definitions = []
+    depth = 0
+    current = []
+    for char in body:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            definitions.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        definitions.append(''.join(current).strip())
+    return definitions
+
+
+def translate_create_table(query):
+    """Translate a MySQL CREATE TABLE statement
+
+    :return: (table name, list of SQLite statements, list of the unique keys columns)
+    """
+    table = CREATE_TABLE.match(query).group(1)
+    body = query[query.index('(') + 1:query.rindex(')')]
+
+    columns = []
+    indexes = []
+    unique_keys = []
+    auto_increment = False
+    for definition in split_definitions(body):
+        definition = re.sub(r"\s+", ' ', definition)
+        key = key_statement(table, definition)
+        if key:
+            indexes.append(key[0])
+            if key[1]:
+                unique_keys.append(key[1])
+            continue
+        if definition.upper().startswith('PRIMARY KEY'):
+            if not auto_increment:
+                columns.append(definition)
+            continue
+        definition = re.sub(r"\s+COLLATE\s+\w+", '', definition, flags=re.IGNORECASE)
+        if 'AUTO_INCREMENT' in definition.upper():
+            auto_increment = True
+            definition = "%s INTEGER PRIMARY KEY AUTOINCREMENT" % definition.split(' ')[0]
+        columns.append(definition)
+
+    statements = ["CREATE TABLE IF NOT EXISTS `%s` (%s)" % (table, ', '.join(columns))]
+    return table, statements + indexes, unique_keys
+
+
+class Cursor(object):
+    """
+    A mysql.connector like cursor on a SQLite connection
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.sqlite.cursor()
+        self.statement = None
+        self.rowcount = -1
+        self.rows = None
+
+    def translate(self, query):
+        """Translate a MySQL statement for SQLite"""
+        insert = INSERT_INTO.match(query)
+        if insert and ON_DUPLICATE_KEY.search(query):
+            query, updates = ON_DUPLICATE_KEY.split(query, 1)
+            unique_keys = self.connection.unique_keys.get(insert.group(1))
+            if not unique_keys:
+                # Unique keys created by another connection
+                unique_keys = self.connection.unique_keys[insert.group(1)] = \
+                    self.database_unique_keys(insert.group(1))
+            if not unique_keys:
+                raise sqlite3.OperationalError("no unique key for the table %s"
+                                               % insert.group(1))
+            updates = re.sub(r"VALUES\(`?(\w+)`?\)", r"excluded.`\1`", updates)
+            query = "%s ON CONFLICT (%s) DO UPDATE SET %s" % (
+                query, ', '.join(['`%s`' % column for column in unique_keys[0]]), updates)
+        if INSERT_IGNORE.match(query):
+            query = INSERT_IGNORE.sub("INSERT OR IGNORE ", query, 1)
+        return translate_parameters(query)
+
+    def database_unique_keys(self, table):
+        """Get the unique keys columns of a table from the database"""
+        unique_keys = []
+        self.cursor.execute("PRAGMA index_list(`%s`)" % table)
+        for index in self.cursor.fetchall():
+            # seq, name, unique, origin (c: CREATE INDEX, u: UNIQUE constraint, pk)
+            if index[2] and index[3] != 'pk':
+                self.cursor.execute("PRAGMA index_info(`%s`)" % index[1])
+                unique_keys.append([row[2] for row in sorted(self.cursor.fetchall())])
+        return unique_keys
+
+    def execute(self, query, params=None):
+        """Execute a statement"""
+        self.statement = query
+        self.rows = None
+        show_columns = SHOW_COLUMNS.match(query)
+        if show_columns:
+            # Field, Type, Null, Key, Default, Extra, as MySQL does
+            self.cursor.execute("PRAGMA table_info(`%s`)" % show_columns.group(1))
+            self.rows = [(row[1], row[2], 'NO' if row[3] else 'YES', 'PRI' if row[5] else '',
+                          row[4], '') for row in self.cursor.fetchall()]
+            if not self.rows:
+                raise sqlite3.OperationalError("Table '%s' doesn't exist"
+                                               % show_columns.group(1))
+            self.rowcount = len(self.rows)
+            return
+
+        if INFORMATION_SCHEMA.search(query):
+            # Parameters are the database and the tables names, for each part of the query
+            self.rows = self.schema_rows(
+                params[1:len(params) // (query.count('UNION ALL') + 1)])
+            self.rowcount = len(self.rows)
+            return
+
+        if CREATE_TABLE.match(query):
+            table, statements, unique_keys = translate_create_table(query)
+            for statement in statements:
+                self.cursor.execute(statement)
+            self.connection.unique_keys[table] = unique_keys
+            self.rowcount = 0
+            return
+
+        alter_table = ALTER_TABLE.match(query)
+        if alter_table:
+            self.alter_table(alter_table.group(1), alter_table.group(2))
+            return
+
+        self.cursor.execute(self.translate(query), params if params is not None else ())
+        self.rowcount = self.cursor.rowcount
+
+    def alter_table(self, table, specification):
+        """Translate an ALTER TABLE statement: only the engine changes (ignored) and the
+        keys additions are supported"""
+        self.rowcount = 0
+        if ALTER_ENGINE.match(specification):
+            return
+        key = key_statement(table, ALTER_ADD.sub('', specification))
+        if not ALTER_ADD.match(specification) or not key:
+            raise sqlite3.OperationalError("unsupported ALTER TABLE statement: %s"
+                                           % specification)
+        self.cursor.execute(key[0])
+        if key[1]:
+            self.connection.unique_keys.setdefault(table, []).append(key[1])
+
+    def schema_rows(self, tables):
+        """Get the columns and indexes rows of the tables, as the module information_schema
+        query does (see the schema module)"""
+        rows = []
+        for table in tables:
+            self.cursor.execute("PRAGMA table_info(`%s`)" % table)
+            columns = self.cursor.fetchall()
+            if not columns:
+                continue
+            rows.append(('table', table, None, 0, 'SQLite', None, None))
+            for row in columns:
+                column_type = COLUMN_TYPE.match(row[2] or '')
+                rows.append(('column', table, row[1], row[0] + 1,
+                             column_type.group(1).lower() if column_type else '') +
+                            column_lengths(row[2] or ''))
+                if row[5]:
+                    rows.append(('index', table, row[1], row[5], 'PRIMARY', None, 0))
+            self.cursor.execute("PRAGMA index_list(`%s`)" % table)
+            for index in self.cursor.fetchall():
+                # Indexes are created with the table name prefix
+                name = index[1]
+                if name.startswith('%s_' % table):
+                    name = name[len(table) + 1:]
+                self.cursor.execute("PRAGMA index_info(`%s`)" % index[1])
+                for position, _, column in self.cursor.fetchall():
+                    rows.append(('index', table, column, position + 1, name, None,
+                                 0 if index[2] else 1))
+        return rows
+
+    def executemany(self, query, seq_params):
+        """Execute a statement for each parameters of the sequence"""
+        self.statement = query
+        self.rows = None
+        self.cursor.executemany(self.translate(query), seq_params)
+        self.rowcount = self.cursor.rowcount
+
+    def fetchone(self):
+        """Get the next row"""
+        if self.rows is not None:
+            return self.rows.pop(0) if self.rows else None
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        """Get all the remaining rows"""
+        if self.rows is not None:
+            rows, self.rows = self.rows, []
+            return rows
+        return self.cursor.fetchall()
+
+    def close(self):
+        """Close the cursor"""
+        self.cursor.close()
+
+
+class Connection(object):
+    """
+    A mysql.connector like connection on a SQLite database
+    """
+
+    def __init__(self, database=':memory:', tables=None):
+        self.database = database
+        self.sqlite = None
+        # table name -> list of unique keys columns
+        self.unique_keys = {}
+        self.tables = tables or {}
+        self.reconnect()
+
+    def reconnect(self, attempts=1, delay=0):
+        # pylint: disable=unused-argument
+        """(Re)open the SQLite database and create the missing tables"""
+        if self.sqlite is not None:
+            return
+        self.sqlite = sqlite3.connect(self.database, check_same_thread=False)
+        cursor = self.cursor()
+        for table, create_table in self.tables.items():
+            cursor.execute(create_table % table)
+        self.commit()
+        cursor.close()
+
+    def is_connected(self):
+        """Is the database opened?"""
+        return self.sqlite is not None
+
+    def cursor(self, prepared=False):
+        # pylint: disable=unused-argument
+        """Get a new cursor"""
+        return Cursor(self)
+
+    def set_charset_collation(self, charset=None, collation=None):
+        """SQLite databases are always UTF-8 encoded"""
+
+    @staticmethod
+    def get_server_info():
+        """Get the database server information"""
+        return 'SQLite'
+
+    @staticmethod
+    def get_server_version():
+        """Get the database server version"""
+        return sqlite3.sqlite_version_info
+
+    def commit(self):
+        """Commit the current transaction"""
+        self.sqlite.commit()
+
+    def rollback(self):
+        """Rollback the current transaction"""
+        self.sqlite.rollback()
+
+    def close(self):
+        """Close the database"""
+        if self.sqlite is not None:
+            self.sqlite.close()
+            self.sqlite = None
+
+
+def connect(database=':memory:', tables=None):
+    """Open a SQLite database and create the missing tables
+
+    :param database: database file name, or :memory:
+    :param tables: dictionary of the tables to create: table name -> CREATE TABLE statement
+    """
+    return Connection(database, tables)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module provides a watchdog for the module main loop.
+
+The main loop (and the database writer) record heartbeats. A watchdog thread checks the
+heartbeats periodically: when a heartbeat is older than the stall threshold, the stall
+handler is called once for this stall, and when the heartbeat is recorded again, the
+recovery handler is called. The heartbeats are recorded and checked with a lock, the
+handlers are called out of the lock.
+"""
+
+import sys
+import time
+import threading
+import traceback
+
+
+def thread_stacks():
+    """Get the stacks of all the threads of the process, as a string"""
+    names = dict([(thread.ident, thread.name) for thread in threading.enumerate()])
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+        stacks.append("Thread %s (%s):\n%s" % (names.get(thread_id, 'unknown'), thread_id,
+                                               ''.join(traceback.format_stack(frame))))
+    return '\n'.join(stacks)
+
+
+class Watchdog(object):
+    """
+    Watch the heartbeats, and call on_stall(name, elapsed) when a heartbeat is older than
+    threshold seconds and on_recovery(name, elapsed) when a stalled heartbeat is recorded again
+    """
+
+    def __init__(self, threshold=300, on_stall=None, on_recovery=None, interval=None):
+        self.threshold = threshold
+        self.interval = interval or max(1.0, min(10.0, threshold / 5.0))
+        self.on_stall = on_stall
+        self.on_recovery = on_recovery
+        # heartbeat name -> last heartbeat time, only the active heartbeats
+        self.heartbeats = {}
+        # heartbeat name -> stall start
+        self.stalled = {}
+        self.stalls = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def beat(self, name):
+        """Record a heartbeat"""
+        with self.lock:
+            self.heartbeats[name] = time.time()
+        self.recover(name)
+
+    def idle(self, name):
+        """The heartbeat is not active anymore (eg. the writer is not writing)"""
+        with self.lock:
+            self.heartbeats.pop(name, None)
+        self.recover(name)
+
+    def recover(self, name):
+        """Call the recovery handler if the heartbeat was stalled"""
+        with self.lock:
+            since = self.stalled.pop(name, None)
+        if since is not None and self.on_recovery is not None:
+            self.on_recovery(name, time.time() - since)
+
+    def check(self, now=None):
+        """Check the heartbeats
+
+        :return: list of (name, elapsed) of the newly stalled heartbeats
+        """
+        if now is None:
+            now = time.time()
+        stalled = []
+        with self.lock:
+            for name, last in self.heartbeats.items():
+                if now - last >= self.threshold and name not in self.stalled:
+                    self.stalled[name] = last
+                    self.stalls += 1
+                    stalled.append((name, now - last))
+        return stalled
+
+    def run(self):
+        """Watchdog thread"""
+        while not self.stopped.wait(self.interval):
+            for name, elapsed in self.check():
+                if self.on_stall is not None:
+                    self.on_stall(name, elapsed)
+
+    def start(self):
+        """Start the watchdog thread"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='glpi-watchdog')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the watchdog thread"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Queued rows compression and interning benchmark.
+
+The database is not available (outage): the check result broks of a synthetic fleet are
+driven through the module and the services events rows are only queued. For each
+compression mode (`queue_compression` parameter), with and without the interned strings
+(`interned_names` and `interned_outputs` parameters) and for each long output size, the
+result is a JSON document with the memory of a queued event and the peak memory of the
+backlog (measured with tracemalloc), the per brok processing time and the per row time to get
+the values when the rows are inserted (decompression). Run with::
+
+    python -m benchmarks.bench_compression --services 10000 --long-output-lines 0,5,20
+"""
+
+from __future__ import print_function
+
+import gc
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.compression import expand_row
+
+from benchmarks.synthetic import Fleet
+from benchmarks.bench_throughput import DEFAULT_CONFIGURATION, Stage, manage_broks, peak_rss
+
+COMPRESSIONS = ['', 'zlib']
+INTERNING = [False, True]
+
+
+def build_instance(fleet, configuration, compression, interning=True):
+    """Build a module instance with the fleet initial status"""
+    configuration = dict(configuration)
+    if not interning:
+        configuration.update({'interned_names': '0', 'interned_outputs': '0'})
+    configuration.update({
+        'queue_compression': compression, 'events_dedup_window': '0',
+        'update_hosts': '0', 'update_services': '0', 'update_services_events': '1'
+    })
+    instance = alignak_module_glpi.get_instance(Module(configuration))
+    instance.init()
+    manage_broks(instance, Stage('initial_status'), list(fleet.initial_broks()))
+    return instance
+
+
+def queued_memory(fleet, configuration, compression, interning, rounds):
+    """Measure the memory retained by the queued events rows
+
+    The broks are built and released during the measure, as the broks received by the module,
+    only the memory still allocated after the rounds is accounted.
+
+    :return: (allocated bytes, peak allocated bytes, queued rows)
+    """
+    instance = build_instance(fleet, configuration, compression, interning)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for round_number in range(1, rounds + 1):
+            manage_broks(instance, Stage('check_result'),
+                         list(fleet.check_result_broks(round_number)))
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current - before, peak - before, len(instance.events_cache)
+
+
+def run_scenario(fleet_options, configuration, compression, interning=True, rounds=1):
+    """Run the benchmark for a compression mode, with or without interning, and a fleet
+
+    :return: the scenario report
+    """
+    # The processing time is measured without tracing the memory allocations
+    fleet = Fleet(**fleet_options)
+    instance = build_instance(fleet, configuration, compression, interning)
+    stage = Stage('check_result')
+    for round_number in range(1, rounds + 1):
+        manage_broks(instance, stage, list(fleet.check_result_broks(round_number)))
+    queued = list(instance.events_cache)
+
+    expand = Stage('expand')
+    if instance.compressor is not None:
+        expand.time(lambda: [expand_row(row) for row in queued])
+    else:
+        expand.time(lambda: [tuple(row.values()) for row in queued])
+    expand.rows = len(queued)
+
+    allocated, peak, rows = queued_memory(Fleet(**fleet_options), configuration, compression,
+                                          interning, rounds)
+    report = {
+        'compression': compression or 'none',
+        'interning': interning,
+        'long_output_lines': fleet_options['long_output_lines'],
+        'queued': len(queued),
+        'bytes_per_event': allocated // rows if rows else 0,
+        'peak_backlog_bytes': peak,
+        'brok_seconds': sum(stage.latencies) / stage.broks if stage.broks else 0.0,
+        'expand_seconds_per_row': sum(expand.latencies) / len(queued) if queued else 0.0,
+        'compression_ratio': instance.compressor.ratio() if instance.compressor else 1.0,
+        'stage': stage.report()
+    }
+    instance.do_stop()
+    return report
+
+
+def run(fleet_options, configuration, long_output_lines, rounds=1):
+    """Run the benchmark scenarios
+
+    :return: the benchmark report
+    """
+    report = {
+        'benchmark': 'compression',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'services': len(Fleet(**fleet_options)),
+        'rounds': rounds,
+        'scenarios': []
+    }
+    for lines in long_output_lines:
+        for compression in COMPRESSIONS:
+            for interning in INTERNING:
+                options = dict(fleet_options, long_output_lines=lines)
+                report['scenarios'].append(run_scenario(options, configuration, compression,
+                                                        interning, rounds))
+    report['peak_rss'] = peak_rss()
+    return report
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--services', type=int, default=1000,
+                        help='services count (default: 1000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='check results rounds (default: 10)')
+    parser.add_argument('--long-output-lines', default='0,5,20',
+                        help='comma separated long output lines counts (default: 0,5,20)')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    hosts = max(1, -(-options.services // options.services_per_host))
+    report = run({'hosts': hosts, 'services_per_host': options.services_per_host},
+                 dict(DEFAULT_CONFIGURATION),
+                 [int(lines) for lines in options.long_output_lines.split(',')],
+                 options.rounds)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
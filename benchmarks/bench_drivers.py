@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Database drivers benchmark.
+
+For each database driver, the check result broks of a synthetic fleet are driven through the
+module to build the services events rows, and the rows are bulk inserted (executemany) in a
+benchmark events table, created for the benchmark and dropped afterwards. The result is a
+JSON document with, for each driver, the row building and executemany throughput. Run with::
+
+    python -m benchmarks.bench_drivers --services 10000 --host 127.0.0.1 --user alignak \
+        --password alignak --database glpi_benchmark
+
+The MySQL drivers need a MySQL server, the sqlite driver runs against the SQLite stand-in
+database. A driver that is not installed or that can not connect is reported with its error.
+"""
+
+from __future__ import print_function
+
+import copy
+import json
+import time
+import logging
+import argparse
+import platform
+
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import drivers as db_drivers
+from alignak_module_glpi.sqlite import CREATE_SERVICEEVENTS_TABLE
+
+from benchmarks.synthetic import Fleet
+from benchmarks.bench_throughput import DEFAULT_CONFIGURATION, Stage, manage_broks, \
+    bulk_insert, peak_rss
+
+
+def run_driver(driver, fleet, configuration, rounds=1):
+    """Run the benchmark for a driver
+
+    :return: the driver report
+    """
+    configuration = dict(configuration)
+    configuration.update({
+        'db_driver': driver, 'fake_db': '0',
+        'update_hosts': '0', 'update_services': '0', 'update_services_events': '1'
+    })
+    instance = alignak_module_glpi.get_instance(Module(configuration))
+    if not instance.open():
+        # Connect again to get the connection error
+        try:
+            db_drivers.connect(driver, host=instance.host, port=instance.port,
+                               database=instance.database, user=instance.user,
+                               password=instance.password)
+        except Exception as exp:  # pylint: disable=broad-except
+            return {'error': str(exp)}
+        return {'error': 'database connection failed'}
+
+    table = instance.serviceevents_table
+    try:
+        cursor = instance.db.cursor()
+        cursor.execute(CREATE_SERVICEEVENTS_TABLE % table)
+        instance.db.commit()
+        instance.check_database()
+        if not instance.update_services_events:
+            return {'error': 'the benchmark table %s is not usable' % table}
+
+        stages = {'row_building': Stage('row_building'), 'executemany': Stage('executemany')}
+        manage_broks(instance, Stage('initial_status'), list(fleet.initial_broks()))
+        for round_number in range(1, rounds + 1):
+            manage_broks(instance, stages['row_building'],
+                         list(fleet.check_result_broks(round_number)))
+            bulk_insert(instance, stages['executemany'])
+
+        elapsed = sum([sum(stage.latencies) for stage in stages.values()])
+        rows = stages['executemany'].rows
+        report = {
+            'server': '%s' % instance.db.get_server_info(),
+            'rows': rows,
+            'rows_per_second': rows / elapsed if elapsed else 0.0,
+            'stages': dict([(name, stage.report()) for name, stage in stages.items()])
+        }
+        cursor.execute("DROP TABLE `%s`" % table)
+        instance.db.commit()
+        return report
+    finally:
+        instance.close()
+
+
+def run(drivers, fleet, configuration, rounds=1):
+    """Run the benchmark for all the drivers
+
+    :return: the benchmark report
+    """
+    report = {
+        'benchmark': 'drivers',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'services': len(fleet),
+        'rounds': rounds,
+        'drivers': {}
+    }
+    for driver in drivers:
+        start = time.time()
+        try:
+            # Same broks for each driver
+            report['drivers'][driver] = run_driver(driver, copy.deepcopy(fleet),
+                                                   configuration, rounds)
+        except Exception as exp:  # pylint: disable=broad-except
+            report['drivers'][driver] = {'error': str(exp)}
+        report['drivers'][driver]['elapsed'] = time.time() - start
+    report['peak_rss'] = peak_rss()
+    return report
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--drivers', default=','.join(db_drivers.DRIVERS),
+                        help='comma separated drivers list (default: all the drivers)')
+    parser.add_argument('--services', type=int, default=1000,
+                        help='services count (default: 1000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='check results rounds (default: 3)')
+    parser.add_argument('--commit-volume', default='1000',
+                        help='rows per executemany (default: 1000)')
+    parser.add_argument('--table', default='alignak_benchmark_serviceevents',
+                        help='benchmark events table, created and dropped by the benchmark')
+    parser.add_argument('--host', default='127.0.0.1', help='MySQL server')
+    parser.add_argument('--port', default='3306', help='MySQL server port')
+    parser.add_argument('--database', default='glpi', help='MySQL database')
+    parser.add_argument('--user', default='alignak', help='MySQL user')
+    parser.add_argument('--password', default='alignak', help='MySQL password')
+    parser.add_argument('--sqlite-database', default=':memory:', help='SQLite database')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    configuration = dict(DEFAULT_CONFIGURATION)
+    configuration.update({
+        'host': options.host, 'port': options.port, 'database': options.database,
+        'user': options.user, 'password': options.password,
+        'sqlite_database': options.sqlite_database,
+        'serviceevents_table': options.table, 'commit_volume': options.commit_volume
+    })
+    hosts = max(1, -(-options.services // options.services_per_host))
+    fleet = Fleet(hosts, options.services_per_host)
+    report = run([driver.strip() for driver in options.drivers.split(',')], fleet,
+                 configuration, options.rounds)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per item logging benchmark.
+
+The initial status and check result broks of a synthetic fleet are driven through the module
+with the module logs at INFO level, written to a log file (/dev/null by default), first with
+all the per item messages logged (log_sample=1, log_rate=0) and then with the default sampled
+and rate limited messages. The result is a JSON document with, for each run, the per brok
+latency of each stage and the number of log lines, and the per brok saving. Run with::
+
+    python -m benchmarks.bench_logging --services 10000
+"""
+
+from __future__ import print_function
+
+import os
+import copy
+import json
+import time
+import logging
+import argparse
+import platform
+
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+
+from benchmarks.synthetic import Fleet
+from benchmarks.bench_throughput import DEFAULT_CONFIGURATION, Stage, manage_broks, peak_rss
+
+# Per item messages logged / sampled and rate limited (module defaults)
+RUNS = (
+    ('all', {'log_sample': '1', 'log_rate': '0'}),
+    ('sampled', {})
+)
+
+
+class CountingHandler(logging.FileHandler):
+    """
+    A log file handler that counts the log lines
+    """
+
+    def __init__(self, filename):
+        logging.FileHandler.__init__(self, filename)
+        self.lines = 0
+
+    def emit(self, record):
+        self.lines += 1
+        logging.FileHandler.emit(self, record)
+
+
+def run_logging(fleet, configuration, log_file, rounds=1):
+    """Run the benchmark for a logging configuration
+
+    :return: the run report
+    """
+    # The module logs with its alias logger
+    logger = logging.getLogger('alignak.module.%s' % configuration['module_alias'])
+    handler = CountingHandler(log_file)
+    logger.addHandler(handler)
+    propagate, logger.propagate = logger.propagate, False
+    try:
+        instance = alignak_module_glpi.get_instance(Module(configuration))
+        instance.init()
+        handler.lines = 0
+
+        stages = {'initial_status': Stage('initial_status'),
+                  'check_result': Stage('check_result')}
+        manage_broks(instance, stages['initial_status'], list(fleet.initial_broks()))
+        for round_number in range(1, rounds + 1):
+            manage_broks(instance, stages['check_result'],
+                         list(fleet.check_result_broks(round_number)))
+        instance.log_summary()
+        instance.do_stop()
+
+        report = {'log_lines': handler.lines, 'stages': {}}
+        for name, stage in stages.items():
+            report['stages'][name] = stage.report()
+            report['stages'][name]['per_brok'] = \
+                sum(stage.latencies) / stage.broks if stage.broks else 0.0
+        return report
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = propagate
+        handler.close()
+
+
+def run(fleet, configuration, log_file=os.devnull, rounds=1):
+    """Run the benchmark for all the logging configurations
+
+    :return: the benchmark report
+    """
+    report = {
+        'benchmark': 'logging',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'services': len(fleet),
+        'rounds': rounds,
+        'runs': {}
+    }
+    for name, parameters in RUNS:
+        run_configuration = dict(configuration)
+        run_configuration.update(parameters)
+        # Same broks for each run
+        report['runs'][name] = run_logging(copy.deepcopy(fleet), run_configuration, log_file,
+                                           rounds)
+
+    report['saving'] = {}
+    for stage in report['runs']['all']['stages']:
+        logged = report['runs']['all']['stages'][stage]['per_brok']
+        sampled = report['runs']['sampled']['stages'][stage]['per_brok']
+        report['saving'][stage] = {
+            'per_brok': logged - sampled,
+            'percent': 100.0 * (logged - sampled) / logged if logged else 0.0
+        }
+    report['peak_rss'] = peak_rss()
+    return report
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--services', type=int, default=1000,
+                        help='services count (default: 1000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='check results rounds (default: 3)')
+    parser.add_argument('--log-file', default=os.devnull,
+                        help='module log file (default: %s)' % os.devnull)
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    configuration = dict(DEFAULT_CONFIGURATION)
+    configuration['log_level'] = 'INFO'
+    hosts = max(1, -(-options.services // options.services_per_host))
+    fleet = Fleet(hosts, options.services_per_host)
+    report = run(fleet, configuration, options.log_file, options.rounds)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
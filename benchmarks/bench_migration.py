@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Concurrent writes benchmark of the schema migration.
+
+A benchmark services table is created as the Glpi monitoring plugin creates it (MyISAM, prefix
+index on the host and service names) and filled with the services state rows. Concurrent
+writers (one database connection each) update the state rows, before and after the table
+migration (InnoDB engine and unique key, see alignak_module_glpi.migrate). After the
+migration, the writers also upsert the state rows (INSERT ... ON DUPLICATE KEY UPDATE). The
+result is a JSON document with the rows/s throughput of each run. Run with::
+
+    python -m benchmarks.bench_migration --services 10000 --writers 4 --host 127.0.0.1 \
+        --user alignak --password alignak --database glpi_benchmark
+
+The benchmark table is created for the benchmark and dropped afterwards. With the sqlite
+driver, the SQLite stand-in database is a temporary file shared by the writers.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+
+from alignak_module_glpi import drivers as db_drivers
+from alignak_module_glpi import migrate, schema
+from alignak_module_glpi.sqlite import CREATE_SERVICES_TABLE
+
+from benchmarks.bench_throughput import peak_rss
+
+INSERT_QUERY = u"""INSERT INTO `%s` (`host_name`, `service_description`, `state`, `last_check`,
+ `output`) VALUES (%%s, %%s, %%s, %%s, %%s)"""
+UPDATE_QUERY = u"""UPDATE `%s` SET `state`=%%s, `last_check`=%%s, `output`=%%s
+ WHERE `host_name`=%%s AND `service_description`=%%s"""
+UPSERT_QUERY = INSERT_QUERY + u""" ON DUPLICATE KEY UPDATE `state`=VALUES(`state`),
+ `last_check`=VALUES(`last_check`), `output`=VALUES(`output`)"""
+
+
+def services_rows(services, services_per_host, round_number=0):
+    """Get the services state rows: (host_name, service_description, state, last_check,
+    output)"""
+    last_check = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(1500000000 + round_number))
+    return [('host-%06d' % (idx // services_per_host), 'service-%03d' % (idx % services_per_host),
+             ['OK', 'WARNING', 'CRITICAL'][(idx + round_number) % 3], last_check,
+             'round %d' % round_number) for idx in range(services)]
+
+
+def write(connect, query, rows, batch, errors):
+    """Write the rows with a new connection, one commit per batch"""
+    try:
+        db = connect()
+        cursor = db.cursor(prepared=True)
+        for start in range(0, len(rows), batch):
+            cursor.executemany(query, rows[start:start + batch])
+            db.commit()
+        db.close()
+    except Exception as exp:  # pylint: disable=broad-except
+        errors.append(str(exp))
+
+
+def run_writers(connect, query, rows, writers, batch):
+    """Write the rows with concurrent writers
+
+    :return: the run report
+    """
+    errors = []
+    threads = [threading.Thread(target=write, args=(connect, query, rows[idx::writers], batch,
+                                                    errors))
+               for idx in range(writers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    return {
+        'rows': len(rows),
+        'elapsed': elapsed,
+        'rows_per_second': len(rows) / elapsed if elapsed and not errors else 0.0,
+        'errors': errors
+    }
+
+
+def run(connect, database, table, services, services_per_host=10, writers=4, rounds=3,
+        batch=100):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """Run the benchmark
+
+    :param connect: function that returns a new database connection
+    :return: the benchmark report
+    """
+    report = {
+        'benchmark': 'migration',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'services': services,
+        'writers': writers,
+        'rounds': rounds,
+        'batch': batch
+    }
+    db = connect()
+    cursor = db.cursor()
+    try:
+        cursor.execute(u"DROP TABLE IF EXISTS `%s`" % table)
+        cursor.execute(CREATE_SERVICES_TABLE % table)
+        cursor.executemany(INSERT_QUERY % table, services_rows(services, services_per_host))
+        db.commit()
+        report['server'] = '%s' % db.get_server_info()
+
+        runs = [('before', 'update', UPDATE_QUERY), (None, None, None),
+                ('after', 'update', UPDATE_QUERY), ('after', 'upsert', UPSERT_QUERY)]
+        round_number = 0
+        for stage, name, query in runs:
+            if stage is None:
+                # Migrate the table
+                tables = schema.introspect(cursor, database, [table])
+                steps, report['notes'] = migrate.plan_table(
+                    cursor, tables[table], migrate.UNIQUE_KEYS['services_table'])
+                for step in steps:
+                    start = time.time()
+                    cursor.execute(step.statement)
+                    db.commit()
+                    step.applied = True
+                    step.elapsed = time.time() - start
+                report['migration'] = [step.report() for step in steps]
+                continue
+
+            results = []
+            for _ in range(rounds):
+                round_number += 1
+                results.append(run_writers(connect, query % table,
+                                           services_rows(services, services_per_host,
+                                                         round_number), writers, batch))
+            report.setdefault(stage, {})[name] = {
+                'rows_per_second': max([result['rows_per_second'] for result in results]),
+                'rounds': results
+            }
+        before = report['before']['update']['rows_per_second']
+        for name in ['update', 'upsert']:
+            report['after'][name]['speedup'] = \
+                report['after'][name]['rows_per_second'] / before if before else 0.0
+    finally:
+        cursor.execute(u"DROP TABLE IF EXISTS `%s`" % table)
+        db.commit()
+        db.close()
+    report['peak_rss'] = peak_rss()
+    return report
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--driver', default='mysql-connector',
+                        help='database driver (default: mysql-connector)')
+    parser.add_argument('--services', type=int, default=10000,
+                        help='services count (default: 10000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--writers', type=int, default=4,
+                        help='concurrent writers (default: 4)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='writes rounds of each run (default: 3)')
+    parser.add_argument('--batch', type=int, default=100,
+                        help='rows per executemany and commit (default: 100)')
+    parser.add_argument('--table', default='alignak_benchmark_services',
+                        help='benchmark services table, created and dropped by the benchmark')
+    parser.add_argument('--host', default='127.0.0.1', help='MySQL server')
+    parser.add_argument('--port', default='3306', help='MySQL server port')
+    parser.add_argument('--database', default='glpi', help='MySQL database')
+    parser.add_argument('--user', default='alignak', help='MySQL user')
+    parser.add_argument('--password', default='alignak', help='MySQL password')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp() if options.driver == 'sqlite' else None
+
+    def connect():
+        """Get a new database connection"""
+        return db_drivers.connect(
+            options.driver, host=options.host, port=options.port, database=options.database,
+            user=options.user, password=options.password,
+            sqlite_database=os.path.join(directory, 'glpi.db') if directory else ':memory:')
+
+    try:
+        report = run(connect, options.database, options.table, options.services,
+                     options.services_per_host, options.writers, options.rounds, options.batch)
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Failed batches retries benchmark.
+
+The check result broks of a synthetic fleet are driven through the module to build the
+services events rows, some rows are made invalid (NULL host name, rejected by the database)
+and the rows are bulk inserted in the SQLite stand-in database, with some batches failing
+with a transient error (locked database). The result is a JSON document with, for each
+scenario (bad rows and transient errors rates), the inserted rows throughput, the poison and
+requeued rows and the bisected batches. Run with::
+
+    python -m benchmarks.bench_retry --services 10000 --bad-rows 0,0.0001,0.001,0.01
+"""
+
+from __future__ import print_function
+
+import copy
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import platform
+
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+
+from benchmarks.synthetic import Fleet
+from benchmarks.bench_throughput import DEFAULT_CONFIGURATION, Stage, manage_broks, peak_rss
+
+# Consecutive bulk insertions without progress before giving up
+MAX_TRIES = 100
+
+
+def retry_insert(instance, stage):
+    """Bulk insert all the queued events rows, the requeued rows are retried"""
+    tries = 0
+    while instance.events_cache and tries < MAX_TRIES:
+        rows = len(instance.events_cache)
+        stage.time(instance.bulk_insert)
+        tries = tries + 1 if len(instance.events_cache) >= rows else 0
+        stage.rows += max(0, rows - len(instance.events_cache))
+
+
+def run_scenario(fleet, configuration, bad_rows=0.0, transient=0.0, rounds=1, seed=42):
+    """Run the benchmark for a bad rows rate and a transient errors rate
+
+    :return: the scenario report
+    """
+    # Same bad rows whatever the transient errors rate
+    bad_rows_randomizer = random.Random(seed)
+    transient_randomizer = random.Random(seed)
+    configuration = dict(configuration)
+    configuration.update({
+        'db_driver': 'sqlite', 'fake_db': '0', 'retry_delay': '0',
+        'update_hosts': '0', 'update_services': '0', 'update_services_events': '1'
+    })
+    instance = alignak_module_glpi.get_instance(Module(configuration))
+    instance.init()
+
+    insert_batch = instance.insert_batch
+
+    def failing_insert_batch(query, rows, transactional=True):
+        """Fail with a transient error with the transient errors rate"""
+        if transient_randomizer.random() < transient:
+            raise sqlite3.OperationalError("database is locked")
+        insert_batch(query, rows, transactional)
+
+    instance.insert_batch = failing_insert_batch
+
+    stage = Stage('bulk_insert')
+    manage_broks(instance, Stage('initial_status'), list(fleet.initial_broks()))
+    queued = 0
+    for round_number in range(1, rounds + 1):
+        manage_broks(instance, Stage('check_result'),
+                     list(fleet.check_result_broks(round_number)))
+        for row in instance.events_cache:
+            if bad_rows_randomizer.random() < bad_rows:
+                row['host_name'] = None
+        queued += len(instance.events_cache)
+        retry_insert(instance, stage)
+
+    metrics = instance.collect_metrics()
+    elapsed = sum(stage.latencies)
+    inserted = metrics.get('rows.events', 0)
+    report = {
+        'bad_rows': bad_rows,
+        'transient': transient,
+        'queued': queued,
+        'inserted': inserted,
+        'poison': metrics.get('errors.events', 0),
+        'requeued': metrics.get('retries.events', 0),
+        'bisected_batches': metrics.get('bisected_batches.events', 0),
+        'not_inserted': len(instance.events_cache),
+        'rows_per_second': inserted / elapsed if elapsed else 0.0,
+        'stage': stage.report()
+    }
+    instance.do_stop()
+    return report
+
+
+def run(fleet, configuration, bad_rows, transient, rounds=1):
+    """Run the benchmark scenarios
+
+    :return: the benchmark report
+    """
+    report = {
+        'benchmark': 'retry',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'services': len(fleet),
+        'rounds': rounds,
+        'commit_volume': configuration.get('commit_volume', '1000'),
+        'scenarios': []
+    }
+    for bad_rows_rate in bad_rows:
+        for transient_rate in transient:
+            # Same broks for each scenario
+            report['scenarios'].append(run_scenario(copy.deepcopy(fleet), configuration,
+                                                    bad_rows_rate, transient_rate, rounds))
+    report['peak_rss'] = peak_rss()
+    return report
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--services', type=int, default=1000,
+                        help='services count (default: 1000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='check results rounds (default: 3)')
+    parser.add_argument('--commit-volume', default='1000',
+                        help='rows per executemany (default: 1000)')
+    parser.add_argument('--bad-rows', default='0,0.001,0.01',
+                        help='comma separated bad rows rates (default: 0,0.001,0.01)')
+    parser.add_argument('--transient', default='0,0.1',
+                        help='comma separated transient errors rates (default: 0,0.1)')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    configuration = dict(DEFAULT_CONFIGURATION)
+    configuration['commit_volume'] = options.commit_volume
+    hosts = max(1, -(-options.services // options.services_per_host))
+    fleet = Fleet(hosts, options.services_per_host)
+    report = run(fleet, configuration,
+                 [float(rate) for rate in options.bad_rows.split(',')],
+                 [float(rate) for rate in options.transient.split(',')], options.rounds)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
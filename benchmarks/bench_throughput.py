@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Throughput benchmark of the module broks management.
+
+A synthetic fleet of hosts and services is driven through the module: the initial status
+broks, then rounds of check result broks, and the queued rows are bulk inserted after each
+round. The broks generation is not included in the measures.
+
+The result is a JSON document with, for each stage, the calls count, the broks/s and rows/s
+throughput and the per call latency percentiles, the peak RSS of the process and the module
+internal metrics. Run with::
+
+    python -m benchmarks.bench_throughput --services 10000 --rounds 3 \
+        --config update_services_events=1 --config update_services=1
+
+The module runs with a fake database (fake_db=1) unless it is configured otherwise, eg. to
+run the SQL statements on the SQLite stand-in database::
+
+    python -m benchmarks.bench_throughput --config fake_db=0 --config db_driver=sqlite
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, not available on Windows
+    resource = None
+
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+
+from benchmarks.synthetic import Fleet
+
+DEFAULT_CONFIGURATION = {
+    'module_alias': 'glpi',
+    'module_types': 'DB',
+    'python_name': 'alignak_module_glpi',
+    'log_level': 'ERROR',
+    'fake_db': '1',
+    'update_hosts': '1',
+    'update_services': '1',
+    'update_services_events': '1'
+}
+
+
+def peak_rss():
+    """Get the process peak resident set size, in bytes"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def percentile(ordered, quantile):
+    """Get a percentile of an ordered list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class Stage(object):
+    """
+    The measures of a benchmark stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.broks = 0
+        self.rows = 0
+
+    def time(self, function, *args):
+        """Call the function and measure its latency"""
+        start = time.time()
+        result = function(*args)
+        self.latencies.append(time.time() - start)
+        return result
+
+    def report(self):
+        """Get the stage measures"""
+        ordered = sorted(self.latencies)
+        elapsed = sum(ordered)
+        return {
+            'calls': len(ordered),
+            'elapsed': elapsed,
+            'broks': self.broks,
+            'broks_per_second': self.broks / elapsed if elapsed and self.broks else 0.0,
+            'rows': self.rows,
+            'rows_per_second': self.rows / elapsed if elapsed and self.rows else 0.0,
+            'latency': {
+                'mean': elapsed / len(ordered) if ordered else 0.0,
+                'p50': percentile(ordered, 0.5),
+                'p95': percentile(ordered, 0.95),
+                'p99': percentile(ordered, 0.99),
+                'max': ordered[-1] if ordered else 0.0
+            }
+        }
+
+
+def queued_rows(instance):
+    """Get the number of rows queued for the bulk insertions"""
+    return len(instance.events_cache) + len(instance.records_cache)
+
+
+def committed_rows(instance):
+    """Get the number of rows committed in the database (hosts and services state rows)"""
+    return sum([value for (name, _), value in instance.metrics.counters.items()
+                if name == 'rows'])
+
+
+def manage_broks(instance, stage, broks):
+    """Drive the broks through the module"""
+    rows = committed_rows(instance) + queued_rows(instance)
+    for brok in broks:
+        stage.time(instance.manage_brok, brok)
+    stage.broks += len(broks)
+    stage.rows += committed_rows(instance) + queued_rows(instance) - rows
+
+
+def bulk_insert(instance, stage):
+    """Bulk insert all the queued rows"""
+    while True:
+        rows = queued_rows(instance)
+        if not rows:
+            break
+        stage.time(instance.bulk_insert)
+        stage.time(instance.bulk_insert_records)
+        if queued_rows(instance) >= rows:
+            # No progress, the database is probably not available
+            break
+        stage.rows += rows - queued_rows(instance)
+
+
+def run(fleet, configuration, rounds=1):
+    """Run the benchmark
+
+    :return: the benchmark report
+    """
+    instance = alignak_module_glpi.get_instance(Module(configuration))
+    instance.init()
+
+    stages = {}
+    for name in ['initial_status', 'check_result', 'bulk_insert']:
+        stages[name] = Stage(name)
+
+    start = time.time()
+    manage_broks(instance, stages['initial_status'], list(fleet.initial_broks()))
+    bulk_insert(instance, stages['bulk_insert'])
+    for round_number in range(1, rounds + 1):
+        manage_broks(instance, stages['check_result'],
+                     list(fleet.check_result_broks(round_number)))
+        bulk_insert(instance, stages['bulk_insert'])
+    elapsed = time.time() - start
+
+    broks = sum([stage.broks for stage in stages.values()])
+    measured = sum([sum(stage.latencies) for stage in stages.values()])
+    report = {
+        'benchmark': 'throughput',
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'hosts': len(fleet.hosts),
+        'services': len(fleet),
+        'rounds': rounds,
+        'configuration': dict([(key, value) for key, value in configuration.items()
+                               if key not in ['password']]),
+        'elapsed': elapsed,
+        'broks': broks,
+        'broks_per_second': broks / measured if measured else 0.0,
+        'rows': stages['bulk_insert'].rows + committed_rows(instance),
+        'peak_rss': peak_rss(),
+        'stages': dict([(name, stage.report()) for name, stage in stages.items()]),
+        'metrics': instance.collect_metrics()
+    }
+    report['rows_per_second'] = report['rows'] / measured if measured else 0.0
+    instance.do_stop()
+    return report
+
+
+def parse_configuration(items):
+    """Parse the key=value module configuration items"""
+    configuration = dict(DEFAULT_CONFIGURATION)
+    for item in items or []:
+        key, _, value = item.partition('=')
+        configuration[key.strip()] = value.strip()
+    return configuration
+
+
+def main(args=None):
+    """Benchmark command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--services', type=int, default=1000,
+                        help='services count (default: 1000)')
+    parser.add_argument('--services-per-host', type=int, default=10,
+                        help='services per host (default: 10)')
+    parser.add_argument('--realms', type=int, default=1, help='realms count (default: 1)')
+    parser.add_argument('--changes', type=float, default=0.05,
+                        help='state change probability of a check result (default: 0.05)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='check results rounds (default: 3)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--config', action='append', metavar='KEY=VALUE',
+                        help='module configuration parameter, may be repeated')
+    parser.add_argument('--output', help='JSON report file (default: standard output)')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.WARNING)
+    hosts = max(1, -(-options.services // options.services_per_host))
+    fleet = Fleet(hosts, options.services_per_host, options.realms, options.changes,
+                  seed=options.seed)
+    report = run(fleet, parse_configuration(options.config), options.rounds)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2015-2015: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module generates synthetic broks for a fleet of hosts and services.
+
+The fleet is built with a fixed random seed, so that the same broks sequence is generated
+for each run: the initial status broks, then rounds of check result broks in which some
+items change their state. The check results may have a multi-lines long output, with one
+performance data metric per line, as the disks or interfaces checks.
+"""
+
+import random
+
+from alignak.brok import Brok
+
+HOST_STATES = ['UP', 'DOWN', 'UNREACHABLE']
+SERVICE_STATES = ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN']
+
+
+def make_brok(brok_type, data):
+    """Build a prepared brok, as the broker module receives it"""
+    brok = Brok({'type': brok_type, 'data': data}, False)
+    brok.prepare()
+    return brok
+
+
+class Fleet(object):
+    """
+    A synthetic fleet of `hosts` hosts with `services_per_host` services each
+    """
+
+    def __init__(self, hosts=100, services_per_host=10, realms=1, changes=0.05,
+                 start=1500000000, interval=60, seed=42, long_output_lines=0):
+        # pylint: disable=too-many-arguments
+        self.hosts = ['host-%06d' % idx for idx in range(hosts)]
+        self.services = ['service-%03d' % idx for idx in range(services_per_host)]
+        self.realms = ['realm-%d' % idx for idx in range(realms)]
+        # Probability for an item to change its state on a check result
+        self.changes = changes
+        self.start = start
+        self.interval = interval
+        self.random = random.Random(seed)
+        self.long_output_lines = long_output_lines
+        # (host_name, service_description) -> state_id, None for the host check
+        self.states = {}
+
+    def __len__(self):
+        return len(self.hosts) * len(self.services)
+
+    def item_data(self, host_name, service_description, last_chk):
+        """Build the brok data of an item check result"""
+        key = (host_name, service_description)
+        state_id = self.states.get(key, 0)
+        if self.random.random() < self.changes:
+            state_id = self.random.randint(0, 2 if service_description is None else 3)
+        last_state_id = self.states.get(key, 0)
+        self.states[key] = state_id
+
+        states = HOST_STATES if service_description is None else SERVICE_STATES
+        data = {
+            'host_name': host_name,
+            'last_chk': last_chk,
+            'state': states[state_id],
+            'state_id': state_id,
+            'state_type': 'HARD',
+            'state_type_id': 1,
+            'last_state_id': last_state_id,
+            'last_hard_state_id': last_state_id,
+            'output': '%s - synthetic check output' % states[state_id],
+            'long_output': '',
+            'perf_data': "'time'=%.3fs;1;2;0 'size'=%dB;;;0" % (
+                self.random.random(), self.random.randint(0, 100000)),
+            'latency': self.random.random(),
+            'execution_time': self.random.random(),
+            'problem_has_been_acknowledged': False
+        }
+        if service_description is not None:
+            data['service_description'] = service_description
+            if self.long_output_lines:
+                self.add_long_output(data)
+        return data
+
+    def add_long_output(self, data):
+        """Add the long output lines and their performance data to a service check result"""
+        lines = []
+        metrics = []
+        for idx in range(self.long_output_lines):
+            used = self.random.randint(0, 100)
+            lines.append('/dev/sd%d: %d%% used (%d MB free) on /srv/volume-%d' % (
+                idx, used, (100 - used) * 1024, idx))
+            metrics.append("'/srv/volume-%d'=%d%%;80;90;0;100" % (idx, used))
+        data['long_output'] = '\n'.join(lines)
+        data['perf_data'] = '%s %s' % (data['perf_data'], ' '.join(metrics))
+
+    def initial_broks(self):
+        """Generate the initial host and service status broks"""
+        for idx, host_name in enumerate(self.hosts):
+            data = self.item_data(host_name, None, self.start)
+            data['realm_name'] = self.realms[idx % len(self.realms)]
+            data['customs'] = {'_HOSTSID': str(idx + 1), '_ITEMTYPE': 'Computer',
+                               '_ITEMSID': str(idx + 1)}
+            yield make_brok('initial_host_status', data)
+            for sidx, service_description in enumerate(self.services):
+                data = self.item_data(host_name, service_description, self.start)
+                data['customs'] = {'_ITEMSID': str(idx * len(self.services) + sidx + 1)}
+                yield make_brok('initial_service_status', data)
+
+    def check_result_broks(self, round_number):
+        """Generate the check result broks of a round: one per host and per service"""
+        last_chk = self.start + round_number * self.interval
+        for host_name in self.hosts:
+            yield make_brok('host_check_result', self.item_data(host_name, None, last_chk))
+            for service_description in self.services:
+                yield make_brok('service_check_result',
+                                self.item_data(host_name, service_description, last_chk))
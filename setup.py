@@ -89,7 +89,7 @@ setup(
     zip_safe=False,
 
     # Package data
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     # package_data={
     #     '': 'README.rst',
@@ -106,5 +106,9 @@ setup(
 
     # Entry points (if some) ...
     entry_points={
+        'console_scripts': [
+            'alignak-glpi-replay = alignak_module_glpi.replay:console_main',
+            'alignak-glpi-migrate = alignak_module_glpi.migrate:console_main'
+        ]
     },
 )
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the performance data aggregation
+"""
+
+from .alignak_test import AlignakTest
+
+from alignak_module_glpi.aggregation import PerfdataAggregator
+
+
+class TestAggregation(AlignakTest):
+    """
+    This class contains the tests for the records performance data aggregation
+    """
+
+    def test_windows(self):
+        """Check results are aggregated per service and per window
+
+        :return:
+        """
+        aggregator = PerfdataAggregator(300)
+
+        # Same window
+        assert aggregator.add('srv001', 'payment', 1200, 'amount=10;80;90 count=1', 'out 1') == []
+        assert aggregator.add('srv001', 'payment', 1300, 'amount=30;80;90 count=2', 'out 2') == []
+        assert aggregator.add('srv001', 'payment', 1499, 'amount=20;80;90 count=3', 'out 3') == []
+        assert aggregator.add('srv002', 'payment', 1499, 'amount=5', 'out') == []
+        assert len(aggregator) == 2
+
+        # A late check result is dropped ...
+        assert aggregator.add('srv001', 'payment', 1000, 'amount=99;80;90', 'late') == []
+        assert aggregator.late == 1
+        # ... a check result of the window that is received out of order is folded in it
+        assert aggregator.add('srv001', 'payment', 1250, 'amount=25;80;90', 'old') == []
+
+        # Next window closes the current one
+        rows = aggregator.add('srv001', 'payment', 1500, 'amount=40', 'out 4')
+        assert len(rows) == 1
+        assert rows[0]['host_name'] == 'srv001'
+        assert rows[0]['service_description'] == 'payment'
+        # The output and the last values are the ones of the newest check result
+        assert rows[0]['output'] == 'out 3'
+        assert rows[0]['perf_data'] == "'amount'=21.25;80;90;; 'amount_min'=10 " \
+                                       "'amount_max'=30 'amount_last'=20 " \
+                                       "'count'=2.0;;;; 'count_min'=1 'count_max'=3 " \
+                                       "'count_last'=3"
+        assert len(aggregator) == 2
+
+        # A late check result of the closed window is dropped
+        assert aggregator.add('srv001', 'payment', 1400, 'amount=99', 'late') == []
+        assert aggregator.late == 2
+
+        # Expire the windows that are not updated anymore
+        rows = aggregator.expire(1810)
+        assert [row['host_name'] for row in rows] == ['srv002']
+        assert len(aggregator) == 1
+        # ... a late check result of an expired window is also dropped
+        assert aggregator.add('srv002', 'payment', 1300, 'amount=99', 'late') == []
+        assert aggregator.late == 3
+        assert len(aggregator) == 1
+
+        # Flush the pending windows
+        rows = aggregator.flush()
+        assert len(rows) == 1
+        assert rows[0]['perf_data'] == "'amount'=40.0;;;; 'amount_min'=40 " \
+                                       "'amount_max'=40 'amount_last'=40"
+        assert len(aggregator) == 0
+
+    def test_bounds(self):
+        """The declared bounds and the unit of the newest check result are kept
+
+        :return:
+        """
+        aggregator = PerfdataAggregator(300)
+        assert aggregator.add('srv001', 'disk', 1210, 'used=60%;80;90', 'out 2') == []
+        assert aggregator.add('srv001', 'disk', 1200, 'used=40MB;70;80;0;100', 'out 1') == []
+        rows = aggregator.flush()
+        assert rows[0]['output'] == 'out 2'
+        assert rows[0]['perf_data'] == "'used'=50.0%;80;90;0;100 'used_min'=40% " \
+                                       "'used_max'=60% 'used_last'=60%"
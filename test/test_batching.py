@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the rows batches size limits
+"""
+
+import collections
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.batching import python_encoding, batch_bytes, row_size, \
+    take_batch, split_rows, DEFAULT_MAX_ALLOWED_PACKET
+
+
+class PacketCursor(object):
+    """A MySQL cursor that only knows about max_allowed_packet"""
+
+    def execute(self, query, params=None):
+        """Execute a statement"""
+        assert query == "SELECT @@max_allowed_packet"
+
+    @staticmethod
+    def fetchone():
+        """Get the row"""
+        return (1048576,)
+
+
+class TestBatching(AlignakTest):
+    """
+    This class contains the tests for the rows batches size limits
+    """
+
+    def test_row_size(self):
+        """The rows size is estimated with the encoded values
+
+        :return:
+        """
+        assert python_encoding('utf8mb4') == 'utf-8'
+        assert python_encoding('latin1') == 'cp1252'
+        assert batch_bytes(None) == DEFAULT_MAX_ALLOWED_PACKET // 2
+        assert batch_bytes(64 * 1024 * 1024, 1024 * 1024) == 1024 * 1024
+
+        # Values and overheads
+        assert row_size(['abc', 12, None]) == (3 + 3) + (2 + 3) + (4 + 3) + 3
+        # Encoded size
+        assert row_size([u'été']) == 5 + 3 + 3
+        assert row_size([u'été'], 'cp1252') == 3 + 3 + 3
+
+    def test_take_batch(self):
+        """The batches are cut by rows and by size
+
+        :return:
+        """
+        cache = collections.deque([{'output': 'x' * 94} for _ in range(10)])
+        # 100 bytes rows
+        rows, size, cut = take_batch(cache, 5, 350)
+        assert (len(rows), size, cut) == (3, 300, True)
+        rows, size, cut = take_batch(cache, 2, 350)
+        assert (len(rows), size, cut) == (2, 200, False)
+        # A row larger than the maximum size is alone in its batch
+        cache.appendleft({'output': 'x' * 1000})
+        rows, size, cut = take_batch(cache, 5, 350)
+        assert (len(rows), cut) == (1, True)
+        rows, size, cut = take_batch(cache, 10, 0)
+        assert (len(rows), cut) == (5, False)
+        assert not cache
+
+        assert [len(batch) for batch in split_rows([('x' * 94,)] * 7, 350)] == [3, 3, 1]
+        assert [len(batch) for batch in split_rows([('x' * 94,)] * 7, 0)] == [7]
+
+    def test_module_batches(self):
+        """The module cuts the batches with the server max_allowed_packet
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'commit_max_bytes': '1000'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.batch_bytes == 1000
+
+        cursor = instance.db_cursor
+        instance.db_cursor = PacketCursor()
+        instance.read_max_allowed_packet()
+        assert instance.max_allowed_packet == 1048576
+        assert instance.batch_bytes == 1000
+        instance.commit_max_bytes = 0
+        instance.read_max_allowed_packet()
+        assert instance.batch_bytes == 524288
+        instance.db_cursor = cursor
+        instance.batch_bytes = 1000
+
+        for idx in range(10):
+            instance.events_cache.append(collections.OrderedDict([
+                ('host_name', 'srv%d' % idx), ('service_description', 'cpu'),
+                ('date', '2018-03-14 12:%02d:00' % idx), ('output', 'x' * 250),
+                ('state_id', 0)]))
+        instance.bulk_insert()
+        assert len(instance.events_cache) == 7
+        assert instance.metrics.counters[('size_limited_batches', (('table', 'events'),))] == 1
+        while instance.events_cache:
+            instance.bulk_insert()
+        assert instance.metrics.counters[('rows', (('table', 'events'),))] == 10
+        instance.close()
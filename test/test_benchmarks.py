@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the benchmarks suite
+"""
+
+from .alignak_test import AlignakTest
+
+from benchmarks.synthetic import Fleet
+from benchmarks.bench_throughput import run, parse_configuration, DEFAULT_CONFIGURATION
+from benchmarks import bench_retry, bench_compression
+
+
+class TestBenchmarks(AlignakTest):
+    """
+    This class contains the tests for the benchmarks suite
+    """
+
+    def test_synthetic_fleet(self):
+        """The synthetic fleet broks are reproducible
+
+        :return:
+        """
+        fleet = Fleet(hosts=3, services_per_host=4, realms=2)
+        broks = list(fleet.initial_broks())
+        assert len(broks) == 15
+        assert [brok.type for brok in broks[:2]] == ['initial_host_status',
+                                                     'initial_service_status']
+        assert broks[5].data['realm_name'] == 'realm-1'
+
+        broks = list(fleet.check_result_broks(1))
+        assert len(broks) == 15
+        assert broks[0].data['last_chk'] == fleet.start + fleet.interval
+
+        other = Fleet(hosts=3, services_per_host=4, realms=2)
+        list(other.initial_broks())
+        assert [brok.data for brok in other.check_result_broks(1)] == \
+            [brok.data for brok in broks]
+
+    def test_throughput(self):
+        """The throughput benchmark reports the stages measures
+
+        :return:
+        """
+        report = run(Fleet(hosts=5, services_per_host=4),
+                     parse_configuration(['update_services_events=1']), rounds=2)
+        assert report['services'] == 20
+        assert report['broks'] == 25 * 3
+        assert report['stages']['check_result']['calls'] == 50
+        # One event per host and service check result
+        assert report['rows'] == 25 * 2
+        assert report['broks_per_second'] > 0
+        assert report['stages']['initial_status']['latency']['p95'] > 0
+
+    def test_retry(self):
+        """The retry benchmark inserts all the valid rows, with bad rows and transient errors
+
+        :return:
+        """
+        report = bench_retry.run(Fleet(hosts=10, services_per_host=9), DEFAULT_CONFIGURATION,
+                                 [0.05], [0.0, 0.2], rounds=2)
+        first, second = report['scenarios']
+        assert first['queued'] == 100 * 2
+        assert first['poison'] > 0
+        assert first['inserted'] + first['poison'] == first['queued']
+        assert second['requeued'] > 0
+        assert second['poison'] == first['poison']
+        assert second['inserted'] == first['inserted']
+
+    def test_compression(self):
+        """The compression benchmark reports the queued events and backlog memory
+
+        :return:
+        """
+        report = bench_compression.run({'hosts': 5, 'services_per_host': 4},
+                                       DEFAULT_CONFIGURATION, [0, 10], rounds=2)
+        assert [(scenario['compression'], scenario['interning'], scenario['long_output_lines'])
+                for scenario in report['scenarios']] == [
+                    (compression, interning, lines) for lines in [0, 10]
+                    for compression in ['none', 'zlib'] for interning in [False, True]]
+        for scenario in report['scenarios']:
+            assert scenario['queued'] == 25 * 2
+            assert scenario['bytes_per_event'] > 0
+            assert scenario['peak_backlog_bytes'] > 0
+        assert report['scenarios'][7]['compression_ratio'] > 2
+        # The interned strings are shared by the queued rows
+        assert report['scenarios'][1]['bytes_per_event'] < \
+            report['scenarios'][0]['bytes_per_event']
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the broks capture and replay
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi.capture import BrokCapture, read_capture
+from alignak_module_glpi.replay import Replayer, read_configuration, main
+
+
+class TestCapture(AlignakTest):
+    """
+    This class contains the tests for the broks capture and replay
+    """
+
+    def setUp(self):
+        super(TestCapture, self).setUp()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestCapture, self).tearDown()
+        shutil.rmtree(self.folder)
+
+    def test_capture(self):
+        """The captured broks are read back, the capture file size is bounded
+
+        :return:
+        """
+        path = os.path.join(self.folder, 'capture.jsonl.gz')
+        capture = BrokCapture(path, max_size=1024 * 1024)
+        capture.write('host_check_result', {'host_name': 'srv001', 'last_chk': 1}, 10.0)
+        capture.write('unknown_brok_type', {'host_name': 'srv001'}, 11.0)
+        capture.write('service_check_result', {'host_name': 'srv001',
+                                               'service_description': 'disks'}, 12.0)
+        capture.close()
+        assert capture.count == 2
+        assert list(read_capture(path)) == [
+            (10.0, 'host_check_result', {'host_name': 'srv001', 'last_chk': 1}),
+            (12.0, 'service_check_result', {'host_name': 'srv001',
+                                            'service_description': 'disks'})
+        ]
+
+        # Rotation
+        capture = BrokCapture(path, max_size=1)
+        capture.write('host_check_result', {'host_name': 'srv002'}, 13.0)
+        assert capture.rotations == 1
+        assert not os.path.exists(path)
+        assert len(list(read_capture(path + '.1'))) == 3
+
+        # Truncated capture file
+        data = gzip.compress(b'{"t":1,"type":"host_check_result","data":{}}\n{"t":2,"ty') \
+            if hasattr(gzip, 'compress') else None
+        if data:
+            with open(path, 'wb') as capture_file:
+                capture_file.write(data[:-10])
+            assert len(list(read_capture(path))) <= 1
+
+    def test_module_capture_replay(self):
+        """The module captures the broks, the replayer replays them
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        path = os.path.join(self.folder, 'capture.jsonl.gz')
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'capture_file': path
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "last_chk": 1444427104,
+            "state": "UP",
+            "state_type": "HARD",
+            "state_id": 0,
+            "state_type_id": 1,
+            "output": "OK - host is up and running",
+            "long_output": "",
+            "perf_data": "",
+            "latency": 0.1,
+            "execution_time": 1.0,
+            "problem_has_been_acknowledged": False
+        }
+        for brok_type in ['initial_host_status', 'host_check_result', 'host_check_result']:
+            # Distinct check results, the replayed events are dropped
+            hcr['last_chk'] += 60
+            b = Brok({'data': dict(hcr), 'type': brok_type}, False)
+            b.prepare()
+            instance.manage_brok(b)
+        instance.do_stop()
+        assert len(list(read_capture(path))) == 3
+
+        configuration = read_configuration(items=['db_driver=sqlite', 'fake_db=0',
+                                                  'update_services_events=1',
+                                                  'capture_file=%s' % path])
+        assert configuration['capture_file'] == ''
+        replayed = alignak_module_glpi.get_instance(Module(configuration))
+        replayed.init()
+        replayer = Replayer(replayed, speed=1000)
+        elapsed, captured = replayer.replay(read_capture(path))
+        assert replayer.broks == 3
+        assert not replayed.events_cache
+        report = replayer.report(elapsed, captured)
+        assert report['backend'] == 'sqlite'
+        assert report['metrics']['rows.events'] == 2
+        assert report['lag']['p95'] >= 0
+        replayed.do_stop()
+
+        report = main(['--speed', '0', '--output', os.path.join(self.folder, 'report.json'),
+                       path])
+        assert report['broks'] == 3
+        assert report['backend'] == 'fake'
+        assert 'lag' not in report
+
+    def test_replay_configuration(self):
+        """The replay uses the fake database only when no backend is configured
+
+        :return:
+        """
+        assert read_configuration()['fake_db'] == '1'
+        assert read_configuration(items=['db_driver=sqlite'])['fake_db'] == '0'
+        assert read_configuration(items=['fake_db=1', 'db_driver=sqlite'])['fake_db'] == '1'
+
+        ini = os.path.join(self.folder, 'glpi.ini')
+        with open(ini, 'w') as ini_file:
+            ini_file.write("[module.glpi]\nname=glpi\ntype=db\ncommit_volume=50\n")
+        configuration = read_configuration(ini, ['db_driver=sqlite'])
+        assert configuration['fake_db'] == '0'
+        assert configuration['db_driver'] == 'sqlite'
+        assert configuration['commit_volume'] == '50'
+        assert read_configuration(ini)['fake_db'] == '0'
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the queued rows compression
+"""
+
+import json
+import unittest
+import collections
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import glpi
+from alignak_module_glpi.compression import TextCompressor, Compressed, expand_row, AVAILABLE
+from alignak_module_glpi.batching import value_size
+
+LINES = '\n'.join(['/dev/sd%d: %d%% used' % (idx, 40 + idx) for idx in range(10)])
+
+
+class TestCompression(AlignakTest):
+    """
+    This class contains the tests for the queued rows compression
+    """
+
+    @unittest.skipIf(not AVAILABLE, "zlib preset dictionaries need Python 3.3")
+    def test_compress(self):
+        """The long values are compressed with a dictionary per service and column
+
+        :return:
+        """
+        compressor = TextCompressor(dictionaries=2)
+        # Short values and other types are kept
+        assert compressor.compress(('srv', 'disk', 'output'), 'OK') == 'OK'
+        assert compressor.compress(('srv', 'disk', 'output'), None) is None
+
+        first = compressor.compress(('srv', 'disk', 'output'), u'DISK OK - été\n' + LINES)
+        assert isinstance(first, Compressed)
+        assert first.text() == u'DISK OK - été\n' + LINES
+        assert str(first) == first.text()
+        assert first.size == len(u'DISK OK - été\n'.encode('utf-8')) + len(LINES)
+        assert value_size(first) == first.size + 3
+
+        # A similar value is compressed to a few bytes
+        second = compressor.compress(('srv', 'disk', 'output'),
+                                     u'DISK WARNING - été\n' + LINES.replace('45', '46'))
+        assert len(second.data) < 20
+        assert second.text() == u'DISK WARNING - été\n' + LINES.replace('45', '46')
+        assert compressor.ratio() > 2
+
+        # The oldest dictionaries are forgotten, the compressed values keep their dictionary
+        compressor.compress(('srv', 'cpu', 'output'), 'CPU ' + LINES)
+        compressor.compress(('srv', 'mem', 'output'), 'MEM ' + LINES)
+        assert list(compressor.dictionaries) == [('srv', 'cpu', 'output'),
+                                                 ('srv', 'mem', 'output')]
+        assert second.text() == u'DISK WARNING - été\n' + LINES.replace('45', '46')
+
+        row = collections.OrderedDict([('host_name', 'srv'), ('service_description', 'disk'),
+                                       ('output', 'OK\n' + LINES), ('perf_data', ''),
+                                       ('state_id', 0)])
+        compressor.compress_row(row)
+        assert isinstance(row['output'], Compressed)
+        assert expand_row(row) == ('srv', 'disk', 'OK\n' + LINES, '', 0)
+        assert json.loads(json.dumps(row, default=str))['output'] == 'OK\n' + LINES
+
+    @unittest.skipIf(not AVAILABLE, "zlib preset dictionaries need Python 3.3")
+    def test_module_compression(self):
+        """The module compresses the queued rows and inserts the decompressed values
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'queue_compression': 'zlib'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.compressor is not None
+
+        for idx in range(5):
+            instance.events_cache.append(instance.queue_row(
+                instance.serviceevents_table, collections.OrderedDict([
+                    ('host_name', 'srv'), ('service_description', 'disk'),
+                    ('date', '2018-03-14 12:%02d:00' % idx),
+                    ('output', 'DISK OK %d\n%s' % (idx, LINES)), ('state_id', 0)])))
+        assert isinstance(instance.events_cache[-1]['output'], Compressed)
+        instance.bulk_insert()
+        assert not instance.events_cache
+        assert instance.metrics.counters[('rows', (('table', 'events'),))] == 5
+        instance.db_cursor.execute("SELECT `output` FROM `%s` ORDER BY `date`"
+                                   % instance.serviceevents_table)
+        assert [row[0] for row in instance.db_cursor.fetchall()] == \
+            ['DISK OK %d\n%s' % (idx, LINES) for idx in range(5)]
+        assert instance.collect_metrics()['compressed_values'] == 5
+        instance.close()
+
+    def test_module_compression_unavailable(self):
+        """The compression is disabled when it is not available (Python 2)
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        available = glpi.COMPRESSION_AVAILABLE
+        glpi.COMPRESSION_AVAILABLE = False
+        try:
+            instance = alignak_module_glpi.get_instance(Module({
+                'module_alias': 'glpi',
+                'module_types': 'DB',
+                'python_name': 'alignak_module_glpi',
+                'db_driver': 'sqlite',
+                'update_services_events': '1',
+                'queue_compression': 'zlib'
+            }))
+        finally:
+            glpi.COMPRESSION_AVAILABLE = available
+        assert instance.compressor is None
+        self.assert_any_log_match('queued rows compression needs Python 3.3 or later')
+        row = instance.queue_row(instance.serviceevents_table, {'output': 'x' * 100})
+        assert row['output'] == 'x' * 100
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the replayed services events detection
+"""
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi.dedup import RecentKeys, event_key
+
+
+class TestDedup(AlignakTest):
+    """
+    This class contains the tests for the replayed events detection
+    """
+
+    def test_recent_keys(self):
+        """The window only holds the most recent keys
+
+        :return:
+        """
+        keys = RecentKeys(2)
+        assert not keys.seen(event_key('srv', 'cpu', 1444427104.5, 0, 1))
+        assert keys.seen(event_key('srv', 'cpu', 1444427104, 0, 1))
+        assert not keys.seen(event_key('srv', 'cpu', 1444427104, 1, 1))
+        assert not keys.seen(event_key('srv', None, 1444427104, 0, 1))
+        assert len(keys) == 2
+        # The oldest key is forgotten
+        assert event_key('srv', 'cpu', 1444427104, 0, 1) not in keys
+        assert not keys.seen(event_key('srv', 'cpu', 1444427104, 0, 1))
+        assert keys.duplicates == 1
+
+    def test_module_replayed_events(self):
+        """The replayed events are dropped before the insertion, and ignored by the database
+        after a restart when the table has a unique event key
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'events_unique_key': '1',
+            # The replayed check results are older than the last check results
+            'drop_stale_results': '0'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        instance.db_cursor.execute(
+            "ALTER TABLE `glpi_plugin_monitoring_serviceevents` ADD UNIQUE KEY `event` "
+            "(`host_name`,`service_description`,`date`,`state_id`,`state_type_id`)")
+
+        customs = {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"}
+        b = Brok({'data': {
+            "host_name": "srv001", "customs": customs, "last_chk": 1444427044,
+            "state_id": 0, "state_type_id": 1,
+            "output": "host output", "long_output": "", "perf_data": ""
+        }, 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+
+        def send(count):
+            """Send the same check results count times"""
+            for _ in range(count):
+                for last_chk, state_id in [(1444427104, 0), (1444427164, 1), (1444427224, 1)]:
+                    b = Brok({'data': {
+                        "host_name": "srv001", "customs": customs, "last_chk": last_chk,
+                        "state_id": state_id, "state_type_id": 1,
+                        "output": "host output", "long_output": "", "perf_data": ""
+                    }, 'type': 'host_check_result'}, False)
+                    b.prepare()
+                    instance.manage_brok(b)
+
+        send(2)
+        assert len(instance.events_cache) == 3
+        assert instance.metrics.counters[('events_duplicates', ())] == 3
+        instance.bulk_insert()
+
+        # Module restart: the events are replayed to the database
+        instance.events_keys = RecentKeys(10)
+        send(1)
+        assert len(instance.events_cache) == 3
+        instance.bulk_insert()
+        assert not [key for key in instance.metrics.counters if key[0] == 'errors']
+        instance.db_cursor.execute("SELECT COUNT(*) FROM `glpi_plugin_monitoring_serviceevents`")
+        assert instance.db_cursor.fetchone()[0] == 3
+        instance.close()
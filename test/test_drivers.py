@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the database drivers
+"""
+
+import sqlite3
+
+import six
+import pytest
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import drivers
+from alignak_module_glpi import sqlite
+
+
+class PingConnection(object):
+    """A sqlite3 connection with a ping method, as the MySQL DB-API connections"""
+
+    def __init__(self, **params):
+        self.params = params
+        self.connection = sqlite3.connect(':memory:')
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def ping(self):
+        """Raise an error if the connection is closed"""
+        if self.closed:
+            raise sqlite3.OperationalError('closed')
+
+    def close(self):
+        """Close the connection"""
+        self.closed = True
+        self.connection.close()
+
+    @staticmethod
+    def get_server_info():
+        """Server information, as MySQL does"""
+        return '5.7.21-log'
+
+
+class TestDrivers(AlignakTest):
+    """
+    This class contains the tests for the database drivers
+    """
+
+    def test_connect(self):
+        """Connect with the configured driver
+
+        :return:
+        """
+        with pytest.raises(ValueError):
+            drivers.connect('oracle')
+
+        db = drivers.connect('sqlite', sqlite_database=':memory:')
+        assert isinstance(db, sqlite.Connection)
+        db.close()
+
+        for driver, library in [('pymysql', 'pymysql'), ('mysqlclient', 'MySQLdb')]:
+            try:
+                __import__(library)
+            except ImportError:
+                with pytest.raises(ImportError):
+                    drivers.connect(driver)
+
+        # The missing library error keeps the original error
+        with pytest.raises(ImportError) as raised:
+            drivers.import_driver('not_a_driver_library', 'pymysql')
+        assert 'requires the not_a_driver_library library' in str(raised.value)
+        if six.PY3:
+            assert isinstance(raised.value.__cause__, ImportError)
+
+    def test_dbapi_connection(self):
+        """A DB-API connection is wrapped to provide the mysql.connector API
+
+        :return:
+        """
+        db = drivers.DbapiConnection(PingConnection, host='localhost', charset='utf8')
+        assert db.raw.params == {'host': 'localhost', 'charset': 'utf8'}
+        assert db.is_connected()
+        assert db.get_server_version() == (5, 7, 21)
+
+        cursor = db.cursor()
+        cursor.execute("CREATE TABLE events (host_name TEXT, state TEXT)")
+        many = db.cursor(prepared=True)
+        many.executemany("INSERT INTO events VALUES (?, ?)", [('srv1', 'UP'), ('srv2', 'UP')])
+        assert many.statement == "INSERT INTO events VALUES (?, ?)"
+        assert many.rowcount == 2
+        db.commit()
+        cursor.execute("SELECT count(*) FROM events")
+        assert 'SELECT' in cursor.statement
+        assert cursor.fetchall() == [(2,)]
+
+        # The cursors follow the new connection
+        db.raw.close()
+        assert not db.is_connected()
+        db.reconnect(attempts=3, delay=0)
+        assert db.is_connected()
+        cursor.execute("CREATE TABLE events (host_name TEXT, state TEXT)")
+        cursor.execute("SELECT count(*) FROM events")
+        assert cursor.fetchall() == [(0,)]
+        cursor.close()
+
+        # The previous connection is closed when reconnecting
+        previous = db.raw
+        db.reconnect()
+        assert previous.closed
+        assert db.is_connected()
+        db.close()
+        assert not db.is_connected()
+
+    def test_module_driver(self):
+        """The module uses the configured driver
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'oracle'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.db_driver == 'mysql-connector'
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.open()
+        assert instance.db.get_server_info() == 'SQLite'
+        instance.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the interned strings
+"""
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi.interning import StringTable
+
+
+class TestInterning(AlignakTest):
+    """
+    This class contains the tests for the interned strings
+    """
+
+    def test_string_table(self):
+        """The table returns the first seen copy of the strings and evicts the least recently
+        used strings
+
+        :return:
+        """
+        table = StringTable(2, max_length=10)
+        first = ''.join(['srv', '001'])
+        second = ''.join(['srv', '001'])
+        assert first is not second
+        assert table.intern(first) is first
+        assert table.intern(second) is first
+        assert table.intern(None) is None
+        assert table.intern(12) == 12
+        # Long strings are not interned
+        assert table.intern('x' * 11) == 'x' * 11
+        assert len(table) == 1
+        # Unicode strings are interned with Python 2
+        assert table.intern(u'srv001') is first
+
+        table.intern('cpu')
+        # The most recently used string is kept
+        assert table.intern(second) is first
+        table.intern('disk')
+        assert list(table.strings) == ['srv001', 'disk']
+        assert (table.hits, table.evictions) == (3, 1)
+
+    def test_module_interning(self):
+        """The broks names and the duplicate outputs are shared by the caches and the rows
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        b = Brok({'data': {
+            "host_name": "srv001", "last_chk": 1444427044, "state_id": 0, "state_type_id": 1,
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "output": "PING OK - Packet loss = 0%", "long_output": "", "perf_data": ""
+        }, 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+
+        for service_description in ['ping', 'ping6']:
+            b = Brok({'data': {
+                "host_name": "srv001", "service_description": service_description,
+                "last_chk": 1444427044, "state_id": 0, "state_type_id": 1,
+                "customs": {"_ITEMSID": "7"},
+                "output": "PING OK - Packet loss = 0%", "long_output": "", "perf_data": ""
+            }, 'type': 'initial_service_status'}, False)
+            b.prepare()
+            instance.manage_brok(b)
+
+        for last_chk in [1444427104, 1444427164]:
+            for service_description in ['ping', 'ping6']:
+                b = Brok({'data': {
+                    "host_name": "srv001", "service_description": service_description,
+                    "last_chk": last_chk, "state_id": 0, "state_type_id": 1,
+                    "output": "PING OK - Packet loss = 0%", "long_output": "",
+                    "perf_data": ""
+                }, 'type': 'service_check_result'}, False)
+                b.prepare()
+                instance.manage_brok(b)
+
+        rows = list(instance.events_cache)
+        assert len(rows) == 4
+        host_name = [name for name in instance.hosts_cache][0]
+        assert all([row['host_name'] is host_name for row in rows])
+        assert rows[0]['service_description'] is rows[2]['service_description']
+        assert all([row['output'] is rows[0]['output'] for row in rows])
+        stats = instance.collect_metrics()
+        assert stats['interned_strings.names'] == 3
+        assert stats['interned_strings.outputs'] == 1
+        assert stats['interned_hits.outputs'] == 3
+
+        instance.bulk_insert()
+        instance.db_cursor.execute("SELECT COUNT(*) FROM `glpi_plugin_monitoring_serviceevents`")
+        assert instance.db_cursor.fetchone()[0] == 4
+        instance.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the per item logs sampling
+"""
+
+import re
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi.logsampling import LogSampler
+
+
+class TestLogSampling(AlignakTest):
+    """
+    This class contains the tests for the per item logs sampling
+    """
+
+    def test_sample(self):
+        """One message in N is logged, starting with the first one
+
+        :return:
+        """
+        sampler = LogSampler(every=10)
+        logged = [sampler.sample('initial host status') for _ in range(25)]
+        assert [idx for idx, log in enumerate(logged) if log] == [0, 10, 20]
+        assert sampler.sample('initial service status')
+
+        counts, suppressed = sampler.summary()
+        assert counts == {'initial host status': 25, 'initial service status': 1}
+        assert suppressed == {'initial host status': 22}
+        assert sampler.summary() == ({}, {})
+
+        # Log all the messages
+        sampler = LogSampler(every=1)
+        assert all([sampler.sample('initial host status') for _ in range(5)])
+
+    def test_allow(self):
+        """At most N messages are logged per period
+
+        :return:
+        """
+        sampler = LogSampler(rate=2, period=60)
+        now = sampler.window_start
+        assert [sampler.allow('update failed', now + 1) for _ in range(4)] == \
+            [True, True, False, False]
+        assert sampler.allow('row created', now + 1)
+        # A new period
+        assert sampler.allow('update failed', now + 61)
+        assert sampler.summary() == ({'update failed': 5, 'row created': 1},
+                                     {'update failed': 2})
+
+        # Not limited
+        sampler = LogSampler(rate=0)
+        assert all([sampler.allow('update failed') for _ in range(100)])
+
+    def test_module_sampling(self):
+        """The module samples the initial status logs and logs summary lines
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'log_level': 'INFO',
+            'fake_db': '1',
+            'update_hosts': '1',
+            'log_sample': '10',
+            'log_rate': '3'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert not instance.debug_enabled
+
+        for idx in range(25):
+            b = Brok({'data': {
+                "host_name": "srv%03d" % idx,
+                "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+                "last_chk": 1444427104,
+                "state": "UP",
+                "state_type": "HARD",
+                "state_id": 0,
+                "state_type_id": 1,
+                "output": "OK - host is up and running",
+                "long_output": "",
+                "perf_data": "",
+                "latency": 0.1,
+                "execution_time": 1.0,
+                "problem_has_been_acknowledged": False
+            }, 'type': 'initial_host_status'}, False)
+            b.prepare()
+            instance.manage_brok(b)
+            instance.metrics.counter('broks', labels=(('type', b.type),))
+        assert len(instance.hosts_cache) == 25
+
+        counts = dict(instance.log_sampler.counts)
+        # 3 initial host status logs
+        assert counts['initial host status'] == 25
+        assert instance.log_sampler.suppressed['initial host status'] == 22
+        # With a fake database, the host state rows are always created: 3 warnings logged
+        assert counts['host row created'] == 25
+        assert instance.log_sampler.suppressed['host row created'] == 22
+
+        broks, suppressed = instance.log_summary()
+        assert broks == {'initial_host_status': 25}
+        assert suppressed == {'initial host status': 22, 'host row created': 22}
+        self.assert_any_log_match(re.escape("managed broks: initial_host_status=25"))
+        self.assert_any_log_match(re.escape(
+            "not logged messages: host row created=22/25, initial host status=22/25"))
+
+        # Only the broks managed since the last summary
+        assert instance.log_summary() == ({'initial_host_status': 0}, {})
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the module internal metrics
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.metrics import MetricsRegistry
+
+
+class TestMetrics(AlignakTest):
+    """
+    This class contains the tests for the module internal metrics registry
+    """
+
+    def test_metrics(self):
+        """Counters, gauges and histograms are exported as a dict and for Prometheus
+
+        :return:
+        """
+        metrics = MetricsRegistry()
+        metrics.counter('broks', labels=(('type', 'host_check_result'),))
+        metrics.counter('broks', labels=(('type', 'host_check_result'),))
+        metrics.counter('broks', 3, labels=(('type', 'service_check_result'),))
+        metrics.gauge('events_cache', 12)
+        metrics.observe('statement', 0.002, (('kind', 'update'),))
+        metrics.observe('statement', 0.004, (('kind', 'update'),))
+        metrics.observe('statement', 10, (('kind', 'update'),))
+
+        stats = metrics.get_stats()
+        assert stats['broks.host_check_result'] == 2
+        assert stats['broks.service_check_result'] == 3
+        assert stats['events_cache'] == 12
+        assert stats['statement.update']['count'] == 3
+
+        text = metrics.prometheus()
+        assert '# TYPE glpi_broks counter' in text
+        assert 'glpi_broks{type="host_check_result"} 2' in text
+        assert 'glpi_events_cache 12' in text
+        assert '# TYPE glpi_statement_seconds histogram' in text
+        assert 'glpi_statement_seconds_bucket{kind="update",le="0.001"} 0' in text
+        assert 'glpi_statement_seconds_bucket{kind="update",le="0.005"} 2' in text
+        assert 'glpi_statement_seconds_bucket{kind="update",le="+Inf"} 3' in text
+        assert 'glpi_statement_seconds_count{kind="update"} 3' in text
+
+    def test_metrics_summaries(self):
+        """Summaries percentiles are computed on the most recent values
+
+        :return:
+        """
+        metrics = MetricsRegistry()
+        for value in range(1, 101):
+            metrics.summarize('freshness', value, (('table', 'events'), ('realm', 'All')))
+
+        stats = metrics.get_stats()
+        assert stats['freshness.events.All']['count'] == 100
+        assert stats['freshness.events.All']['p50'] == 51
+        assert stats['freshness.events.All']['p95'] == 96
+        assert stats['freshness.events.All']['p99'] == 100
+
+        text = metrics.prometheus()
+        assert '# TYPE glpi_freshness_seconds summary' in text
+        assert 'glpi_freshness_seconds{table="events",realm="All",quantile="0.95"} 96' in text
+        assert 'glpi_freshness_seconds_count{table="events",realm="All"} 100' in text
+
+        # Only the most recent values are kept
+        summary = metrics.summaries[('freshness', (('table', 'events'), ('realm', 'All')))]
+        for _ in range(1000):
+            summary.observe(1)
+        assert summary.percentile(0.99) == 1
+        assert summary.count == 1100
+
+    def test_metrics_threads(self):
+        """Metrics updated by several threads while they are exported
+
+        :return:
+        """
+        metrics = MetricsRegistry()
+
+        def update(thread):
+            """Update new metrics, as the background jobs do"""
+            for idx in range(2000):
+                metrics.counter('rows', labels=(('table', 't%d' % (idx % 50)),))
+                metrics.gauge('queue_%d' % thread, idx, (('table', 't%d' % idx),))
+                metrics.summarize('freshness', idx, (('table', 't%d' % (idx % 50)),
+                                                     ('realm', 'All')))
+
+        threads = [threading.Thread(target=update, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        while any([thread.is_alive() for thread in threads]):
+            # Would raise "dictionary changed size during iteration" without the lock
+            metrics.get_stats()
+            metrics.prometheus()
+            metrics.counters_of('rows')
+            metrics.percentiles_of('freshness', 0.95)
+        for thread in threads:
+            thread.join()
+
+        assert sum([value for _, value in metrics.counters_of('rows')]) == 8000
+        assert len(metrics.percentiles_of('freshness', 0.95)) == 50
+        assert len(metrics.gauges) == 8000
+
+    def test_module_export(self):
+        """The module metrics export updates the queues and caches gauges
+
+        :return:
+        """
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'glpi.prom')
+            instance = alignak_module_glpi.get_instance(Module({
+                'module_alias': 'glpi',
+                'module_types': 'DB',
+                'python_name': 'alignak_module_glpi',
+                'fake_db': '1',
+                'metrics_textfile': path
+            }))
+            instance.init()
+            instance.events_cache.append({'date': '2018-10-01 00:00:00'})
+            instance.export_metrics()
+            with open(path) as textfile:
+                text = textfile.read()
+            assert 'glpi_events_cache 1' in text
+            assert 'glpi_records_cache 0' in text
+        finally:
+            shutil.rmtree(folder)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the tables schema migration
+"""
+
+import datetime
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import sqlite, schema
+from alignak_module_glpi.migrate import plan, plan_table, plan_partitions, apply_steps, script, \
+    UNIQUE_KEYS
+from alignak_module_glpi.partitions import PartitionManager
+
+
+class PartitionsCursor(object):
+    """A MySQL cursor that only knows about the partitions of a table"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    def execute(self, query, params=None):
+        """Execute the partitions query"""
+        assert 'information_schema' in query
+
+    def fetchall(self):
+        """Get the partitions rows"""
+        return self.partitions
+
+
+class TestMigrate(AlignakTest):
+    """
+    This class contains the tests for the tables schema migration
+    """
+
+    def test_plan_table(self):
+        """The engine is switched before adding the unique key, if no item is duplicated
+
+        :return:
+        """
+        db = sqlite.connect(':memory:', {'services': sqlite.CREATE_SERVICES_TABLE})
+        cursor = db.cursor()
+        table = schema.introspect(cursor, 'glpi', ['services'])['services']
+        assert table.engine == 'SQLite'
+        table.engine = 'MyISAM'
+
+        steps, notes = plan_table(cursor, table, UNIQUE_KEYS['services_table'])
+        assert [step.statement for step in steps] == [
+            "ALTER TABLE `services` ENGINE=InnoDB",
+            "ALTER TABLE `services` ADD UNIQUE KEY `item` (`host_name`,`service_description`)"]
+        assert notes == []
+
+        # No unique key
+        steps, notes = plan_table(cursor, table, None)
+        assert [step.statement for step in steps] == ["ALTER TABLE `services` ENGINE=InnoDB"]
+
+        # Missing unique key columns
+        steps, notes = plan_table(cursor, table, UNIQUE_KEYS['serviceevents_table'])
+        assert notes == ["no unique key, missing columns: date, state_id, state_type_id"]
+
+        # Duplicated items
+        for _ in range(2):
+            cursor.execute(u"INSERT INTO `services` (`host_name`, `service_description`) "
+                           u"VALUES (%s, %s)", ('srv', 'cpu'))
+        table.engine = 'InnoDB'
+        steps, notes = plan_table(cursor, table, UNIQUE_KEYS['services_table'])
+        assert steps == []
+        assert notes == ["no unique key, 1 duplicated items must be removed first"]
+        db.close()
+
+    def test_plan_partitions(self):
+        """The services events table is partitioned by the migration, after the engine switch
+
+        :return:
+        """
+        manager = PartitionManager(None, 'glpi', 'events', 'weekly', ahead=1)
+        table = schema.Table('events')
+        table.engine = 'MyISAM'
+        steps, notes = plan_partitions(PartitionsCursor([(None, None)]), manager, table,
+                                       datetime.date(2018, 3, 14))
+        assert notes == []
+        assert [step.statement.split(' (')[0] for step in steps] == [
+            "ALTER TABLE `events` MODIFY `date` datetime NOT NULL DEFAULT '1970-01-01 00:00:00'",
+            "ALTER TABLE `events` DROP PRIMARY KEY, ADD PRIMARY KEY",
+            "ALTER TABLE `events` PARTITION BY RANGE"]
+        assert 'PARTITION `p20180319`' in steps[2].statement
+
+        steps, notes = plan_partitions(PartitionsCursor([('pfuture', 'MAXVALUE')]), manager,
+                                       table)
+        assert (steps, notes) == ([], ["table is partitioned"])
+        table.engine = 'MEMORY'
+        steps, notes = plan_partitions(PartitionsCursor([(None, None)]), manager, table)
+        assert (steps, notes) == ([], ["MEMORY engine can not be partitioned"])
+
+    def test_migrate(self):
+        """The unique keys are added and used by the upserts
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.open()
+
+        steps, notes = plan(instance)
+        assert [step.statement for step in steps] == [
+            "ALTER TABLE `glpi_plugin_monitoring_hosts` ADD UNIQUE KEY `item` (`host_name`)",
+            "ALTER TABLE `glpi_plugin_monitoring_services` ADD UNIQUE KEY `item` "
+            "(`host_name`,`service_description`)",
+            "ALTER TABLE `glpi_plugin_monitoring_serviceevents` ADD UNIQUE KEY `event` "
+            "(`host_name`,`service_description`,`date`,`state_id`,`state_type_id`)",
+            "ALTER TABLE `glpi_plugin_monitoring_records` ADD UNIQUE KEY `item_check` "
+            "(`host_name`,`service_description`,`last_check`)"]
+        assert notes['glpi_plugin_monitoring_hosts'] == ["SQLite engine is not migrated"]
+        assert "ADD UNIQUE KEY `item` (`host_name`);" in script(steps, notes)
+
+        assert apply_steps(instance, steps)
+        assert all([step.applied for step in steps])
+        steps, notes = plan(instance)
+        assert steps == []
+        assert "unique key on (host_name) exists" in notes['glpi_plugin_monitoring_hosts']
+
+        # The hosts state rows can be upserted
+        upsert = u"INSERT INTO `glpi_plugin_monitoring_hosts` (`host_name`, `state`) " \
+                 u"VALUES (%s, %s) ON DUPLICATE KEY UPDATE `state`=VALUES(`state`)"
+        cursor = instance.db.cursor()
+        cursor.execute(upsert, ('srv', 'UP'))
+        cursor.execute(upsert, ('srv', 'DOWN'))
+        cursor.execute(u"SELECT `host_name`, `state` FROM `glpi_plugin_monitoring_hosts`")
+        assert cursor.fetchall() == [('srv', 'DOWN')]
+        instance.close()
@@ -850,3 +850,272 @@ class TestModules(AlignakTest):
         b.prepare()
         instance.manage_brok(b)
         self.show_logs()
+
+    def test_module_records(self):
+        """Test the records queue: only the configured services are queued for a bulk insert
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'update_records': '1',
+            'records_services': 'payment_record, web_*'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        assert instance.records_names == set(['payment_record'])
+        assert instance.is_recorded_service('payment_record')
+        assert instance.is_recorded_service('web_front')
+        assert not instance.is_recorded_service('disks')
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"}
+        }
+        b = Brok({'data': hcr, 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+
+        for service in ['payment_record', 'web_front', 'disks']:
+            scr = {
+                "host_name": "srv001",
+                "service_description": service,
+                "customs": {"_ITEMTYPE": "Service", "_ITEMSID": "1"},
+                "last_chk": 1444427104,
+                "output": "OK - all is ok!",
+                "long_output": "",
+                "perf_data": "payment=12",
+            }
+            # Initial status builds the cache and records the first value
+            for brok_type in ['initial_service_status', 'service_check_result']:
+                b = Brok({'data': dict(scr), 'type': brok_type}, False)
+                b.prepare()
+                instance.manage_brok(b)
+
+        # Records are queued, not inserted immediately
+        assert len(instance.records_cache) == 4
+        assert [r['service_description'] for r in instance.records_cache] == \
+            ['payment_record', 'payment_record', 'web_front', 'web_front']
+
+        # Bulk insertion empties the queue
+        instance.bulk_insert_records()
+        assert len(instance.records_cache) == 0
+
+    def test_module_events_state_changes(self):
+        """Test the services events recorded on state changes only
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'update_services_events': '1',
+            'events_state_changes': '1',
+            'events_heartbeat': '3600'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "last_chk": 1444427104,
+            "state_id": 0,
+            "state_type_id": 1,
+            "output": "OK - host is up and running",
+            "long_output": "",
+            "perf_data": "",
+        }
+        b = Brok({'data': dict(hcr), 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+        assert len(instance.events_cache) == 0
+
+        for last_chk, state_id, state_type_id in [
+                # Same state as the initial state
+                (1444427164, 0, 1),
+                # State changes
+                (1444427224, 1, 0),
+                (1444427284, 1, 0),
+                # State type changes
+                (1444427344, 1, 1),
+                (1444427404, 1, 1),
+                # Heartbeat
+                (1444430944, 1, 1),
+                (1444431004, 1, 1)]:
+            hcr.update({'last_chk': last_chk, 'state_id': state_id,
+                        'state_type_id': state_type_id})
+            b = Brok({'data': dict(hcr), 'type': 'host_check_result'}, False)
+            b.prepare()
+            instance.manage_brok(b)
+
+        assert len(instance.events_cache) == 3
+        assert instance.events_written == 3
+        assert instance.events_suppressed == 4
+
+    def test_module_freshness(self):
+        """Test the freshness lag tracking per table and per realm
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'freshness_sla': '60'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        b = Brok({'data': {
+            "host_name": "srv001",
+            "realm_name": "Paris",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+        }, 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+
+        now = time.time()
+        instance.observe_freshness('hosts', 'srv001', now - 10, now)
+        instance.observe_freshness('hosts', 'unknown', now - 10, now)
+        assert instance.check_freshness() == []
+
+        late = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - 120))
+        instance.observe_batch_freshness('events', [('srv001', late), ('srv001', late)])
+        stats = instance.collect_metrics()
+        assert stats['freshness.hosts.Paris']['count'] == 1
+        assert stats['freshness.hosts.All']['count'] == 1
+        assert stats['freshness.events.Paris']['count'] == 2
+
+        late = instance.check_freshness()
+        assert len(late) == 1
+        assert late[0][0:2] == ('events', 'Paris')
+        assert late[0][2] >= 120
+
+    def test_module_unavailability(self):
+        """Test the services events unavailability flag
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        def send(instance, results):
+            """Send the initial host status and the (state_id, state_type_id) check results"""
+            hcr = {
+                "host_name": "srv001",
+                "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+                "last_chk": 1444427104,
+                "state": "UP", "state_id": 0,
+                "state_type": "HARD", "state_type_id": 1,
+                "output": "OK - host is up and running",
+                "long_output": "",
+                "perf_data": "",
+            }
+            b = Brok({'data': dict(hcr), 'type': 'initial_host_status'}, False)
+            b.prepare()
+            instance.manage_brok(b)
+            for idx, (state_id, state_type_id) in enumerate(results):
+                hcr.update({'last_chk': 1444427164 + idx * 60, 'state_id': state_id,
+                            'state': 'UP' if state_id == 0 else 'DOWN',
+                            'state_type_id': state_type_id,
+                            'state_type': 'HARD' if state_type_id == 1 else 'SOFT'})
+                b = Brok({'data': dict(hcr), 'type': 'host_check_result'}, False)
+                b.prepare()
+                instance.manage_brok(b)
+
+        configuration = {
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'update_availability': '1'
+        }
+        instance = alignak_module_glpi.get_instance(Module(dict(configuration)))
+        instance.init()
+        assert instance.update_availability
+
+        # A HARD non-OK state sets the flag, the SOFT states keep it and a HARD OK clears it
+        send(instance, [(0, 0), (1, 1), (0, 0), (1, 0), (0, 1), (1, 0)])
+        assert [event['unavailability'] for event in instance.events_cache] == \
+            [0, 1, 1, 1, 0, 0]
+        instance.close()
+
+        # The table has no unavailability column
+        instance = alignak_module_glpi.get_instance(Module(dict(configuration)))
+        assert instance.open()
+        tables = instance.load_schema()
+        del tables[instance.serviceevents_table].columns['unavailability']
+        instance.check_database()
+        assert not instance.update_availability
+        send(instance, [(1, 1)])
+        assert len(instance.events_cache) == 1
+        assert 'unavailability' not in instance.events_cache[0]
+        instance.bulk_insert()
+        assert not instance.events_cache
+        instance.close()
+
+    def test_module_stale_results(self):
+        """Test the out of order check results suppression
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'update_services_events': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "last_chk": 1444427104,
+            "state_id": 0,
+            "state_type_id": 1,
+            "output": "OK - host is up and running",
+            "long_output": "",
+            "perf_data": "",
+        }
+        b = Brok({'data': dict(hcr), 'type': 'initial_host_status'}, False)
+        b.prepare()
+        instance.manage_brok(b)
+
+        # The same check time is recorded, the older check results are dropped
+        for last_chk in [1444427224, 1444427164, 1444427224, 1444427104, 1444427284]:
+            hcr['last_chk'] = last_chk
+            hcr['state_id'] = last_chk % 2
+            b = Brok({'data': dict(hcr), 'type': 'host_check_result'}, False)
+            b.prepare()
+            instance.manage_brok(b)
+
+        assert [event['date'] for event in instance.events_cache] == [
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_chk))
+            for last_chk in [1444427224, 1444427284]]
+        assert instance.metrics.counters[('stale_results', (('type', 'host_check_result'),))] \
+            == 2
+        assert instance.metrics.counters[('events_duplicates', ())] == 1
+        assert instance.hosts_cache['srv001']['last_chk'] == 1444427284
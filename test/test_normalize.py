@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the rows normalization
+"""
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi.normalize import RowNormalizer
+
+
+class TestNormalize(AlignakTest):
+    """
+    This class contains the tests for the rows normalization
+    """
+
+    def test_normalizer(self):
+        """The strings are truncated to the columns lengths and cleaned
+
+        :return:
+        """
+        normalizer = RowNormalizer({'name': (5, 15), 'output': (100, 10)}, 'utf-8', mb3=True)
+        row = normalizer.normalize({'name': u'abcdefgh', 'output': u'ééééééé', 'state': 1})
+        # Truncated in characters, and in bytes without a cut character
+        assert row == {'name': u'abcde', 'output': u'ééééé', 'state': 1}
+        assert normalizer.truncated == 2
+
+        # 4 bytes characters are dropped for the utf8 (3 bytes) character set
+        assert normalizer.normalize({'name': u'ok \U0001F600'}) == {'name': u'ok '}
+        assert normalizer.cleaned == 1
+        normalizer.mb3 = False
+        assert normalizer.normalize({'name': u'ok \U0001F600'}) == {'name': u'ok \U0001F600'}
+
+        # The short values are not encoded again for an UTF-8 character set
+        normalizer = RowNormalizer({'name': (5, 20), 'output': (None, 8)}, 'utf8')
+        row = {'name': u'ab\U0001F600', 'output': u'\U0001F600\U0001F600\U0001F600'}
+        assert normalizer.normalize(dict(row)) == {'name': u'ab\U0001F600',
+                                                   'output': u'\U0001F600\U0001F600'}
+        assert normalizer.truncated == 1
+        normalizer.clean = None
+        assert normalizer.normalize({'name': u'abcde'}) == {'name': u'abcde'}
+
+        # Not encodable characters are dropped, not ASCII values are not changed
+        normalizer = RowNormalizer({'name': (10, 10)}, 'cp1252')
+        assert normalizer.normalize({'name': u'été 中'}) == {'name': u'été '}
+        assert normalizer.normalize({'name': u'été'}) == {'name': u'été'}
+        assert normalizer.normalize({'name': u'\udcff'}) == {'name': u''}
+        assert normalizer.cleaned == 2
+
+    def test_module_normalize(self):
+        """The module normalizes the rows with the tables columns lengths
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_hosts': '0',
+            'update_services_events': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.normalizers[instance.serviceevents_table].lengths['output'] == \
+            (65535, 65535)
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "last_chk": 1444427104,
+            "state_id": 0,
+            "state_type_id": 1,
+            "output": u"OK \U0001F600 - host is up and running",
+            "long_output": "x" * 70000,
+            "perf_data": "",
+        }
+        for brok_type in ['initial_host_status', 'host_check_result']:
+            hcr['last_chk'] += 60
+            b = Brok({'data': dict(hcr), 'type': brok_type}, False)
+            b.prepare()
+            instance.manage_brok(b)
+
+        output = instance.events_cache[0]['output']
+        assert output.startswith(u"OK  - host is up and running\nxxx")
+        assert len(output) == 65535
+        stats = instance.collect_metrics()
+        assert stats['truncated_values.%s' % instance.serviceevents_table] == 1
+        assert stats['cleaned_values.%s' % instance.serviceevents_table] == 1
+
+        instance.bulk_insert()
+        assert not instance.events_cache
+        instance.db_cursor.execute("SELECT `output` FROM `glpi_plugin_monitoring_serviceevents`")
+        assert instance.db_cursor.fetchone()[0] == output
+        instance.close()
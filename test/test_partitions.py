@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the services events partitions management
+"""
+
+import datetime
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.partitions import PartitionManager, plan, convert, read_partitions, \
+    NotPartitionedError, TO_DAYS_OFFSET
+
+
+def to_days(year, month, day):
+    """MySQL TO_DAYS of a date"""
+    return datetime.date(year, month, day).toordinal() + TO_DAYS_OFFSET
+
+
+class PartitionsConnection(object):
+    """A MySQL connection that only knows about the partitions of a table"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.statements = []
+        self.closed = False
+
+    def cursor(self):
+        """Get a cursor"""
+        return PartitionsCursor(self)
+
+    def close(self):
+        """Close the connection"""
+        self.closed = True
+
+
+class PartitionsCursor(object):
+    """A MySQL cursor that only knows about the partitions of a table"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query, params=None):
+        """Execute a statement"""
+        if 'information_schema' in query:
+            self.rows = self.connection.partitions
+            return
+        self.connection.statements.append(query)
+
+    def fetchall(self):
+        """Get the rows"""
+        return self.rows
+
+    def close(self):
+        """Close the cursor"""
+
+
+class TestPartitions(AlignakTest):
+    """
+    This class contains the tests for the services events partitions management
+    """
+
+    def test_plan(self):
+        """The table is partitioned, the upcoming partitions are created ahead of time and
+        the expired partitions are dropped
+
+        :return:
+        """
+        # Not partitioned: converted by the migration, not by the partition manager
+        assert read_partitions([(None, None)]) == []
+        assert plan('events', [], datetime.date(2018, 3, 14), 'daily', ahead=2) == []
+        statements = convert('events', datetime.date(2018, 3, 14), 'daily', ahead=2)
+        assert statements == [
+            "ALTER TABLE `events` MODIFY `date` datetime NOT NULL "
+            "DEFAULT '1970-01-01 00:00:00'",
+            "ALTER TABLE `events` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `date`)",
+            "ALTER TABLE `events` PARTITION BY RANGE (TO_DAYS(`date`)) ("
+            "PARTITION `p20180314` VALUES LESS THAN (%d), "
+            "PARTITION `p20180315` VALUES LESS THAN (%d), "
+            "PARTITION `p20180316` VALUES LESS THAN (%d), "
+            "PARTITION `p20180317` VALUES LESS THAN (%d), "
+            "PARTITION `pfuture` VALUES LESS THAN MAXVALUE)" % (
+                to_days(2018, 3, 14), to_days(2018, 3, 15), to_days(2018, 3, 16),
+                to_days(2018, 3, 17))]
+
+        # Weekly partitions, on mondays
+        partitions = read_partitions([('p20180312', to_days(2018, 3, 12)),
+                                      ('p20180319', to_days(2018, 3, 19)),
+                                      ('pfuture', 'MAXVALUE')])
+        assert partitions == [('p20180312', datetime.date(2018, 3, 12)),
+                              ('p20180319', datetime.date(2018, 3, 19)),
+                              ('pfuture', None)]
+        assert plan('events', partitions, datetime.date(2018, 3, 14), 'weekly', ahead=0) == []
+        assert plan('events', partitions, datetime.date(2018, 3, 14), 'weekly', ahead=1) == [
+            "ALTER TABLE `events` REORGANIZE PARTITION `pfuture` INTO ("
+            "PARTITION `p20180326` VALUES LESS THAN (%d), "
+            "PARTITION `pfuture` VALUES LESS THAN MAXVALUE)" % to_days(2018, 3, 26)]
+
+        # Expired partitions are dropped, after a long stop no partitions are created for
+        # the past periods
+        assert plan('events', partitions, datetime.date(2018, 4, 25), 'weekly', ahead=0,
+                    retention=30) == [
+            "ALTER TABLE `events` REORGANIZE PARTITION `pfuture` INTO ("
+            "PARTITION `p20180430` VALUES LESS THAN (%d), "
+            "PARTITION `pfuture` VALUES LESS THAN MAXVALUE)" % to_days(2018, 4, 30),
+            "ALTER TABLE `events` DROP PARTITION `p20180312`, `p20180319`"]
+
+    def test_manager(self):
+        """The partition manager runs the statements on its own connection
+
+        :return:
+        """
+        connection = PartitionsConnection([('p20180315', to_days(2018, 3, 15)),
+                                           ('p20180316', to_days(2018, 3, 16)),
+                                           ('pfuture', 'MAXVALUE')])
+        changes = []
+        manager = PartitionManager(lambda: connection, 'glpi', 'events', 'daily', ahead=1,
+                                   interval=60, on_change=changes.append)
+        assert manager.run_once(datetime.date(2018, 3, 14)) == []
+        statements = manager.run_once(datetime.date(2018, 3, 15))
+        assert connection.statements == statements
+        assert 'PARTITION `p20180317`' in statements[0]
+        assert manager.runs == 2
+
+        # Background thread
+        manager.start()
+        manager.stop()
+        assert changes
+        assert connection.closed
+
+        with self.assertRaises(ValueError):
+            PartitionManager(lambda: connection, 'glpi', 'events', 'monthly')
+
+        # A not partitioned table is not converted
+        connection = PartitionsConnection([(None, None)])
+        errors = []
+        manager = PartitionManager(lambda: connection, 'glpi', 'events', 'daily',
+                                   on_error=errors.append)
+        with self.assertRaises(NotPartitionedError):
+            manager.run_once(datetime.date(2018, 3, 14))
+        assert connection.statements == []
+        manager.start()
+        manager.stop()
+        assert isinstance(errors[0], NotPartitionedError)
+
+    def test_module_partitions(self):
+        """The partition manager is not available with the SQLite database
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'events_partitioning': 'weekly',
+            'events_partitions_ahead': '4',
+            'events_retention': '90'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.events_retention == 90
+        assert instance.partitions.period == 'weekly'
+        assert instance.partitions.ahead == 4
+        assert instance.partitions.retention == 90
+        instance.init()
+        instance.start_partitions()
+        assert instance.partitions is None
+
+        instance.on_partitions_change(["ALTER TABLE `events` DROP PARTITION `p20180312`"])
+        instance.on_partitions_error(Exception('failed'))
+        stats = instance.collect_metrics()
+        assert stats['partitions_changes'] == 1
+        assert stats['partitions_errors'] == 1
+        instance.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the main loop profiling
+"""
+
+import os
+import time
+import signal
+import shutil
+import tempfile
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.profiling import SamplingProfiler, CProfileProfiler
+
+
+def busy_function(duration):
+    """Keep the CPU busy"""
+    end = time.time() + duration
+    count = 0
+    while time.time() < end:
+        count += 1
+    return count
+
+
+class TestProfiling(AlignakTest):
+    """
+    This class contains the tests for the main loop profiling
+    """
+
+    def setUp(self):
+        super(TestProfiling, self).setUp()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestProfiling, self).tearDown()
+        shutil.rmtree(self.folder)
+
+    def test_sampling_profiler(self):
+        """The sampling profiler samples the main thread stack
+
+        :return:
+        """
+        profiler = SamplingProfiler(duration=0.3, interval=0.005)
+        profiler.start()
+        busy_function(0.4)
+        assert profiler.finished()
+        profiler.stop()
+        assert profiler.samples > 10
+
+        path = os.path.join(self.folder, 'profile.collapsed')
+        profiler.dump(path)
+        with open(path) as dump:
+            lines = dump.readlines()
+        assert lines
+        assert 'test_profiling.py:busy_function' in lines[0]
+        assert int(lines[0].rsplit(' ', 1)[1]) > 0
+        assert 'busy_function' in profiler.summary(3)[0]
+
+    def test_cprofile_profiler(self):
+        """The cProfile profiler profiles the main loop turns
+
+        :return:
+        """
+        profiler = CProfileProfiler(turns=2)
+        assert profiler.summary() == []
+        profiler.start()
+        busy_function(0.01)
+        profiler.turn()
+        assert not profiler.finished()
+        profiler.turn()
+        assert profiler.finished()
+        profiler.stop()
+
+        path = os.path.join(self.folder, 'profile.pstats')
+        profiler.dump(path)
+        assert os.path.exists(path)
+        assert [line for line in profiler.summary(5) if 'busy_function' in line]
+
+    def test_module_profiling(self):
+        """SIGUSR2 requests the module profiling
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'fake_db': '1',
+            'profile_mode': 'cprofile',
+            'profile_directory': self.folder
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        instance.manage_signal(signal.SIGUSR2, None)
+        assert instance.profiling_requested
+        assert not instance.interrupted
+
+        instance.start_profiling()
+        busy_function(0.01)
+        path = instance.stop_profiling()
+        assert path.startswith(self.folder)
+        assert path.endswith('.pstats')
+        assert os.path.exists(path)
+        assert instance.profiler is None
+
+        instance.manage_signal(signal.SIGTERM, None)
+        assert instance.interrupted
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the chunked retention purge of the services events and records tables
+"""
+
+import os
+import shutil
+import datetime
+import tempfile
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import sqlite
+from alignak_module_glpi.retention import RetentionPurge, MAX_BACKOFF
+
+INSERT_RECORD = u"INSERT INTO `records` (`host_name`, `service_description`, `last_check`) " \
+                u"VALUES (%s, %s, %s)"
+
+
+class TestRetention(AlignakTest):
+    """
+    This class contains the tests for the retention purge
+    """
+
+    def setUp(self):
+        super(TestRetention, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        self.database = os.path.join(self.folder, 'glpi.db')
+
+    def tearDown(self):
+        super(TestRetention, self).tearDown()
+        shutil.rmtree(self.folder)
+
+    def connect(self):
+        """Connect to the test database"""
+        return sqlite.connect(self.database, {'records': sqlite.CREATE_RECORDS_TABLE})
+
+    def fill(self, old, recent):
+        """Insert old and recent records, the old records first"""
+        db = self.connect()
+        cursor = db.cursor()
+        cursor.executemany(INSERT_RECORD, [('host', 'service', '2018-01-01 00:00:00')] * old +
+                           [('host', 'service', '2018-03-14 12:00:00')] * recent)
+        db.commit()
+        db.close()
+
+    def count(self):
+        """Count the records"""
+        db = self.connect()
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM `records`")
+        count = cursor.fetchone()[0]
+        db.close()
+        return count
+
+    def test_purge(self):
+        """The expired rows are deleted chunk by chunk
+
+        :return:
+        """
+        self.fill(2500, 10)
+        purge = RetentionPurge(self.connect, [('records', 'last_check', 30)], chunk=1000,
+                               pause=0)
+        now = datetime.datetime(2018, 3, 15)
+        assert purge.run_once(now) == [('records', 2500)]
+        assert purge.chunks == 3
+        assert self.count() == 10
+
+        # Nothing more to purge
+        assert purge.run_once(now) == []
+        assert purge.runs == 2
+        purge.close()
+
+    def test_budget_and_backoff(self):
+        """The purge stops when its budget is exhausted and backs off when the insertion
+        latency is too high
+
+        :return:
+        """
+        self.fill(50, 0)
+        latency = [2.0]
+        purge = RetentionPurge(self.connect, [('records', 'last_check', 30)], chunk=10,
+                               pause=0.001, budget=0, latency=lambda: latency[0],
+                               latency_threshold=1.0)
+        now = datetime.datetime(2018, 3, 15)
+        # Only one chunk with no time budget
+        assert purge.run_once(now) == [('records', 10)]
+        assert purge.backoff == 2
+        assert self.count() == 40
+
+        for _ in range(10):
+            purge.throttle()
+        assert purge.backoff == MAX_BACKOFF
+        latency[0] = 0.1
+        assert purge.throttle() == 0.001 * MAX_BACKOFF / 2
+
+        purge.budget = 30
+        assert purge.run_once(now) == [('records', 40)]
+        assert self.count() == 0
+        purge.close()
+
+    def test_module_purge(self):
+        """The purge is started for the tables with a retention, not for the services events
+        if the table is partitioned
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'events_retention': '90',
+            'records_retention': '30',
+            'purge_pause': '0'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.records_retention == 30
+        instance.init()
+        # Not available with a memory database
+        instance.start_purge()
+        assert instance.purge is None
+
+        instance.sqlite_database = self.database
+        instance.partitions = object()
+        instance.start_purge()
+        assert instance.purge.tables == [(instance.records_table, 'last_check', 30)]
+        instance.purge.stop()
+
+        instance.partitions = None
+        instance.start_purge()
+        assert instance.purge.tables == [
+            (instance.serviceevents_table, 'date', 90),
+            (instance.records_table, 'last_check', 30)]
+        instance.do_stop()
+        assert instance.purge.thread is None
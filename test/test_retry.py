@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the failed batches retries
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import collections
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.retry import bisect_insert, is_transient, is_connection_lost, \
+    Backoff, DeadLetters, read_dead_letters, PartialInsertError
+from alignak_module_glpi.schema import Table
+
+
+class TransientError(Exception):
+    """A MySQL connector error"""
+
+    def __init__(self, msg, errno):
+        super(TransientError, self).__init__(msg)
+        self.errno = errno
+
+
+class MyISAMCursor(object):
+    """A cursor on a non transactional table: the rows are inserted one by one and the rows
+    inserted before an error are kept"""
+
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, query, values):
+        """Insert a row"""
+        if values[0] is None:
+            raise sqlite3.IntegrityError("NOT NULL constraint failed")
+        self.rows.append(values)
+
+    def executemany(self, query, values):
+        """Insert the rows"""
+        for row in values:
+            self.execute(query, row)
+
+    def close(self):
+        """Close the cursor"""
+
+
+class MyISAMConnection(object):
+    """A connection without transactions"""
+
+    def commit(self):
+        """Nothing to commit"""
+
+    def rollback(self):
+        """Nothing is rolled back"""
+
+    def close(self):
+        """Close the connection"""
+
+
+class TestRetry(AlignakTest):
+    """
+    This class contains the tests for the failed batches retries
+    """
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestRetry, self).tearDown()
+        shutil.rmtree(self.folder)
+
+    def test_bisect_insert(self):
+        """The poison rows are isolated, the batch is requeued on a transient error
+
+        :return:
+        """
+        inserted = []
+
+        def execute(batch):
+            """Insert a batch, fail if it contains a negative row"""
+            if [row for row in batch if row < 0]:
+                raise ValueError("bad row")
+            inserted.extend(batch)
+
+        result = bisect_insert(execute, [1, 2, -3, 4, 5, 6, -7, 8])
+        assert inserted == [1, 2, 4, 5, 6, 8]
+        assert result.inserted == 6
+        assert result.poison == [(-3, 'bad row'), (-7, 'bad row')]
+        assert result.requeue == []
+
+        # A transient error stops the bisection, the rows not inserted are requeued in order
+        del inserted[:]
+        calls = collections.Counter()
+
+        def execute_transient(batch):
+            """Fail with a transient error on the fourth call"""
+            calls['execute'] += 1
+            if calls['execute'] == 4:
+                raise TransientError("Deadlock found when trying to get lock", 1213)
+            execute(batch)
+
+        result = bisect_insert(execute_transient, [1, 2, -3, 4, 5, 6, -7, 8])
+        # The batch and [1, 2, -3, 4] fail, [1, 2] is inserted, then [-3, 4] fails with a
+        # transient error
+        assert inserted == [1, 2]
+        assert result.requeue == [-3, 4, 5, 6, -7, 8]
+        assert result.error.errno == 1213
+
+        assert is_transient(TransientError("Lost connection", 2013))
+        assert is_transient(sqlite3.OperationalError("database is locked"))
+        assert not is_transient(TransientError("Data too long for column", 1406))
+        assert not is_transient(sqlite3.IntegrityError("NOT NULL constraint failed"))
+        assert is_connection_lost(TransientError("MySQL server has gone away", 2006))
+        assert not is_connection_lost(TransientError("Deadlock found", 1213))
+        assert not is_connection_lost(sqlite3.OperationalError("database is locked"))
+
+    def test_bisect_partial_insert(self):
+        """The insertion resumes after the failed row of a non transactional batch
+
+        :return:
+        """
+        inserted = []
+
+        def execute(batch):
+            """Insert the rows one by one until a negative row"""
+            count = 0
+            for row in batch:
+                if row < 0:
+                    raise PartialInsertError(ValueError("bad row"), count)
+                inserted.append(row)
+                count += 1
+
+        result = bisect_insert(execute, [1, 2, -3, 4, 5, 6, -7, 8])
+        assert inserted == [1, 2, 4, 5, 6, 8]
+        assert result.inserted == 6
+        assert result.poison == [(-3, 'bad row'), (-7, 'bad row')]
+
+        # Transient error after some rows: only the rows not inserted are requeued
+        def execute_transient(batch):
+            """Fail with a transient error after two rows"""
+            inserted.extend(batch[:2])
+            raise PartialInsertError(TransientError("Lock wait timeout", 1205), 2)
+
+        del inserted[:]
+        result = bisect_insert(execute_transient, [1, 2, 3, 4])
+        assert inserted == [1, 2]
+        assert (result.inserted, result.requeue) == (2, [3, 4])
+
+        table = Table('events')
+        assert table.is_transactional()
+        table.engine = 'MyISAM'
+        assert not table.is_transactional()
+
+    def test_module_partial_insert(self):
+        """The rows of a failed batch are inserted once in a non transactional table
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        instance.close()
+        # The first rows of a failed statement are kept by a MyISAM table
+        instance.db = MyISAMConnection()
+        instance.db_cursor = instance.db_cursor_many = MyISAMCursor()
+        instance.is_connected = True
+        instance.non_transactional = set([instance.serviceevents_table])
+
+        instance.events_cache.extend([collections.OrderedDict([
+            ('host_name', 'srv%d' % idx if idx not in (2, 6) else None),
+            ('service_description', 'cpu'), ('date', '2018-03-14 12:%02d:00' % idx),
+            ('state_id', 0)]) for idx in range(8)])
+        instance.bulk_insert()
+        assert not instance.events_cache
+        assert [row[0] for row in instance.db_cursor_many.rows] == \
+            ['srv0', 'srv1', 'srv3', 'srv4', 'srv5', 'srv7']
+        assert instance.metrics.counters[('rows', (('table', 'events'),))] == 6
+        assert instance.metrics.counters[('errors', (('table', 'events'),))] == 2
+        instance.close()
+
+    def test_backoff(self):
+        """The retry delay is doubled after each failure
+
+        :return:
+        """
+        backoff = Backoff(1, 5)
+        assert backoff.ready(100)
+        assert [backoff.failed(100) for _ in range(5)] == [1, 2, 4, 5, 5]
+        assert not backoff.ready(104)
+        assert backoff.ready(105)
+        backoff.succeeded()
+        assert backoff.ready(100)
+        assert backoff.failed(100) == 1
+
+    def test_dead_letters(self):
+        """The poison rows are appended to the dead letters file
+
+        :return:
+        """
+        path = os.path.join(self.folder, 'dead_letters.jsonl')
+        dead_letters = DeadLetters(path)
+        dead_letters.write('events', [({'host_name': None}, 'NOT NULL')], 10.0)
+        dead_letters.write('records', [({'host_name': 'srv'}, 'too long')], 11.0)
+        assert dead_letters.count == 2
+        assert list(read_dead_letters(path)) == [
+            {'t': 10.0, 'table': 'events', 'error': 'NOT NULL', 'row': {'host_name': None}},
+            {'t': 11.0, 'table': 'records', 'error': 'too long', 'row': {'host_name': 'srv'}}]
+
+    def test_module_retries(self):
+        """The module inserts the valid rows of a failed batch and requeues the batches
+        that failed with a transient error
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        path = os.path.join(self.folder, 'dead_letters.jsonl')
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'dead_letters_file': path,
+            'retry_delay': '0'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        def event(host_name, minute):
+            """Get an event row"""
+            return collections.OrderedDict([
+                ('host_name', host_name), ('service_description', 'cpu'),
+                ('date', '2018-03-14 12:%02d:00' % minute), ('output', 'output'),
+                ('perf_data', ''), ('state_id', 0), ('state_type_id', 1),
+                ('last_state_id', 0), ('last_hard_state_id', 0)])
+
+        instance.events_cache.extend([event('srv%d' % idx if idx != 5 else None, idx)
+                                      for idx in range(10)])
+        instance.bulk_insert()
+        assert not instance.events_cache
+        assert instance.metrics.counters[('rows', (('table', 'events'),))] == 9
+        assert instance.metrics.counters[('dead_letters', (('table', 'events'),))] == 1
+        assert [row['row']['date'] for row in read_dead_letters(path)] == \
+            ['2018-03-14 12:05:00']
+
+        # Transient error: the batch is requeued
+        insert_batch = instance.insert_batch
+        errors = [sqlite3.OperationalError("database is locked")]
+
+        def locked_insert_batch(query, rows, transactional=True):
+            """Fail once with a locked database"""
+            if errors:
+                raise errors.pop()
+            insert_batch(query, rows, transactional)
+
+        instance.insert_batch = locked_insert_batch
+        instance.events_cache.extend([event('srv%d' % idx, idx) for idx in range(10, 13)])
+        instance.bulk_insert()
+        assert len(instance.events_cache) == 3
+        assert instance.metrics.counters[('retries', (('table', 'events'),))] == 3
+        assert instance.retry_backoff['events'].failures == 1
+        instance.bulk_insert()
+        assert not instance.events_cache
+        assert instance.metrics.counters[('rows', (('table', 'events'),))] == 12
+        instance.db_cursor.execute("SELECT COUNT(*) FROM `glpi_plugin_monitoring_serviceevents`")
+        assert instance.db_cursor.fetchone()[0] == 12
+        instance.close()
+
+    def test_module_lost_connection(self):
+        """The connection is opened again after a lost connection, and the queues are bounded
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_services_events': '1',
+            'retry_delay': '0',
+            'max_queue_length': '5'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+
+        opened = collections.Counter()
+        open_database = instance.open
+
+        def counted_open(force=False):
+            """Count the connections"""
+            opened['open'] += 1
+            return open_database(force)
+
+        insert_batch = instance.insert_batch
+        errors = [TransientError("MySQL server has gone away", 2006)]
+
+        def lost_insert_batch(query, rows, transactional=True):
+            """Fail once with a lost connection"""
+            if errors:
+                raise errors.pop()
+            insert_batch(query, rows, transactional)
+
+        instance.open = counted_open
+        instance.insert_batch = lost_insert_batch
+        instance.events_cache.extend([collections.OrderedDict([
+            ('host_name', 'srv%d' % idx), ('service_description', 'cpu'),
+            ('date', '2018-03-14 12:%02d:00' % idx), ('output', 'output'), ('perf_data', ''),
+            ('state_id', 0), ('state_type_id', 1), ('last_state_id', 0),
+            ('last_hard_state_id', 0)]) for idx in range(8)])
+        instance.bulk_insert()
+        # The oldest rows are dropped, the batch is requeued and the connection is closed
+        assert instance.metrics.counters[('dropped_rows', (('table', 'events'),))] == 3
+        assert [row['host_name'] for row in instance.events_cache] == \
+            ['srv3', 'srv4', 'srv5', 'srv6', 'srv7']
+        assert not instance.is_connected
+        assert opened['open'] == 0
+
+        instance.bulk_insert()
+        assert opened['open'] == 1
+        assert instance.is_connected
+        assert not instance.events_cache
+        instance.db_cursor.execute("SELECT COUNT(*) FROM `glpi_plugin_monitoring_serviceevents`")
+        assert instance.db_cursor.fetchone()[0] == 5
+        instance.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the daily availability rollups
+"""
+
+import time
+import datetime
+
+from .alignak_test import AlignakTest
+
+from alignak_module_glpi.rollups import AvailabilityRollups
+
+
+class TestRollups(AlignakTest):
+    """
+    This class contains the tests for the daily availability rollups
+    """
+
+    def test_rollups(self):
+        """Time is accounted to the HARD states, per item and per day
+
+        :return:
+        """
+        rollups = AvailabilityRollups()
+        midnight = int(time.mktime(datetime.date(2018, 10, 1).timetuple()))
+        key = ('srv001', 'disks')
+
+        # OK at 23:00
+        rollups.update(key, midnight - 3600, 0, 1, False)
+        assert len(rollups) == 1
+        assert rollups.pop_rows() == []
+
+        # SOFT CRITICAL at 23:30, still accounted as OK
+        rollups.update(key, midnight - 1800, 2, 0, False)
+        # HARD CRITICAL at 23:40, acknowledged
+        rollups.update(key, midnight - 1200, 2, 1, True)
+        # HARD OK at 00:20 the day after
+        rollups.update(key, midnight + 1200, 0, 1, False)
+
+        rows = sorted(rollups.pop_rows())
+        assert rows == [
+            # day, ok, warning, critical, unknown, transitions, acknowledged
+            ('srv001', 'disks', '2018-09-30', 2400, 0, 1200, 0, 1, 1200),
+            ('srv001', 'disks', '2018-10-01', 0, 0, 1200, 0, 1, 1200),
+        ]
+        assert rollups.pop_rows() == []
+
+        # Rows that could not be flushed are merged back
+        rollups.update(key, midnight + 1800, 0, 1, False)
+        rows = rollups.pop_rows()
+        assert rows == [('srv001', 'disks', '2018-10-01', 600, 0, 0, 0, 0, 0)]
+        rollups.merge(rows)
+        rollups.close(midnight + 2400)
+        assert rollups.pop_rows() == [('srv001', 'disks', '2018-10-01', 1200, 0, 0, 0, 0, 0)]
+
+    def test_rollups_not_checked(self):
+        """An item not yet checked (last_chk=0) is accounted from its first check result
+
+        :return:
+        """
+        rollups = AvailabilityRollups()
+        midnight = int(time.mktime(datetime.date(2018, 10, 1).timetuple()))
+        key = ('srv001', 'disks')
+
+        # Initial status of a pending item
+        rollups.update(key, 0, 0, 1, False)
+        assert len(rollups) == 1
+        rollups.close(midnight + 600)
+        assert rollups.pop_rows() == []
+
+        # First check result, a HARD CRITICAL: the item state is known from now on
+        rollups.update(key, midnight + 600, 2, 1, False)
+        assert rollups.pop_rows() == []
+        rollups.update(key, midnight + 1200, 2, 1, False)
+        rollups.close(midnight + 1800)
+        assert rollups.pop_rows() == [('srv001', 'disks', '2018-10-01', 0, 0, 1200, 0, 0, 0)]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the database schema introspection
+"""
+
+import re
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi import sqlite
+from alignak_module_glpi.schema import introspect, missing_indexes, Table, \
+    HOSTS_INDEXES, SERVICES_INDEXES
+
+
+class TestSchema(AlignakTest):
+    """
+    This class contains the tests for the database schema introspection
+    """
+
+    def test_table(self):
+        """An index is usable when the columns are its leading columns
+
+        :return:
+        """
+        table = Table('services')
+        table.columns = {'id': 'int', 'host_name': 'varchar', 'service_description': 'varchar'}
+        table.indexes = {'PRIMARY': [('id', None)],
+                         'service': [('host_name', 50), ('service_description', 50)]}
+        assert table.find_index(['host_name']) == 'service'
+        assert table.find_index(['host_name', 'service_description']) == 'service'
+        assert table.find_index(['service_description']) is None
+        assert table.index_ddl('item', ['service_description', 'id']) == \
+            "ALTER TABLE `services` ADD INDEX `item` (`service_description`(50),`id`)"
+
+    def test_introspect(self):
+        """The columns and indexes of all the tables are fetched at once
+
+        :return:
+        """
+        db = sqlite.connect(':memory:', {'hosts': sqlite.CREATE_HOSTS_TABLE,
+                                         'services': sqlite.CREATE_SERVICES_TABLE})
+        cursor = db.cursor()
+        tables = introspect(cursor, 'glpi', ['hosts', 'services', 'unknown'])
+        assert 'information_schema' in cursor.statement
+        assert sorted(tables) == ['hosts', 'services']
+        assert tables['hosts'].column_names()[:4] == ['id', 'entities_id', 'itemtype', 'items_id']
+        assert tables['hosts'].columns['items_id'] == 'int'
+        assert tables['hosts'].indexes['itemtype'] == [('itemtype', None), ('items_id', None)]
+
+        # The Glpi monitoring plugin hosts table has no host_name index
+        assert missing_indexes(tables['hosts'], HOSTS_INDEXES) == [
+            ('host_name', ['host_name'],
+             "ALTER TABLE `hosts` ADD INDEX `host_name` (`host_name`(50))")]
+        assert missing_indexes(tables['services'], SERVICES_INDEXES) == []
+        db.close()
+
+    def test_module_check_database(self):
+        """The module checks the tables with one cached query and warns about missing indexes
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_hosts': '1',
+            'update_services': '1',
+            'update_services_events': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.update_hosts
+        assert instance.update_services
+        assert instance.update_services_events
+        self.assert_any_log_match(re.escape(
+            "table glpi_plugin_monitoring_hosts has no index on (host_name), the rows updates "
+            "are full table scans. Create the index with: ALTER TABLE "
+            "`glpi_plugin_monitoring_hosts` ADD INDEX `host_name` (`host_name`(50))"))
+
+        # Cached for the process lifetime
+        tables = instance.load_schema()
+        assert instance.load_schema() is tables
+
+        # A missing table only disables its own updates
+        instance.db_cursor.execute("DROP TABLE `glpi_plugin_monitoring_services`")
+        instance.load_schema(refresh=True)
+        instance.check_database()
+        assert instance.update_hosts
+        assert not instance.update_services
+        assert instance.update_services_events
+        instance.close()
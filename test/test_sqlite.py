@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the SQLite stand-in database
+"""
+
+import time
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+from alignak.brok import Brok
+
+import alignak_module_glpi
+from alignak_module_glpi import sqlite
+from alignak_module_glpi.rollups import CREATE_ROLLUPS_TABLE, UPSERT_ROLLUPS
+
+
+class TestSqlite(AlignakTest):
+    """
+    This class contains the tests for the SQLite stand-in database
+    """
+
+    def test_translate(self):
+        """MySQL statements are translated for SQLite
+
+        :return:
+        """
+        assert sqlite.translate_parameters(
+            u"UPDATE `t` SET `a`=%(a)s WHERE `b`=%(b)s") == u"UPDATE `t` SET `a`=:a WHERE `b`=:b"
+        assert sqlite.translate_parameters(
+            u"INSERT INTO `t` (`a`, `b`) VALUES (%s, %s)") == \
+            u"INSERT INTO `t` (`a`, `b`) VALUES (?, ?)"
+
+        table, statements, unique_keys = sqlite.translate_create_table(
+            CREATE_ROLLUPS_TABLE % 'rollups')
+        assert table == 'rollups'
+        assert statements[0].startswith(
+            "CREATE TABLE IF NOT EXISTS `rollups` (`id` INTEGER PRIMARY KEY AUTOINCREMENT, ")
+        assert 'COLLATE' not in statements[0]
+        assert 'ENGINE' not in statements[0]
+        assert statements[1] == "CREATE UNIQUE INDEX IF NOT EXISTS `rollups_item_day` " \
+                                "ON `rollups` (`host_name`, `service_description`, `day`)"
+        assert unique_keys == [['host_name', 'service_description', 'day']]
+
+    def test_connection(self):
+        """The connection and cursors behave as the mysql.connector ones
+
+        :return:
+        """
+        db = sqlite.connect(':memory:', {'hosts': sqlite.CREATE_HOSTS_TABLE})
+        cursor = db.cursor()
+        cursor.execute("SHOW COLUMNS FROM hosts")
+        columns = [column[0] for column in cursor.fetchall()]
+        assert 'host_name' in columns
+        assert 'is_acknowledged' in columns
+
+        with self.assertRaises(Exception):
+            cursor.execute("SHOW COLUMNS FROM unknown")
+
+        cursor.execute(u"INSERT INTO `hosts` (`host_name`, `state`) "
+                       u"VALUES (%(host_name)s, %(state)s)", {'host_name': 'srv', 'state': 'UP'})
+        assert cursor.rowcount == 1
+        cursor.execute(u"UPDATE `hosts` SET `state`=%(state)s WHERE `host_name`=%(host_name)s",
+                       {'host_name': 'srv', 'state': 'DOWN'})
+        assert 'UPDATE' in cursor.statement
+        assert cursor.rowcount == 1
+        cursor.execute(u"SELECT `state` FROM `hosts` WHERE `host_name`=%(host_name)s",
+                       {'host_name': 'srv'})
+        assert cursor.fetchall() == [('DOWN',)]
+
+        # Upsert: the counters are added to the existing row
+        cursor.execute(CREATE_ROLLUPS_TABLE % 'rollups')
+        many = db.cursor(prepared=True)
+        row = ('srv', 'hostcheck', '2017-01-01', 10, 0, 0, 0, 1, 0)
+        many.executemany(UPSERT_ROLLUPS % 'rollups', [row])
+        many.executemany(UPSERT_ROLLUPS % 'rollups', [row])
+        db.commit()
+        cursor.execute(u"SELECT `ok_seconds`, `transitions` FROM `rollups`")
+        assert cursor.fetchall() == [(20, 2)]
+        db.close()
+        assert not db.is_connected()
+
+    def test_module_sqlite(self):
+        """The module updates the SQLite stand-in database
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'update_hosts': '1',
+            'update_services_events': '1',
+            'update_rollups': '1'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.is_connected
+        assert instance.update_hosts
+        assert instance.update_services_events
+        assert instance.update_rollups
+
+        hcr = {
+            "host_name": "srv001",
+            "customs": {"_HOSTSID": "4", "_ITEMTYPE": "Computer", "_ITEMSID": "6"},
+            "last_chk": 1444427104,
+            "state": "UP",
+            "state_type": "HARD",
+            "state_id": 0,
+            "state_type_id": 1,
+            "output": "OK - host is up and running",
+            "long_output": "",
+            "perf_data": "",
+            "latency": 0.1,
+            "execution_time": 1.0,
+            "problem_has_been_acknowledged": False
+        }
+        for brok_type, last_chk in [('initial_host_status', 1444427104),
+                                    ('host_check_result', 1444427164),
+                                    ('host_check_result', 1444427224)]:
+            hcr['last_chk'] = last_chk
+            b = Brok({'data': dict(hcr), 'type': brok_type}, False)
+            b.prepare()
+            instance.manage_brok(b)
+        instance.bulk_insert()
+        instance.flush_rollups(1444427284)
+
+        cursor = instance.db.cursor()
+        cursor.execute("SELECT `host_name`, `last_check` FROM `%s`" % instance.hosts_table)
+        assert cursor.fetchall() == [
+            ('srv001', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(1444427224)))]
+        cursor.execute("SELECT count(*) FROM `%s`" % instance.serviceevents_table)
+        assert cursor.fetchall() == [(2,)]
+        cursor.execute("SELECT sum(`ok_seconds`) FROM `%s`" % instance.rollups_table)
+        assert cursor.fetchall() == [(180,)]
+
+        stats = instance.collect_metrics()
+        assert stats['rows.hosts'] == 2
+        assert stats['rows.events'] == 2
+        instance.do_stop()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2016: Alignak team, see AUTHORS.txt file for contributors
+#
+# This file is part of Alignak.
+#
+# Alignak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Alignak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Alignak.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the main loop stall watchdog
+"""
+
+import time
+
+from .alignak_test import AlignakTest
+from alignak.objects.module import Module
+
+import alignak_module_glpi
+from alignak_module_glpi.watchdog import Watchdog, thread_stacks
+
+
+class TestWatchdog(AlignakTest):
+    """
+    This class contains the tests for the main loop stall watchdog
+    """
+
+    def test_watchdog(self):
+        """A stalled heartbeat is reported once, until it is recorded again
+
+        :return:
+        """
+        recovered = []
+        watchdog = Watchdog(60, on_recovery=lambda name, elapsed: recovered.append(name))
+        watchdog.beat('main loop')
+        now = time.time()
+        assert watchdog.check(now + 10) == []
+        stalled = watchdog.check(now + 70)
+        assert [name for name, _ in stalled] == ['main loop']
+        assert stalled[0][1] >= 70
+        # Reported once
+        assert watchdog.check(now + 80) == []
+        assert watchdog.stalls == 1
+
+        watchdog.beat('main loop')
+        assert recovered == ['main loop']
+        assert watchdog.check(now + 10) == []
+
+        # An idle heartbeat is not checked
+        watchdog.beat('writer')
+        watchdog.idle('writer')
+        assert [name for name, _ in watchdog.check(time.time() + 120)] == ['main loop']
+        assert watchdog.stalls == 2
+
+    def test_watchdog_thread(self):
+        """The watchdog thread calls the stall handler
+
+        :return:
+        """
+        stalls = []
+        watchdog = Watchdog(0.2, on_stall=lambda name, elapsed: stalls.append(name),
+                            interval=0.05)
+        watchdog.beat('writer')
+        watchdog.start()
+        time.sleep(0.5)
+        watchdog.stop()
+        assert stalls == ['writer']
+
+        stacks = thread_stacks()
+        assert 'MainThread' in stacks
+        assert 'test_watchdog_thread' in stacks
+
+    def test_watchdog_beats(self):
+        """New heartbeats are recorded while the watchdog thread checks them
+
+        :return:
+        """
+        stalls = []
+        recoveries = []
+        watchdog = Watchdog(0.01, on_stall=lambda name, elapsed: stalls.append(name),
+                            on_recovery=lambda name, elapsed: recoveries.append(name),
+                            interval=0.001)
+        watchdog.start()
+        for idx in range(2000):
+            # Would raise "dictionary changed size during iteration" without the lock
+            watchdog.beat('job %d' % idx)
+            if idx % 100 == 0:
+                time.sleep(0.02)
+        assert watchdog.thread.is_alive()
+        watchdog.stop()
+        assert len(stalls) == watchdog.stalls
+        assert watchdog.stalls
+        for idx in range(2000):
+            watchdog.idle('job %d' % idx)
+        assert not watchdog.stalled
+        assert len(recoveries) == watchdog.stalls
+
+    def test_module_stall(self):
+        """The module dumps the stall information and counts the stalls
+
+        :return:
+        """
+        self.setup_with_file('./cfg/alignak.cfg')
+        self.assertTrue(self.conf_is_correct)
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'db_driver': 'sqlite',
+            'watchdog_threshold': '10'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        instance.init()
+        assert instance.watchdog.threshold == 10
+
+        instance.db_cursor_many.statement = 'INSERT INTO `events` VALUES (%s)'
+        instance.on_stall('writer', 12)
+        instance.on_stall('writer', 24)
+        assert instance.collect_metrics()['stalls.writer'] == 2
+        instance.close()
+
+        mod = Module({
+            'module_alias': 'glpi',
+            'module_types': 'DB',
+            'python_name': 'alignak_module_glpi',
+            'watchdog_threshold': '0'
+        })
+        instance = alignak_module_glpi.get_instance(mod)
+        assert instance.watchdog is None